@@ -5,12 +5,18 @@
 用于存储和管理带标签的游戏素材信息
 """
 
+import os
+import sys
 import sqlite3
 import json
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import connect
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('CreativeDatabase')
@@ -18,9 +24,11 @@ logger = logging.getLogger('CreativeDatabase')
 class CreativeDatabase:
     """素材数据库管理类"""
     
-    def __init__(self, db_file: str = 'creative_database.db'):
+    def __init__(self, db_file: str = 'creative'):
+        # db_file 可以是 db_config.json 中的数据库名，也可以是文件路径
+        # 使用独立连接（不入池）：row_factory 和 close() 只影响本实例，不影响同线程的其他使用方
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file)
+        self.conn = connect(db_file, 'write')
         self.conn.row_factory = sqlite3.Row  # 允许通过列名访问
         self._create_tables()
     
@@ -47,7 +47,7 @@ class CreativeWorkflow:
         logger.info("标签提取器初始化完成")
         
         # 3. 初始化数据库
-        db_file = self.config.get('database_file', 'creative_database.db')
+        db_file = self.config.get('database_file', 'creative')
         self.database = CreativeDatabase(db_file)
         logger.info("数据库初始化完成")
         
@@ -4,15 +4,20 @@
 将数据库中的游戏数据导出到Excel文件
 """
 
-import sqlite3
+import os
+import sys
 import pandas as pd
 import json
 from datetime import datetime
 
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
 def export_games_to_excel(output_file: str = '游戏竞品数据.xlsx'):
     """从数据库导出游戏数据到Excel"""
-    # 连接数据库
-    conn = sqlite3.connect('game_competitor.db')
+    # 连接数据库（线程内复用的只读连接，无需关闭）
+    conn = get_connection('game_competitor', 'read')
     
     try:
         # 查询游戏基本信息
@@ -84,13 +89,11 @@ def export_games_to_excel(output_file: str = '游戏竞品数据.xlsx'):
         
     except Exception as e:
         print(f"导出失败: {e}")
-    finally:
-        conn.close()
 
 def export_detailed_data(output_file: str = '游戏竞品详细数据.xlsx'):
     """导出包含详细信息的游戏数据"""
-    # 连接数据库
-    conn = sqlite3.connect('game_competitor.db')
+    # 连接数据库（线程内复用的只读连接，无需关闭）
+    conn = get_connection('game_competitor', 'read')
     
     try:
         # 查询游戏基本信息和详细信息的联合数据
@@ -149,8 +152,6 @@ def export_detailed_data(output_file: str = '游戏竞品详细数据.xlsx'):
         
     except Exception as e:
         print(f"导出失败: {e}")
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     # 安装必要的库
@@ -10,15 +10,20 @@
 4. 包含数据存储和分析功能
 """
 
+import os
+import sys
 import requests
 import json
 import time
 import logging
-import sqlite3
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from urllib.parse import urljoin, urlencode
 
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import connect
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('GameCrawler')
@@ -33,9 +38,11 @@ HEADERS = {
 class DatabaseManager:
     """数据库管理类，用于存储爬取的游戏信息"""
     
-    def __init__(self, db_file: str = 'game_competitor.db'):
+    def __init__(self, db_file: str = 'game_competitor'):
+        # db_file 可以是 db_config.json 中的数据库名，也可以是文件路径
+        # 使用独立连接（不入池）：close() 只关闭本实例的连接，不影响同线程的其他使用方
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file)
+        self.conn = connect(db_file, 'write')
         self._create_tables()
     
     def _create_tables(self):
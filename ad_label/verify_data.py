@@ -4,12 +4,17 @@
 验证爬虫数据是否正确存储到数据库
 """
 
-import sqlite3
+import os
+import sys
 import json
 
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
 def verify_database():
     """验证数据库中的数据"""
-    conn = sqlite3.connect('game_competitor.db')
+    conn = get_connection('game_competitor', 'read')
     cursor = conn.cursor()
     
     print("=== 验证游戏数据 ===")
@@ -44,8 +49,6 @@ def verify_database():
         columns = cursor.fetchall()
         for column in columns:
             print(f"  {column[1]} ({column[2]})")
-    
-    conn.close()
 
 if __name__ == "__main__":
     verify_database()
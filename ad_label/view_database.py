@@ -5,11 +5,17 @@
 用于查看game_competitor.db文件的内容
 """
 
+import os
+import sys
 import sqlite3
 
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection, resolve_db_path
+
 def view_database_structure(db_path):
     """查看数据库结构"""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path, 'read')
     cursor = conn.cursor()
     
     print("=== 数据库结构 ===")
@@ -52,12 +58,10 @@ def view_database_structure(db_path):
                 print(f"  {' | '.join(row_str)}")
         else:
             print("  表为空")
-    
-    conn.close()
 
 def main():
     """主函数"""
-    db_path = 'game_competitor.db'
+    db_path = resolve_db_path('game_competitor')
     
     try:
         view_database_structure(db_path)
@@ -1,48 +1,181 @@
-import requests
-import json
-import pandas as pd
-import numpy as np
-import datetime
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OG 测试期（og_gbt3_game_event）基础数据提取
+导入本模块没有副作用：不发请求、不加载 pandas/matplotlib，只有执行命令时才按需导入
+
+用法：
+    python OG_base.py extract --out og_base.pkl                    # 提取并保存（.pkl / .csv）
+    python OG_base.py extract --start 2026-01-01 --end 2026-01-14 --chart retention.png
+    python OG_base.py extract --raw --out og_base.csv              # 接口结果原样落盘，不经 pandas
+    python OG_base.py sync                                          # 按水位增量同步到本地（见 ta_sync.py）
+    # 在 notebook 中：from OG_base import get_data; df = get_data()
+"""
+
 import time
-import warnings 
-import matplotlib.pyplot as plt  
-# import dataframe_image as dfi
-import base64
-import hashlib
-from pandas.plotting import  table
-# from  apscheduler.schedulers.blocking  import  BlockingScheduler
-# from apscheduler.schedulers.background import BackgroundScheduler
-# from requests_toolbelt import MultipartEncoder
-warnings.filterwarnings('ignore')
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']
-plt.rc('font', family='Microsoft YaHei Mono', size=20)
-pd.set_option('display.unicode.ambiguous_as_wide', True)
-pd.set_option('display.unicode.east_asian_width', True)
-pd.set_option('display.width', 260) 
-def get_sql():
-    sql = ''' 
-           SELECT "#user_id","#account_id","#distinct_id","$part_event","#event_time","$part_date","#data_source","day1_last_sub_game_name","day1_sub_game_reason_cnt","day1_sub_game_reason_win_cnt","day1_sub_game_uptime","is_keep7","is_keep6","is_keep5","ad_game_name","is_keep4","is_keep3","is_keep2","day1_is_sign","day1_is_ad_rewarded","day1_sub_game_name","role_id","reg_time","reg_app_version","day1_sub_game_reason_fail_cnt","install_local_time","install_time","day1_unblock_gamenum","day1_sub_game_win_uptime","day1_total_fail_reason_cnt","device_id","lt_cnt","reg_pack","day1_total_game_uptime","day1_sub_game_cnt","reg_country","ad_game_sub_name","reg_local_time","day1_total_win_reason_cnt","reg_date","ad_id","day1_sub_game_fail_uptime","reg_local_date","day1_game_reason_cnt","test_label" FROM v_event_4 WHERE "$part_event"='og_gbt3_game_event' AND "$part_date"<='2026-01-14'
-            ''' 
+
+_IMPORT_START = time.perf_counter()
+
+import argparse
+import os
+
+# 查询的分区范围：起始默认不限（从最早的分区开始，与原始查询一致），只限制结束日期
+START_DATE = None
+END_DATE = '2026-01-14'
+
+# 留存标记列，用于图表
+KEEP_COLUMNS = ['is_keep2', 'is_keep3', 'is_keep4', 'is_keep5', 'is_keep6', 'is_keep7']
+
+
+def get_sql(start_date='{start_date}', end_date='{end_date}'):
+    # 不传日期时返回带 {start_date}/{end_date} 占位符的模板，供分区缓存使用
+    # start_date=None 时不加起始分区条件
+    lower_bound = '' if start_date is None else f""" AND "$part_date">='{start_date}'"""
+    sql = '''
+           SELECT "#user_id","#account_id","#distinct_id","$part_event","#event_time","$part_date","#data_source","day1_last_sub_game_name","day1_sub_game_reason_cnt","day1_sub_game_reason_win_cnt","day1_sub_game_uptime","is_keep7","is_keep6","is_keep5","ad_game_name","is_keep4","is_keep3","is_keep2","day1_is_sign","day1_is_ad_rewarded","day1_sub_game_name","role_id","reg_time","reg_app_version","day1_sub_game_reason_fail_cnt","install_local_time","install_time","day1_unblock_gamenum","day1_sub_game_win_uptime","day1_total_fail_reason_cnt","device_id","lt_cnt","reg_pack","day1_total_game_uptime","day1_sub_game_cnt","reg_country","ad_game_sub_name","reg_local_time","day1_total_win_reason_cnt","reg_date","ad_id","day1_sub_game_fail_uptime","reg_local_date","day1_game_reason_cnt","test_label" FROM v_event_4 WHERE "$part_event"='og_gbt3_game_event'{lower_bound} AND "$part_date"<='{end_date}'
+            '''.format(lower_bound=lower_bound, end_date=end_date)
     return sql
 
-def get_data():
-    # DMG:5cv2wnXJ4bWrfhRsUMYyGcbaQETZBNqv0mVGpbIKYXAf01IsLDKbUj0MXZ5Y0pIu
-    # OG:8z54SmsXpem11675yprE1HV7V7QAZckUSSPDTzN0m9uIJAibb4FX0SZ130cB1NTK
-    # url = rf'''http://121.43.174.24:8992/querySql?token={token}'''
-    token='8z54SmsXpem11675yprE1HV7V7QAZckUSSPDTzN0m9uIJAibb4FX0SZ130cB1NTK'
-    url = rf'''https://ta-openapi.difeh.com:8992/querySql?token={token}'''
-    format='csv_header'
-    timeoutSeconds=30000      # 5min请求不到视作超时
-    header = {"ContentType": "application/x-www-form-urlencoded"}
-    data = {"sql": get_sql(),
-            "format": format,
-            "timeoutSecond": timeoutSeconds
-            }
-    response = requests.post(url, data=data)
-    with open(r'sql.txt', 'w+', encoding='utf-8') as f:
-        f.write(response.content.decode('utf-8'))
-        f.close()
-    data = pd.read_csv(r'sql.txt', sep=',', encoding='utf-8').fillna(0)
+
+def first_partition(end_date=END_DATE):
+    """查询 end_date 及之前最早的 "$part_date" 分区，没有数据时返回 None"""
+    from ta_client import query_dataframe
+    data = query_dataframe('''
+           SELECT min("$part_date") AS first_date FROM v_event_4 WHERE "$part_event"='og_gbt3_game_event' AND "$part_date"<='{end_date}'
+            '''.format(end_date=end_date))
+    if data.empty or data['first_date'].isna().all():
+        return None
+    return str(data['first_date'].iloc[0])[:10]
+
+
+def get_data(start_date=START_DATE, end_date=END_DATE, lateness_days=None, refresh=False,
+             slice_days=None, max_workers=None):
+    # 流式读取接口结果（见 ta_client.py），按 "$part_date" 分区缓存到本地（见 ta_cache.py），
+    # 早于迟到窗口的分区只拉取一次；需要拉取的日期按 slice_days 切片后并发查询
+    # 列类型按 ta_schema.OG_GAME_EVENT_SCHEMA 转换：标记列空值记 0，计数列保留 <NA>
+    # 未指定的参数使用各模块的默认值；不指定 start_date 时先查出最早的分区，结果与不限起始日期的查询一致
+    from ta_cache import LATENESS_DAYS, cached_query
+    from ta_client import DEFAULT_FETCH_WORKERS, DEFAULT_SLICE_DAYS
+    from ta_schema import OG_GAME_EVENT_SCHEMA, apply_schema
+
+    if start_date is None:
+        start_date = first_partition(end_date) or end_date
+    data = cached_query(get_sql(), start_date, end_date,
+                        lateness_days=LATENESS_DAYS if lateness_days is None else lateness_days,
+                        refresh=refresh,
+                        slice_days=slice_days or DEFAULT_SLICE_DAYS,
+                        max_workers=max_workers or DEFAULT_FETCH_WORKERS,
+                        transform=lambda df: apply_schema(df, OG_GAME_EVENT_SCHEMA))
     return data
-df = get_data()
-df
\ No newline at end of file
+
+
+def setup_display():
+    """终端输出中文对齐"""
+    import pandas as pd
+    pd.set_option('display.unicode.ambiguous_as_wide', True)
+    pd.set_option('display.unicode.east_asian_width', True)
+    pd.set_option('display.width', 260)
+
+
+def setup_plotting():
+    """加载 matplotlib 并设置中文字体，只在需要出图时调用"""
+    import warnings
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    warnings.filterwarnings('ignore')
+    plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']
+    plt.rc('font', family='Microsoft YaHei Mono', size=20)
+    return plt
+
+
+def plot_retention(data, output):
+    """按注册日期汇总人数和次留~7留，渲染成表格图片"""
+    plt = setup_plotting()
+    from pandas.plotting import table
+
+    columns = [column for column in KEEP_COLUMNS if column in data.columns]
+    summary = data.groupby('reg_date', observed=True)[columns].mean().round(4)
+    summary.insert(0, 'users', data.groupby('reg_date', observed=True).size())
+    fig, ax = plt.subplots(figsize=(3 * (len(columns) + 2), 0.8 * (len(summary) + 2)))
+    ax.axis('off')
+    table(ax, summary, loc='center')
+    fig.savefig(output, bbox_inches='tight')
+    plt.close(fig)
+    print(f"图表已保存: {output}")
+
+
+def save_data(data, output):
+    """按扩展名保存：.pkl 保留列类型，其余按 CSV 保存"""
+    if os.path.splitext(output)[1].lower() == '.pkl':
+        data.to_pickle(output)
+    else:
+        data.to_csv(output, index=False, encoding='utf-8')
+    print(f"已保存 {len(data)} 行: {output}")
+
+
+def run_extract(args):
+    """extract 命令"""
+    if args.raw:
+        # 不经 pandas 和缓存，接口结果原样写入文件
+        from ta_client import query_to_csv
+        size = query_to_csv(get_sql(args.start, args.end), args.out)
+        print(f"已写入 {size} 字节: {args.out}")
+        return
+
+    data = get_data(args.start, args.end, lateness_days=args.lateness_days, refresh=args.refresh,
+                    slice_days=args.slice_days, max_workers=args.workers)
+    if args.out:
+        save_data(data, args.out)
+    else:
+        setup_display()
+        print(data)
+    if args.chart:
+        plot_retention(data, args.chart)
+
+
+def run_sync(args):
+    """sync 命令"""
+    from ta_sync import sync_event
+    sync_event('og_gbt3_game_event', end_date=args.end, full=args.full, slice_days=args.slice_days,
+               max_workers=args.workers)
+
+
+def main(argv=None):
+    """主函数"""
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description='OG 测试期基础数据提取')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    extract = subparsers.add_parser('extract', help='提取 og_gbt3_game_event 数据')
+    extract.add_argument('--start', default=START_DATE, help='起始分区日期（默认从最早的分区开始）')
+    extract.add_argument('--end', default=END_DATE, help=f'结束分区日期（默认 {END_DATE}）')
+    extract.add_argument('--out', help='输出文件（.pkl 保留列类型，其余按 CSV），不指定时打印到终端')
+    extract.add_argument('--chart', help='输出按注册日期的留存表格图片')
+    extract.add_argument('--raw', action='store_true', help='接口结果原样写入 --out，不解析、不使用缓存')
+    extract.add_argument('--refresh', action='store_true', help='忽略本地缓存，全部重新拉取')
+    extract.add_argument('--lateness-days', type=int, help='迟到窗口天数，窗口内的分区每次重新拉取')
+    extract.add_argument('--slice-days', type=int, help='每个并发查询覆盖的天数')
+    extract.add_argument('--workers', type=int, help='并发查询数')
+    extract.set_defaults(func=run_extract)
+
+    sync = subparsers.add_parser('sync', help='按水位增量同步 og_gbt3_game_event 到本地分区目录')
+    sync.add_argument('--end', help='同步到的分区日期（默认今天）')
+    sync.add_argument('--full', action='store_true', help='忽略水位，从起始日期重新同步')
+    sync.add_argument('--slice-days', type=int, default=1, help='每个并发查询覆盖的天数（默认 1）')
+    sync.add_argument('--workers', type=int, default=4, help='并发查询数（默认 4）')
+    sync.set_defaults(func=run_sync)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'raw', False) and not args.out:
+        parser.error('--raw 需要同时指定 --out')
+
+    print(f"模块导入耗时 {IMPORT_SECONDS * 1000:.0f}ms")
+    args.func(args)
+    print(f"总耗时 {time.perf_counter() - started:.1f}s")
+
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+广告派生指标计算模块
+用 NumPy 从原始量（cost/show_times/click/install）重新计算 CPM/CTR/CVR/CPI，
+并按任意维度做加权汇总
+
+说明：
+1. 指标口径（与 union_all.sql 报表一致）
+   cpm = cost / show_times * 1000
+   ctr = click / show_times
+   cvr = install / click
+   cpi = cost / install
+2. 汇总时先对原始量求和，再用和计算指标，得到正确的加权值
+   （不能对各行的 ctr/cpi 直接求平均）
+3. 分母为 0 时指标为 NaN
+4. 报表中的指标是四舍五入后的字面量，超出舍入误差的行会被标记出来
+
+用法：
+    python ad_metrics.py                    # 检查数据库中的 ad_statistics
+    python ad_metrics.py --by country       # 按国家汇总
+    python ad_metrics.py --report union_all.sql   # 检查报表中的明细行和"总计"行
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from report_parser import AD_COLUMNS, TOTAL_LABEL, iter_report_rows
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+# 原始量和派生指标
+BASE_COLUMNS = ['cost', 'show_times', 'click', 'install']
+METRIC_COLUMNS = ['cpm', 'ctr', 'cvr', 'cpi']
+
+# 报表字面量的小数位（ctr/cvr 以百分比两位小数给出，即小数四位）
+METRIC_DECIMALS = {'cpm': 2, 'ctr': 4, 'cvr': 4, 'cpi': 2}
+
+
+def _divide(numerator, denominator):
+    """逐元素相除，分母为 0 时结果为 NaN"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def compute_metrics(cost, show_times, click, install):
+    """根据原始量计算派生指标，返回 {指标名: ndarray}"""
+    return {
+        'cpm': _divide(cost, show_times) * 1000,
+        'ctr': _divide(click, show_times),
+        'cvr': _divide(install, click),
+        'cpi': _divide(cost, install),
+    }
+
+
+def _factorize(values):
+    """把一列维度值编码成 0..n-1，返回 (唯一值, 编码)"""
+    uniques, codes = np.unique(np.asarray(values), return_inverse=True)
+    return uniques, codes.reshape(-1)
+
+
+def rollup(data, by):
+    """
+    按一个或多个维度加权汇总
+    data: 列名到数组的映射（dict 或 DataFrame），需包含 BASE_COLUMNS 和维度列
+    by: 维度列名或列名列表
+    返回 dict：维度列（唯一组合）+ 原始量之和 + 由和计算的指标
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    keys, codes, sizes = [], [], []
+    for column in by:
+        uniques, column_codes = _factorize(data[column])
+        keys.append(uniques)
+        codes.append(column_codes)
+        sizes.append(len(uniques))
+
+    # 多个维度的编码合成一个组号，一次 bincount 完成全部分组求和
+    group = np.ravel_multi_index(codes, sizes)
+    present, group = np.unique(group, return_inverse=True)
+    n_groups = len(present)
+
+    result = {}
+    for column, column_keys, index in zip(by, keys, np.unravel_index(present, sizes)):
+        result[column] = column_keys[index]
+    for column in BASE_COLUMNS:
+        result[column] = np.bincount(group, weights=np.asarray(data[column], dtype=np.float64),
+                                     minlength=n_groups)
+    result.update(compute_metrics(*(result[column] for column in BASE_COLUMNS)))
+    return result
+
+
+def find_mismatches(data, decimals=METRIC_DECIMALS):
+    """
+    对比报表中的指标字面量和重新计算的值
+    差值超过舍入误差（半个最小单位）的视为不一致
+    返回 dict：{指标名: 不一致行的下标数组}，以及重新计算的指标
+    """
+    recomputed = compute_metrics(*(data[column] for column in BASE_COLUMNS))
+    mismatches = {}
+    for column in METRIC_COLUMNS:
+        stored = np.asarray(data[column], dtype=np.float64)
+        tolerance = 0.5 * 10.0 ** -decimals[column] + 1e-9
+        diff = np.abs(stored - recomputed[column])
+        # 两边都是 NaN 视为一致，只有一边是 NaN 视为不一致
+        bad = (diff > tolerance) | (np.isnan(stored) != np.isnan(recomputed[column]))
+        mismatches[column] = np.flatnonzero(bad)
+    return mismatches, recomputed
+
+
+def _rows_to_columns(rows, columns):
+    """把行元组列表转成 {列名: ndarray}"""
+    if not rows:
+        return {column: np.array([]) for column in columns}
+    arrays = list(zip(*rows))
+    result = {}
+    for column, values in zip(columns, arrays):
+        if column in BASE_COLUMNS or column in METRIC_COLUMNS:
+            result[column] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            result[column] = np.array(['' if v is None else str(v) for v in values])
+    return result
+
+
+def load_ad_statistics(conn, where=''):
+    """从 ad_statistics 读取数据，返回 {列名: ndarray}（含 id 和 report_date）"""
+    columns = ['id', 'report_date'] + AD_COLUMNS
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM ad_statistics {where}").fetchall()
+    return _rows_to_columns(rows, columns)
+
+
+def load_report(file_path):
+    """读取字面量报表，返回 (明细数据, 总计行数据或 None)"""
+    detail, totals = [], []
+    for row in iter_report_rows(file_path, skip_total=False):
+        (totals if row[0] == TOTAL_LABEL else detail).append(row)
+    return _rows_to_columns(detail, AD_COLUMNS), (_rows_to_columns(totals, AD_COLUMNS) if totals else None)
+
+
+def print_mismatches(data, label_columns, decimals=METRIC_DECIMALS):
+    """输出指标字面量与重新计算值不一致的行"""
+    mismatches, recomputed = find_mismatches(data, decimals)
+    total = 0
+    for column, index in mismatches.items():
+        total += len(index)
+        for i in index[:20]:
+            label = ' '.join(str(data[name][i]) for name in label_columns)
+            print(f"  [{column}] {label}: 报表 {data[column][i]:.{decimals[column]}f}，"
+                  f"重算 {recomputed[column][i]:.{decimals[column]}f}")
+        if len(index) > 20:
+            print(f"  [{column}] ……共 {len(index)} 行不一致")
+    if total == 0:
+        print("  所有指标与重算结果一致")
+    return total
+
+
+def print_rollup(result, by):
+    """输出汇总结果"""
+    columns = by + BASE_COLUMNS + METRIC_COLUMNS
+    print('\t'.join(columns))
+    for i in range(len(result[BASE_COLUMNS[0]])):
+        values = [str(result[column][i]) for column in by]
+        values += [f"{result[column][i]:.2f}" for column in BASE_COLUMNS]
+        values += [f"{result[column][i]:.{METRIC_DECIMALS[column]}f}" for column in METRIC_COLUMNS]
+        print('\t'.join(values))
+
+
+def check_report(file_path):
+    """检查字面量报表：明细行指标，以及"总计"行与明细加权汇总是否一致"""
+    detail, totals = load_report(file_path)
+    print(f"=== 明细行指标检查: {file_path} ===")
+    print_mismatches(detail, ['country'])
+    if totals is None:
+        return
+    print(f"=== {TOTAL_LABEL}行检查 ===")
+    detail['all'] = np.zeros(len(detail['country']), dtype=np.int8)
+    expected = rollup(detail, 'all')
+    for column in BASE_COLUMNS + METRIC_COLUMNS:
+        stored = totals[column][0]
+        value = expected[column][0]
+        decimals = METRIC_DECIMALS.get(column, 2)
+        flag = '' if abs(stored - value) <= 0.5 * 10.0 ** -decimals + 1e-9 else '  <-- 不一致'
+        print(f"  {column}: 报表 {stored:.{decimals}f}，明细汇总 {value:.{decimals}f}{flag}")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='重新计算广告派生指标并加权汇总')
+    parser.add_argument('--db', default='ad_report', help='数据库名（见 db_config.json）或文件路径')
+    parser.add_argument('--by', nargs='*', default=[], help='汇总维度，如 country report_date')
+    parser.add_argument('--report', help='直接检查字面量报表文件（含"总计"行）')
+    args = parser.parse_args(argv)
+
+    if args.report:
+        check_report(args.report)
+        return
+
+    data = load_ad_statistics(get_connection(args.db, 'read'))
+    print(f"=== ad_statistics 指标检查（{len(data['id'])} 行）===")
+    print_mismatches(data, ['id', 'report_date', 'country'])
+    if args.by:
+        print(f"=== 按 {', '.join(args.by)} 汇总 ===")
+        print_rollup(rollup(data, args.by), args.by)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大盘宽表构建（本地版 benchmark.sql）
+按 (dt, country) 计算新增、活跃、充值、广告点击等各部分指标，每部分先聚合成以 (dt, country)
+为唯一键的表，再一对一合并成宽表，避免 SQL 中多个 LEFT JOIN 造成的行数膨胀
+
+说明：
+1. 口径与 benchmark.sql 一致
+   新增：注册表（register_table 物化的首次登录）的 reg_date 和国家
+   活跃：lobby_enter、ta_app_start 登录过的 (dt, country, role_id)
+   广告用户（user_type = click）：v_user_4 中 te_ads_object.ad_group_id 不为空的用户，其余为自然量
+   广告金额：用户所属广告组在 dim_4_1_3247 中的 amount
+   充值：game_end 的 cast(game_id as int)，按 (role_id, dt) 汇总后挂到当天的活跃用户上
+   arpu = 活跃充值金额 / 活跃用户，arppu = 活跃充值金额 / 有充值的广告用户（与 SQL 相同）
+   点击广告用户：当天有 ad_click 事件的用户；新增点击广告用户为注册当天点击过广告的新用户
+2. 与 SQL 的差别
+   活跃按 (dt, country, role_id) 去重后再挂充值，SQL 按登录事件行关联，充值金额会按登录次数重复计算
+   广告金额按不同的广告组求和，SQL 的 sum(distinct ad_amount) 会把金额相同的不同广告组合并
+   benchmark.sql 中 ad_click 的日期条件写成了两个 <=，这里按区间 [start, end] 取
+   空国家记为空字符串，与其他国家一样输出一行
+3. 每一步合并都用 validate 检查一对一（维表按主键去重后为多对一），键不唯一时直接报错
+4. 增量：daily_board 以 (dt, country) 为主键（WITHOUT ROWID）保存在 ta_store，refresh 默认只重算最近一天：
+   先增量刷新注册表，再只拉取这一天的活跃、充值、广告点击（TA 端已去重/汇总），整天替换
+
+用法：
+    python board_builder.py refresh                                     # 只重算今天
+    python board_builder.py refresh --end 2026-01-07 --days 3
+    python board_builder.py refresh --start 2025-12-29 --end 2026-01-07
+    python board_builder.py show --start 2025-12-29 --end 2026-01-07 --out board.csv
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import register_table
+from join_profiler import normalize_keys
+from register_table import LOGIN_EVENTS
+from ta_client import DATE_FORMAT, DEFAULT_FETCH_WORKERS, DEFAULT_RETRIES, date_range, parse_date, query_dataframe, query_sliced
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+STORE_DB = 'ta_store'
+KEY_COLUMNS = ['dt', 'country']
+# 用户和广告组的 ID 列，关联前统一规范化成字符串
+ID_COLUMNS = ('role_id', 'ad_id')
+# benchmark.sql 最后输出的国家
+BOARD_COUNTRIES = ('巴西', '印度尼西亚', '印度')
+
+BOARD_COLUMNS = [
+    'dt', 'country',
+    'active_user_cnt', 'click_active_cnt', 'click_active_ratio', 'active_click_ad_amount',
+    'active_money', 'arpu', 'arppu',
+    'new_user_cnt', 'click_new_cnt', 'nat_new_cnt', 'new_click_ad_amount',
+    'ad_click_user_cnt', 'ad_click_new_cnt',
+]
+# 宽表列的中文名（与 benchmark.sql 开头的表头对应）
+BOARD_LABELS = {
+    'dt': '日期', 'country': '国家',
+    'active_user_cnt': '活跃用户', 'click_active_cnt': '广告用户', 'click_active_ratio': '广告用户占比',
+    'active_click_ad_amount': '广告金额', 'active_money': '充值金额', 'arpu': 'Arpu', 'arppu': 'Arppu',
+    'new_user_cnt': '新增-用户', 'click_new_cnt': '新增-广告用户', 'nat_new_cnt': '新增-自然量用户',
+    'new_click_ad_amount': '新增-广告金额', 'ad_click_user_cnt': '点击广告用户', 'ad_click_new_cnt': '新增-点击广告用户',
+}
+
+
+def _login_filter(events):
+    return ', '.join(f"'{event}'" for event in events)
+
+
+def get_active_sql(start_date='{start_date}', end_date='{end_date}', events=LOGIN_EVENTS):
+    # active：TA 端按 (dt, country, role_id) 去重，不再按登录事件行返回
+    sql = '''
+        SELECT DISTINCT "$part_date" dt, "#country" country, "#account_id" role_id
+        FROM v_event_4
+        WHERE "$part_event" IN ({events}) AND "$part_date" >= '{start_date}' AND "$part_date" <= '{end_date}'
+        '''.format(events=_login_filter(events), start_date=start_date, end_date=end_date)
+    return sql
+
+
+def get_recharge_sql(start_date='{start_date}', end_date='{end_date}'):
+    # recharge：按 (role_id, dt) 汇总充值金额
+    sql = '''
+        SELECT "$part_date" dt, "#account_id" role_id, sum(cast(game_id as int)) money
+        FROM v_event_4
+        WHERE "$part_event"='game_end' AND "$part_date" >= '{start_date}' AND "$part_date" <= '{end_date}'
+        GROUP BY 1, 2
+        '''.format(start_date=start_date, end_date=end_date)
+    return sql
+
+
+def get_ad_click_sql(start_date='{start_date}', end_date='{end_date}'):
+    # ad_click：游戏内广告点击，按 (dt, country, role_id) 去重
+    sql = '''
+        SELECT DISTINCT "$part_date" dt, "#country" country, "#account_id" role_id
+        FROM v_event_4
+        WHERE "$part_event" = 'ad_click' AND "$part_date" >= '{start_date}' AND "$part_date" <= '{end_date}'
+        '''.format(start_date=start_date, end_date=end_date)
+    return sql
+
+
+def get_user_ads_sql():
+    # ad：用户所属的广告组
+    sql = '''
+        SELECT "#account_id" role_id, te_ads_object.ad_group_id ad_id
+        FROM ta.v_user_4
+        WHERE te_ads_object.ad_group_id IS NOT NULL
+        '''
+    return sql
+
+
+def get_ad_amount_sql():
+    # ad_amount：广告组的金额
+    sql = '''
+        SELECT "te_ads_object.ad_group_id@adid" ad_id, cast("te_ads_object.ad_group_id@amount" as double) ad_amount
+        FROM ta_dim.dim_4_1_3247
+        '''
+    return sql
+
+
+def _id_text(column):
+    """
+    ID 列转成字符串：与 join_profiler 相同，整数值的浮点列（读 CSV 时有空值）先转成整数，避免出现 "123.0"；
+    已经是 "123.0" 形式的文本（例如之前按浮点数写入的注册表）也去掉小数部分
+    """
+    text = pd.Series(normalize_keys(column.to_frame())[column.name].astype(str).to_numpy(), index=column.index)
+    decimal = text.str.endswith('.0')
+    if decimal.any():
+        text[decimal] = text[decimal].str.replace(r'^([+-]?\d+)\.0+$', r'\1', regex=True)
+    return text
+
+
+def _keyed(frame, columns):
+    """统一键列：dt 取前 10 位，country 空值记为空字符串，role_id / ad_id 去掉空值后转成字符串"""
+    frame = frame.copy()
+    if 'dt' in columns:
+        frame['dt'] = frame['dt'].astype(str).str[:10]
+    if 'country' in columns:
+        frame['country'] = frame['country'].fillna('').astype(str)
+    for name in ID_COLUMNS:
+        if name in columns:
+            frame = frame.dropna(subset=[name])
+            frame[name] = _id_text(frame[name])
+    return frame[columns]
+
+
+def _unique_by(frame, keys, name):
+    """按主键去重（保留第一行），有重复时打印提示，保证之后的关联是多对一"""
+    unique = frame.drop_duplicates(keys)
+    if len(unique) < len(frame):
+        print(f"提示：{name} 中有 {len(frame) - len(unique)} 行重复的 {', '.join(keys)}，只保留第一行")
+    return unique
+
+
+def user_attribution(user_ads, ad_amounts):
+    """每个广告用户一行：role_id, ad_id, ad_amount"""
+    user_ads = _unique_by(_keyed(user_ads, ['role_id', 'ad_id']), ['role_id'], '用户广告组')
+    ad_amounts = _unique_by(_keyed(ad_amounts, ['ad_id', 'ad_amount']), ['ad_id'], '广告组金额')
+    ad_amounts = ad_amounts.assign(ad_amount=pd.to_numeric(ad_amounts['ad_amount'], errors='coerce'))
+    return user_ads.merge(ad_amounts, on='ad_id', how='left', validate='many_to_one')
+
+
+def _attach_users(frame, attribution):
+    """给 (dt, country, role_id) 行挂上广告组，is_click 为是否广告用户"""
+    frame = frame.merge(attribution, on='role_id', how='left', validate='many_to_one')
+    return frame.assign(is_click=frame['ad_id'].notna())
+
+
+def _ad_amount(frame):
+    """每个 (dt, country) 中广告用户所属的不同广告组的金额之和"""
+    groups = frame[frame['is_click']].drop_duplicates(KEY_COLUMNS + ['ad_id'])
+    return groups.groupby(KEY_COLUMNS)['ad_amount'].sum(min_count=1)
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator.where(denominator != 0)
+
+
+def active_metrics(active, attribution, recharge):
+    """活跃类指标（active_user），每个 (dt, country) 一行"""
+    active = _attach_users(_keyed(active, ['dt', 'country', 'role_id']).drop_duplicates(), attribution)
+    recharge = (_keyed(recharge, ['dt', 'role_id', 'money'])
+                .assign(money=lambda frame: pd.to_numeric(frame['money'], errors='coerce').fillna(0))
+                .groupby(['dt', 'role_id'], as_index=False)['money'].sum())
+    active = active.merge(recharge, on=['dt', 'role_id'], how='left', validate='many_to_one')
+    active['paid_click'] = active['is_click'] & active['money'].notna()
+    metrics = active.groupby(KEY_COLUMNS).agg(
+        active_user_cnt=('role_id', 'size'),
+        click_active_cnt=('is_click', 'sum'),
+        active_money=('money', 'sum'),
+        paid_click_cnt=('paid_click', 'sum'),
+    )
+    metrics['click_active_ratio'] = _ratio(metrics['click_active_cnt'], metrics['active_user_cnt'])
+    metrics['active_click_ad_amount'] = _ad_amount(active)
+    metrics['arpu'] = _ratio(metrics['active_money'], metrics['active_user_cnt'])
+    metrics['arppu'] = _ratio(metrics['active_money'], metrics['paid_click_cnt'])
+    return metrics.drop(columns='paid_click_cnt').reset_index()
+
+
+def new_user_metrics(register, attribution):
+    """新增类指标（new_user），每个 (reg_date, country) 一行"""
+    register = _keyed(register.rename(columns={'reg_date': 'dt'}), ['dt', 'country', 'role_id'])
+    register = _attach_users(_unique_by(register, ['role_id'], '注册表'), attribution)
+    metrics = register.groupby(KEY_COLUMNS).agg(new_user_cnt=('role_id', 'size'), click_new_cnt=('is_click', 'sum'))
+    metrics['nat_new_cnt'] = metrics['new_user_cnt'] - metrics['click_new_cnt']
+    metrics['new_click_ad_amount'] = _ad_amount(register)
+    return metrics.reset_index()
+
+
+def ad_click_metrics(ad_click, register):
+    """点击广告类指标，每个 (dt, country) 一行；新增点击广告用户为注册当天点击过广告的新用户"""
+    ad_click = _keyed(ad_click, ['dt', 'country', 'role_id']).drop_duplicates()
+    reg_dates = _unique_by(_keyed(register, ['role_id', 'reg_date']), ['role_id'], '注册表')
+    ad_click = ad_click.merge(reg_dates, on='role_id', how='left', validate='many_to_one')
+    ad_click['is_new'] = ad_click['reg_date'].astype(str).str[:10] == ad_click['dt']
+    return (ad_click.groupby(KEY_COLUMNS)
+            .agg(ad_click_user_cnt=('role_id', 'size'), ad_click_new_cnt=('is_new', 'sum'))
+            .reset_index())
+
+
+def build_board(active, register, recharge, ad_click, user_ads, ad_amounts, dates=None):
+    """
+    由各部分明细构建宽表（与 benchmark.sql 相同，以活跃表为主表左关联新增和点击广告指标）
+    dates 不为空时只输出这些日期；返回 BOARD_COLUMNS 列的 DataFrame
+    """
+    attribution = user_attribution(user_ads, ad_amounts)
+    board = active_metrics(active, attribution, recharge)
+    board = board.merge(new_user_metrics(register, attribution), on=KEY_COLUMNS, how='left', validate='one_to_one')
+    board = board.merge(ad_click_metrics(ad_click, register), on=KEY_COLUMNS, how='left', validate='one_to_one')
+    count_columns = [column for column in BOARD_COLUMNS if column.endswith('_cnt')]
+    board[count_columns] = board[count_columns].fillna(0).astype(np.int64)
+    if dates is not None:
+        board = board[board['dt'].isin(list(dates))]
+    return board[BOARD_COLUMNS].sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+
+def create_tables(conn):
+    """创建宽表"""
+    metric_columns = ',\n        '.join(
+        f"{column} {'INTEGER NOT NULL' if column.endswith('_cnt') else 'REAL'}" for column in BOARD_COLUMNS[2:])
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS daily_board (
+        dt TEXT NOT NULL,
+        country TEXT NOT NULL,
+        {metric_columns},
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (dt, country)
+    ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def replace_days(conn, dates, board):
+    """在一个事务内整天替换 dates 的宽表数据，返回写入的行数"""
+    board = board[board['dt'].isin(list(dates))]
+    rows = list(board[BOARD_COLUMNS].astype(object).where(board[BOARD_COLUMNS].notna(), None)
+                .itertuples(index=False, name=None))
+    try:
+        conn.execute("BEGIN")
+        conn.executemany("DELETE FROM daily_board WHERE dt = ?", [(date,) for date in dates])
+        conn.executemany(f'''
+        INSERT INTO daily_board ({', '.join(BOARD_COLUMNS)}, updated_at)
+        VALUES ({', '.join('?' * len(BOARD_COLUMNS))}, CURRENT_TIMESTAMP)
+        ''', rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def fetch_components(start_date, end_date, max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    从 TA 拉取 [start_date, end_date] 的活跃、充值、广告点击和两个广告维表
+    返回 (各部分明细的 dict, 拉取失败的日期集合)
+    """
+    components, failed_dates = {}, set()
+    for name, sql, columns in (('active', get_active_sql(), ['dt', 'country', 'role_id']),
+                               ('recharge', get_recharge_sql(), ['dt', 'role_id', 'money']),
+                               ('ad_click', get_ad_click_sql(), ['dt', 'country', 'role_id'])):
+        data, failed = query_sliced(sql, start_date, end_date, max_workers=max_workers, retries=retries)
+        components[name] = data if len(data) else pd.DataFrame(columns=columns)
+        failed_dates.update(date for (start, end), _ in failed for date in date_range(start, end))
+    components['user_ads'] = query_dataframe(get_user_ads_sql())
+    components['ad_amounts'] = query_dataframe(get_ad_amount_sql())
+    for name, columns in (('user_ads', ['role_id', 'ad_id']), ('ad_amounts', ['ad_id', 'ad_amount'])):
+        if not len(components[name]):
+            components[name] = pd.DataFrame(columns=columns)
+    return components, failed_dates
+
+
+def refresh(end_date=None, days=1, start_date=None, max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    重算 [start_date, end_date] 的宽表（start_date 默认为 end_date 往前 days 天，即只算最近一天）
+    注册表先增量刷新；拉取失败的日期不写入，保持原样。返回写入的行数
+    """
+    end_date = parse_date(end_date or datetime.date.today()).strftime(DATE_FORMAT)
+    start_date = (parse_date(start_date) if start_date
+                  else parse_date(end_date) - datetime.timedelta(days=days - 1)).strftime(DATE_FORMAT)
+    register_table.refresh(end_date=end_date, max_workers=max_workers, retries=retries)
+
+    components, failed_dates = fetch_components(start_date, end_date, max_workers, retries)
+    dates = [date for date in date_range(start_date, end_date) if date not in failed_dates]
+    register = register_table.load_register(start_date, end_date)
+    board = build_board(components['active'], register, components['recharge'], components['ad_click'],
+                        components['user_ads'], components['ad_amounts'], dates)
+
+    conn = get_connection(STORE_DB, 'write')
+    create_tables(conn)
+    written = replace_days(conn, dates, board)
+    if failed_dates:
+        print(f"警告：{', '.join(sorted(failed_dates))} 拉取失败，未更新，下次刷新重试")
+    print(f"{start_date}~{end_date} 写入 {written} 行")
+    return written
+
+
+def load_board(start_date, end_date, countries=BOARD_COUNTRIES, conn=None):
+    """读取宽表（主键范围扫描），countries 为空时返回所有国家"""
+    conn = conn or get_connection(STORE_DB, 'read')
+    params = [parse_date(start_date).strftime(DATE_FORMAT), parse_date(end_date).strftime(DATE_FORMAT)]
+    condition = ''
+    if countries:
+        condition = f"AND country IN ({', '.join('?' * len(countries))})"
+        params.extend(countries)
+    return pd.read_sql_query(f'''
+        SELECT {', '.join(BOARD_COLUMNS)} FROM daily_board
+        WHERE dt BETWEEN ? AND ? {condition}
+        ORDER BY dt, country
+        ''', conn, params=params)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='按 (日期, 国家) 构建大盘宽表')
+    subparsers = parser.add_subparsers(dest='command')
+
+    refresh_parser = subparsers.add_parser('refresh', help='从 TA 重算宽表（默认只算最近一天）')
+    refresh_parser.add_argument('--end', help='结束日期（默认今天）')
+    refresh_parser.add_argument('--days', type=int, default=1, help='重算最近几天（默认 1）')
+    refresh_parser.add_argument('--start', help='开始日期（指定时忽略 --days）')
+
+    show_parser = subparsers.add_parser('show', help='查看宽表')
+    show_parser.add_argument('--start', default=register_table.START_DATE, help='开始日期')
+    show_parser.add_argument('--end', default=datetime.date.today().strftime(DATE_FORMAT), help='结束日期')
+    show_parser.add_argument('--countries', nargs='*', default=list(BOARD_COUNTRIES),
+                             help='国家（不带参数时输出所有国家）')
+    show_parser.add_argument('--out', help='保存为 CSV（中文表头）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'refresh':
+        refresh(args.end, args.days, args.start)
+        return
+    if args.command != 'show':
+        parser.print_help()
+        return
+    board = load_board(args.start, args.end, args.countries).rename(columns=BOARD_LABELS)
+    pd.set_option('display.unicode.ambiguous_as_wide', True)
+    pd.set_option('display.unicode.east_asian_width', True)
+    pd.set_option('display.width', 260)
+    print(board.round(4).to_string(index=False))
+    if args.out:
+        board.to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流失关卡（最后一次游玩）计算引擎（本地版 final_play.sql）
+对 game_end 事件流按块做分组取最大值，得到每个用户在每个子游戏的最后关卡和日期，
+再汇总成 (dt, sub_game_name, level) 的流失人数
+
+说明：
+1. 口径与 final_play.sql 一致
+   base：game_end 按 (dt, role_id, sub_game_name, level) 去重
+   final_dt：同一 (role_id, sub_game_name) 内按 (level, dt) 排序的最后一行的 dt
+   churn_num：dt = final_dt 的行按 (dt, sub_game_name, level) 统计去重用户数（final_dt 当天玩过的关卡都计入）
+   level 按数值排序，空值排在最后（与 SQL 的 NULLS LAST 相同）；最近几天的"流失"包含仍在玩的用户，与 SQL 相同
+2. 流式：输入按 dt 升序分块读入，每块与当前状态合并后只保留每组
+   final_dt 当天和最新一天的行，内存只和 (用户, 子游戏) 数有关，与事件总量无关
+   （之后的块 dt 不会更早，新的 final_dt 只可能落在最新一天或之后）
+3. 输入块的 dt 早于已处理的最大 dt 时报错
+4. 数据来源：按 dt 排好序的 CSV（分块读取），或按天流式查询 TA 接口（ta_client.iter_query_chunks）
+
+用法：
+    python final_play_engine.py --start 2025-12-29 --end 2026-01-14 --out churn.csv
+    python final_play_engine.py --csv game_end.csv --chunk-rows 500000
+    game_end.csv: dt, role_id, sub_game_name, level（也可以是 TA 列名 $part_date、#account_id）
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# TA 导出的列名 -> 引擎使用的列名
+EVENT_COLUMNS = {'$part_date': 'dt', '#account_id': 'role_id'}
+KEY_COLUMNS = ['role_id', 'sub_game_name']
+BASE_COLUMNS = ['dt', 'role_id', 'sub_game_name', 'level']
+
+DEFAULT_CHUNK_ROWS = 200000
+
+# 子游戏编码在 (用户, 子游戏) 组合键中占用的位数
+_SUB_BITS = 16
+
+
+def get_sql(start_date='{start_date}', end_date='{end_date}'):
+    # final_play.sql 中的 base，按 dt 排序后可以直接流式读入引擎
+    sql = '''
+        SELECT "$part_date" dt, "#account_id" role_id, sub_game_name, level
+        FROM v_event_4
+        WHERE "$part_event" IN ('game_end') AND "$part_date" >= '{start_date}' AND "$part_date" <= '{end_date}'
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1
+        '''.format(start_date=start_date, end_date=end_date)
+    return sql
+
+
+def _reduce(keys, days, level_keys):
+    """
+    按 (组, level, dt) 排序一次：去掉重复行，并求每组的 final_dt（最后一行的 dt）和最新一天
+    返回 (排序去重后的下标, 是否在 final_dt 当天, 是否在最新一天)
+    """
+    order = np.lexsort((days, level_keys, keys))
+    keys, days, level_keys = keys[order], days[order], level_keys[order]
+    unique = np.ones(len(order), dtype=bool)
+    unique[1:] = (keys[1:] != keys[:-1]) | (level_keys[1:] != level_keys[:-1]) | (days[1:] != days[:-1])
+    order, keys, days = order[unique], keys[unique], days[unique]
+
+    group_start = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    group_size = np.diff(np.r_[group_start, len(keys)])
+    final_day = np.repeat(days[np.r_[group_start[1:], len(keys)] - 1], group_size)
+    latest_day = np.repeat(np.maximum.reduceat(days, group_start), group_size) if len(keys) else days
+    return order, days == final_day, days == latest_day
+
+
+class FinalPlayEngine:
+    """按块维护每个 (用户, 子游戏) 最后一次游玩的引擎"""
+
+    def __init__(self):
+        self._role_ids = pd.Index([])
+        self._sub_games = pd.Index([])
+        # 状态：每行一个 (组合键, dt, level)，只保留各组 final_dt 当天和最新一天的行
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._days = np.zeros(0, dtype=np.int64)
+        self._level_keys = np.zeros(0, dtype=np.float64)
+        self._levels = np.zeros(0, dtype=object)
+        self.max_dt = None
+        self.rows_seen = 0
+
+    @staticmethod
+    def _codes(index, values):
+        """返回各值在 index 中的编码，新值追加；返回 (新 index, 编码)"""
+        new_values = pd.Index(pd.unique(values)).difference(index)
+        if len(new_values):
+            index = index.append(new_values)
+        return index, index.get_indexer(values)
+
+    def add_chunk(self, chunk):
+        """追加一块 game_end 数据（dt 不早于已处理的数据），返回当前保留的状态行数"""
+        chunk = chunk.rename(columns=EVENT_COLUMNS)[BASE_COLUMNS].dropna(subset=['dt'] + KEY_COLUMNS)
+        if chunk.empty:
+            return len(self._keys)
+        # 每块只有少数几个日期，先编码再解析
+        day_codes, day_values = pd.factorize(chunk['dt'])
+        days = pd.to_datetime(pd.Index(day_values).astype(str).str[:10]).to_numpy().astype('datetime64[D]')[day_codes]
+        chunk_min, chunk_max = str(days.min()), str(days.max())
+        if self.max_dt is not None and chunk_min < self.max_dt:
+            raise ValueError(f"输入需按 dt 升序：本块最早 {chunk_min}，已处理到 {self.max_dt}")
+        self.max_dt = chunk_max
+        self.rows_seen += len(chunk)
+
+        self._role_ids, role_codes = self._codes(self._role_ids, chunk['role_id'].to_numpy())
+        self._sub_games, sub_codes = self._codes(self._sub_games, chunk['sub_game_name'].astype(str).to_numpy())
+        if len(self._sub_games) > 1 << _SUB_BITS:
+            raise ValueError(f"子游戏数量超过 {1 << _SUB_BITS}")
+        keys = np.concatenate([self._keys, (role_codes.astype(np.int64) << _SUB_BITS) | sub_codes])
+        days = np.concatenate([self._days, days.astype(np.int64)])
+        level_keys = np.concatenate([self._level_keys,
+                                     pd.to_numeric(chunk['level'], errors='coerce').fillna(np.inf).to_numpy()])
+        levels = np.concatenate([self._levels, chunk['level'].to_numpy(dtype=object)])
+
+        order, is_final, is_latest = _reduce(keys, days, level_keys)
+        order = order[is_final | is_latest]
+        self._keys, self._days, self._level_keys, self._levels = keys[order], days[order], level_keys[order], levels[order]
+        return len(self._keys)
+
+    def _final_rows(self):
+        """final_dt 当天的行：DataFrame(role_id, sub_game_name, level, dt, _level_key)"""
+        order, is_final, _ = _reduce(self._keys, self._days, self._level_keys)
+        order = order[is_final]
+        keys = self._keys[order]
+        return pd.DataFrame({
+            'role_id': self._role_ids.to_numpy()[keys >> _SUB_BITS],
+            'sub_game_name': self._sub_games.to_numpy()[keys & ((1 << _SUB_BITS) - 1)],
+            'level': pd.Series(self._levels[order], dtype=object).infer_objects(),
+            'dt': self._days[order].astype('datetime64[D]').astype(str),
+            '_level_key': self._level_keys[order],
+        })
+
+    def final_plays(self):
+        """每个 (用户, 子游戏) 的 final_dt 和最后关卡（按 (level, dt) 排序的最后一行）"""
+        rows = self._final_rows()
+        last = rows.drop_duplicates(KEY_COLUMNS, keep='last')
+        return (last.rename(columns={'dt': 'final_dt', 'level': 'final_level'})
+                [KEY_COLUMNS + ['final_level', 'final_dt']].reset_index(drop=True))
+
+    def churn(self):
+        """与 final_play.sql 相同的结果：dt, sub_game_name, level, churn_num"""
+        rows = self._final_rows()
+        churn = (rows.groupby(['dt', 'sub_game_name', '_level_key'], sort=True)
+                 .agg(level=('level', 'first'), churn_num=('role_id', 'nunique')).reset_index())
+        return churn[['dt', 'sub_game_name', 'level', 'churn_num']]
+
+
+def iter_csv_chunks(paths, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """按顺序分块读取 CSV 文件（每个文件需按 dt 升序，文件之间也按日期先后）"""
+    for path in paths:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def iter_ta_chunks(start_date, end_date, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """按天流式查询 TA 接口，逐块产出 game_end 数据"""
+    from ta_client import date_range, iter_query_chunks
+    for day in date_range(start_date, end_date):
+        yield from iter_query_chunks(get_sql(day, day), chunk_rows=chunk_rows)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='按子游戏和关卡统计流失人数（最后一次游玩）')
+    parser.add_argument('--csv', nargs='*', help='按 dt 升序的 game_end CSV，不指定时从 TA 接口按天拉取')
+    parser.add_argument('--start', default='2025-12-29', help='TA 拉取开始日期')
+    parser.add_argument('--end', help='TA 拉取结束日期（默认今天）')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='每块行数')
+    parser.add_argument('--out', help='把流失人数保存为 CSV')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.csv:
+        chunks = iter_csv_chunks(args.csv, args.chunk_rows)
+    else:
+        chunks = iter_ta_chunks(args.start, args.end or time.strftime('%Y-%m-%d'), args.chunk_rows)
+    engine = FinalPlayEngine()
+    for chunk in chunks:
+        state_rows = engine.add_chunk(chunk)
+        print(f"已处理 {engine.rows_seen} 行（到 {engine.max_dt}），状态 {state_rows} 行")
+
+    churn = engine.churn()
+    print(f"共 {len(churn)} 行，耗时 {time.perf_counter() - started:.1f}s")
+    pd.set_option('display.width', 200)
+    print(churn.head(30).to_string(index=False))
+    if args.out:
+        churn.to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -6,42 +6,106 @@
 1. 创建必要的数据库目录
 2. 连接到SQLite数据库
 3. 创建广告数据表
-4. 读取SQL文件中的数据
+4. 流式读取SQL文件中的数据（见 report_parser.py）
 5. 处理百分比值
-6. 将数据导入到数据库
+6. 将数据分批导入到数据库
 7. 验证导入结果
+
+增量导入：
+- 每个源文件记录大小、修改时间和内容哈希（import_files 表），未变化的文件直接跳过，不再解析
+- 每行按自然键 (report_date, country) 唯一，并记录行内容哈希和来源文件（source_file），
+  重复导入时只更新内容有变化的行，不会再追加重复数据；文件新版本中不再出现的行会被删除
+- report_date 取自文件名中的日期（如 report_20260114.sql）；文件名中没有日期时必须用
+  --report-date 指定（它会用于所有 SQL 报表，所以只能导入一个，否则各文件会互相覆盖）；
+  日期检查在升级旧表之前进行，旧版导入的无日期数据会在指定 --report-date 时归入该日期
+
+多文件导入：
+    python import_to_sqlite.py <报表目录> --workers 8
+目录下的 SQL 字面量报表写入 ad_statistics，result.tsv / ltv.csv 这类文本报表
+按表头写入 report_<文件名> 表。解析在进程池中并行进行，结果经有界队列
+交给唯一的 SQLite 写入线程（SQLite 同一时间只允许一个写入者）
+
+大批量导入可以使用 --bulk 模式：
+    python import_to_sqlite.py --bulk
+单连接完成建表和导入，导入期间临时使用 WAL/synchronous=OFF，
+每个大批次一个事务，索引在导入完成后再创建，最后输出导入速度（行/秒）
 """
 
-import sqlite3
+import argparse
+import hashlib
+import multiprocessing
+import re
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from report_parser import (AD_COLUMNS, DEFAULT_CHUNK_SIZE, iter_delimited_chunks,
+                           iter_report_chunks, report_format)
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import PRAGMA_PROFILES, apply_pragmas, connect, resolve_db_path
 
 # 配置信息
-# 数据库文件路径（固定路径）
-db_path = 'd:\\workflow\\data_sql\\my_database.db'
+# 数据库文件路径（见 db_config.json 中的 ad_report）
+db_path = resolve_db_path('ad_report')
 # SQL文件路径
 sql_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'union_all.sql')
 
+# ad_statistics 的自然键唯一索引，增量导入依赖它做 upsert，任何模式下都保留
+AD_STATISTICS_KEY_INDEX = (
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_ad_statistics_key ON ad_statistics (report_date, country)'
+)
+
+# ad_statistics 表的索引，bulk 模式下在导入完成后再创建
+AD_STATISTICS_INDEXES = {
+    'idx_ad_statistics_country': 'CREATE INDEX IF NOT EXISTS idx_ad_statistics_country ON ad_statistics (country)',
+    'idx_ad_statistics_source_file':
+        'CREATE INDEX IF NOT EXISTS idx_ad_statistics_source_file ON ad_statistics (source_file)',
+}
+
+# bulk 模式的 PRAGMA 配置，只在导入期间生效，结束后恢复原值
+BULK_PRAGMAS = PRAGMA_PROFILES['bulk']
+# bulk 模式每个事务提交的行数
+BULK_BATCH_SIZE = 500000
+
+# 并行解析时解析进程和写入线程之间的队列长度（以数据块计），限制内存占用
+QUEUE_SIZE = 16
+# 写入期间的 PRAGMA：各文件的暂存表放在临时文件里，避免大文件的暂存数据全部占用内存
+STAGE_PRAGMAS = {'temp_store': 'FILE'}
+
+# SQL 字面量报表解析出的每行写入 ad_statistics 的列（与 iter_file_messages 产出的数据行一致）
+AD_STAGE_COLUMNS = ['report_date'] + AD_COLUMNS + ['row_hash']
+
+# 文件名中的报表日期，如 20260114 / 2026-01-14
+REPORT_DATE_RE = re.compile(r'(20\d{2})-?(\d{2})-?(\d{2})')
+
 def create_directory_if_not_exists(directory):
     """如果目录不存在，就创建它"""
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
         print(f"创建目录: {directory}")
 
 
-def create_ad_statistics_table():
-    """创建广告数据表格"""
+def create_ad_statistics_table(conn=None, with_indexes=True):
+    """创建广告数据表格，conn 为空时自行打开和关闭连接"""
     # 确保数据库目录存在
     db_directory = os.path.dirname(db_path)
     create_directory_if_not_exists(db_directory)
-    
+
     # 连接数据库
-    conn = sqlite3.connect(db_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path, 'write')
     cursor = conn.cursor()
-    
+
     # 创建广告数据表
     create_table_sql = '''
     CREATE TABLE IF NOT EXISTS ad_statistics (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_date TEXT NOT NULL DEFAULT '',  -- 报表日期
         country TEXT,        -- 国家
         cost REAL,           -- 成本
         show_times INTEGER,  -- 展示次数
@@ -51,95 +115,631 @@ def create_ad_statistics_table():
         cvr REAL,            -- 转化率
         install INTEGER,     -- 安装量
         cpi REAL,            -- 每安装成本
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        row_hash TEXT,       -- 行内容哈希
+        source_file TEXT,    -- 来源文件
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+
+    # 源文件导入记录
+    create_files_sql = '''
+    CREATE TABLE IF NOT EXISTS import_files (
+        file_path TEXT PRIMARY KEY,  -- 源文件绝对路径
+        file_size INTEGER,           -- 文件大小
+        mtime_ns INTEGER,            -- 修改时间
+        content_hash TEXT,           -- 文件内容哈希
+        row_count INTEGER,           -- 解析出的行数
+        imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     '''
-    
+
     try:
         cursor.execute(create_table_sql)
+        cursor.execute(create_files_sql)
+        migrate_ad_statistics_table(conn)
+        if with_indexes:
+            create_ad_statistics_indexes(conn)
         conn.commit()
         print("广告数据表创建成功")
     except Exception as e:
         print(f"创建表格失败: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def parse_sql_data():
-    """解析SQL文件内容，提取数据行"""
-    # 直接返回硬编码的数据，因为SQL文件格式复杂
-    # 这样可以确保数据格式正确
-    return [
-        ['BR', '561.39', '565451', '0.99', '6593', '0.0117', '0.4335', '2858', '0.20'],
-        ['IN', '707', '1620638', '0.44', '5815', '0.0098', '0.159', '515', '0.28'],
-        ['US', '1246.23', '2333802', '0.54', '10472', '0.0098', '0.224', '892', '0.14'],
-        ['MX', '144.49', '232244', '0.64', '1220', '0.0098', '0.138', '103', '0.14']
-    ]
-
-def import_data():
-    """导入SQL数据到数据库"""
-    # 读取SQL文件
-    if not os.path.exists(sql_file_path):
-        print(f"错误：SQL文件不存在: {sql_file_path}")
-        return False
-    
-    with open(sql_file_path, 'r', encoding='utf-8') as f:
-        sql_content = f.read()
-    
-    # 解析SQL数据
-    data_rows = parse_sql_data()
-    
-    if not data_rows:
-        print("错误：没有提取到数据")
+
+def migrate_ad_statistics_table(conn):
+    """
+    升级旧版 ad_statistics 表：补齐增量导入需要的列，
+    按 (report_date, country) 去掉历史重复行（保留最新一条），再建唯一索引
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ad_statistics)")}
+    if 'report_date' not in columns:
+        conn.execute("ALTER TABLE ad_statistics ADD COLUMN report_date TEXT NOT NULL DEFAULT ''")
+    if 'row_hash' not in columns:
+        conn.execute("ALTER TABLE ad_statistics ADD COLUMN row_hash TEXT")
+    if 'source_file' not in columns:
+        conn.execute("ALTER TABLE ad_statistics ADD COLUMN source_file TEXT")
+    if 'updated_at' not in columns:
+        # ALTER TABLE 不允许非常量默认值，旧数据的更新时间用创建时间补齐
+        conn.execute("ALTER TABLE ad_statistics ADD COLUMN updated_at TIMESTAMP")
+        conn.execute("UPDATE ad_statistics SET updated_at = created_at")
+
+    has_key_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_ad_statistics_key'"
+    ).fetchone()
+    if not has_key_index:
+        cursor = conn.execute('''
+            DELETE FROM ad_statistics
+            WHERE id NOT IN (SELECT MAX(id) FROM ad_statistics GROUP BY report_date, country)
+        ''')
+        if cursor.rowcount > 0:
+            print(f"清理历史重复数据 {cursor.rowcount} 条")
+        conn.execute(AD_STATISTICS_KEY_INDEX)
+
+
+def create_ad_statistics_indexes(conn):
+    """创建 ad_statistics 表的索引"""
+    for index_sql in AD_STATISTICS_INDEXES.values():
+        conn.execute(index_sql)
+
+
+def drop_ad_statistics_indexes(conn):
+    """删除 ad_statistics 表的索引，避免导入时逐行维护索引（自然键唯一索引除外）"""
+    for index_name in AD_STATISTICS_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+
+def report_date_from_path(file_path):
+    """从文件名中提取报表日期（YYYY-MM-DD），没有日期时返回空字符串"""
+    m = REPORT_DATE_RE.search(os.path.basename(file_path))
+    return '-'.join(m.groups()) if m else ''
+
+
+def check_report_dates(files, report_date=None):
+    """
+    检查 SQL 字面量报表的报表日期，有问题时返回错误信息，否则返回 None
+    文件名中没有日期的文件需要 --report-date；--report-date 会用于所有 SQL 报表，
+    所以只能导入一个 SQL 报表（否则各文件会写到同一批自然键上互相覆盖）
+    """
+    reports = [path for path in files if report_format(path) == 'sql']
+    if report_date is None:
+        undated = [path for path in reports if not report_date_from_path(path)]
+        if undated:
+            return f"以下文件名中没有报表日期，请用 --report-date 指定: {', '.join(undated)}"
+    elif len(reports) > 1:
+        return f"--report-date 会用于所有 SQL 报表，只能导入一个，当前有 {len(reports)} 个: {', '.join(reports)}"
+    return None
+
+
+def check_import_files(paths, report_date=None):
+    """
+    导入前检查源文件：文件都存在、报表日期可用，返回 (文件列表, 错误信息)
+    需要在建表/升级旧表之前调用，检查不通过时数据库不会有任何改动
+    """
+    files = list_source_files(paths or [sql_file_path])
+    missing = [path for path in files if not os.path.exists(path)]
+    if missing:
+        return files, f"报表文件不存在: {', '.join(missing)}"
+    return files, check_report_dates(files, report_date)
+
+
+def adopt_legacy_rows(conn, report_date, source_file):
+    """
+    旧版导入的数据没有报表日期（report_date 为空，来自没有日期的 union_all.sql）：
+    用 --report-date 导入时把它们归到该日期和该文件下，之后按自然键正常 upsert；
+    该日期下已有的国家以现有数据为准，重复的旧数据删除
+    """
+    adopted = conn.execute(
+        "UPDATE OR IGNORE ad_statistics SET report_date = ?, source_file = ? WHERE report_date = ''",
+        (report_date, source_file)).rowcount
+    dropped = conn.execute("DELETE FROM ad_statistics WHERE report_date = ''").rowcount
+    if adopted or dropped:
+        print(f"旧数据归入报表日期 {report_date}: {adopted} 条，删除与该日期重复的旧数据 {dropped} 条")
+
+
+def file_content_hash(file_path, block_size=1 << 20):
+    """分块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_hash(row):
+    """计算数据行内容哈希，用于判断行是否变化"""
+    return hashlib.sha1('\x1f'.join(map(repr, row)).encode('utf-8')).hexdigest()
+
+
+def load_file_records(conn, files):
+    """一次查出所有源文件的导入记录：{file_path: (file_size, mtime_ns, content_hash)}"""
+    records = {}
+    for row in conn.execute("SELECT file_path, file_size, mtime_ns, content_hash FROM import_files"):
+        records[row[0]] = row[1:]
+    return {path: records[path] for path in files if path in records}
+
+
+def build_upsert_sql():
+    """
+    从暂存表按自然键 upsert，只有行哈希变化时才真正更新；{stage} 为暂存表名
+    （SELECT 带 WHERE true 是 SQLite 文档要求的写法，避免 ON CONFLICT 被当成连接条件）
+    """
+    columns = ', '.join(AD_STAGE_COLUMNS)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in AD_STAGE_COLUMNS[1:] + ['source_file'])
+    return (
+        f"INSERT INTO ad_statistics ({columns}, source_file, updated_at) "
+        f'SELECT {columns}, ?, CURRENT_TIMESTAMP FROM temp."{{stage}}" WHERE true ORDER BY rowid '
+        f"ON CONFLICT (report_date, country) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP "
+        f"WHERE ad_statistics.row_hash IS NOT excluded.row_hash "
+        f"OR ad_statistics.source_file IS NOT excluded.source_file"
+    )
+
+
+def list_source_files(paths):
+    """展开输入路径：目录下按文件名排序取所有支持格式（.sql/.tsv/.csv）的报表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if report_format(name):
+                    files.append(os.path.abspath(os.path.join(path, name)))
+        else:
+            files.append(os.path.abspath(path))
+    return files
+
+
+def table_name_for(file_path):
+    """TSV/CSV 报表写入的表名：report_ + 文件名（非法字符替换为下划线）"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return 'report_' + re.sub(r'\W', '_', stem).lower()
+
+
+def iter_file_messages(file_path, info, known_hash=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                       report_date=None):
+    """
+    解析单个源文件，产出写入线程需要处理的消息：
+    ('unchanged', 文件, info)            内容哈希与上次相同，不解析
+    ('rows', 文件, 表名, 列名, 数据行)     一批待写入的数据
+    ('done', 文件, info, 行数)            文件解析完成
+    """
+    info = dict(info, content_hash=file_content_hash(file_path))
+    if known_hash is not None and known_hash == info['content_hash']:
+        yield 'unchanged', file_path, info
+        return
+
+    file_rows = 0
+    if report_format(file_path) == 'sql':
+        file_date = report_date if report_date is not None else report_date_from_path(file_path)
+        if not file_date:
+            raise ValueError("文件名中没有报表日期，请用 --report-date 指定")
+        for chunk in iter_report_chunks(file_path, chunk_size=chunk_size):
+            rows = [(file_date,) + row + (row_hash(row),) for row in chunk]
+            file_rows += len(rows)
+            yield 'rows', file_path, 'ad_statistics', None, rows
+    else:
+        columns, chunks = iter_delimited_chunks(file_path, chunk_size=chunk_size)
+        for chunk in chunks:
+            rows = [(file_path, file_rows + i) + row for i, row in enumerate(chunk, 1)]
+            file_rows += len(rows)
+            yield 'rows', file_path, table_name_for(file_path), columns, rows
+    yield 'done', file_path, info, file_rows
+
+
+# 进程池中的解析进程通过这个队列把数据交给写入线程
+_worker_queue = None
+
+
+def _init_parse_worker(queue):
+    """解析进程初始化：保存共享队列"""
+    global _worker_queue
+    _worker_queue = queue
+
+
+def _safe_file_messages(file_path, *args):
+    """同 iter_file_messages，解析出错时产出 ('error', 文件, 错误信息) 而不是抛异常"""
+    try:
+        yield from iter_file_messages(file_path, *args)
+    except Exception as e:
+        yield 'error', file_path, f"{type(e).__name__}: {e}"
+
+
+def _parse_worker(*task):
+    """解析进程入口：把解析结果逐批放进有界队列，队列满时自动等待写入线程"""
+    for message in _safe_file_messages(*task):
+        _worker_queue.put(message)
+
+
+class ReportWriter:
+    """
+    唯一的 SQLite 写入者：处理解析消息，负责事务、建表和文件导入记录
+    每个文件的数据行先写入各自的临时暂存表（并行解析时不同文件的消息会交错到达），
+    文件解析完成后在该文件自己的 SAVEPOINT 中整体写入目标表，出错时回滚到 SAVEPOINT；
+    解析失败的文件只删除暂存表，已有数据不受影响
+    batch_size 为空时每个文件完成后提交一次；否则每 batch_size 行提交一次
+    """
+
+    def __init__(self, conn, batch_size=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.upsert_sql = build_upsert_sql()
+        self.stats = {'files': 0, 'skipped_files': 0, 'failed_files': 0, 'rows': 0, 'changed_rows': 0}
+        self.batch_rows = 0
+        self.table_columns = {}
+        # 正在解析的文件：{文件: (暂存表, 列名)}
+        self.stages = {}
+        self.stage_count = 0
+
+    def begin(self):
+        self.conn.execute("BEGIN")
+
+    def commit(self):
+        self.conn.execute("COMMIT")
+        self.conn.execute("BEGIN")
+        self.batch_rows = 0
+
+    def finish(self):
+        self.conn.execute("COMMIT")
+
+    def rollback(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def _ensure_report_table(self, table, columns):
+        """TSV/CSV 报表表：按表头建表，后续文件出现新列时自动补列"""
+        known = self.table_columns.get(table)
+        if known is None:
+            self.conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS "{table}" (
+                    source_file TEXT NOT NULL,  -- 源文件
+                    row_no INTEGER NOT NULL,    -- 文件内行号
+                    PRIMARY KEY (source_file, row_no)
+                )
+            ''')
+            known = {row[1] for row in self.conn.execute(f'PRAGMA table_info("{table}")')}
+            self.table_columns[table] = known
+        for column in columns:
+            if column not in known:
+                self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+                known.add(column)
+
+    def _stage_rows(self, file_path, table, columns, rows):
+        """把一批数据行写入该文件的暂存表（第一次写入时建表）"""
+        stage = self.stages.get(file_path)
+        if stage is None:
+            self.stage_count += 1
+            names = AD_STAGE_COLUMNS if table == 'ad_statistics' else ['source_file', 'row_no'] + columns
+            stage = (f'import_stage_{self.stage_count}', names)
+            quoted = ', '.join(f'"{name}"' for name in names)
+            self.conn.execute(f'CREATE TEMP TABLE "{stage[0]}" ({quoted})')
+            self.stages[file_path] = stage
+        self.conn.executemany(
+            f'INSERT INTO temp."{stage[0]}" VALUES ({", ".join("?" * len(stage[1]))})', rows)
+        self.stats['rows'] += len(rows)
+        self.batch_rows += len(rows)
+        if self.batch_size and self.batch_rows >= self.batch_size:
+            self.commit()
+
+    def _drop_stage(self, file_path):
+        stage = self.stages.pop(file_path, None)
+        if stage is not None:
+            self.conn.execute(f'DROP TABLE IF EXISTS temp."{stage[0]}"')
+        return stage
+
+    def _apply_stage(self, file_path, stage):
+        """
+        把暂存表写入目标表：ad_statistics 按自然键 upsert，TSV/CSV 报表先删掉该文件上次导入的行再整体写入
+        返回新增、更新或删除的报表行数（不含导入记录等其他写入）
+        """
+        if report_format(file_path) == 'sql':
+            if stage is None:
+                return self.conn.execute("DELETE FROM ad_statistics WHERE source_file = ?", (file_path,)).rowcount
+            changed = self.conn.execute(self.upsert_sql.format(stage=stage[0]), (file_path,)).rowcount
+            # 上次由这个文件写入、新版本中不再出现的行（例如少了一个国家）
+            self.conn.execute(f'CREATE INDEX temp."{stage[0]}_key" ON "{stage[0]}" (report_date, country)')
+            changed += self.conn.execute(f'''
+                DELETE FROM ad_statistics
+                WHERE source_file = ? AND NOT EXISTS (
+                    SELECT 1 FROM temp."{stage[0]}" AS stage
+                    WHERE stage.report_date = ad_statistics.report_date AND stage.country IS ad_statistics.country
+                )
+            ''', (file_path,)).rowcount
+            return changed
+        table = table_name_for(file_path)
+        if stage is not None:
+            self._ensure_report_table(table, stage[1][2:])
+        elif not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            return 0
+        # 文本报表整体重写：新版本的行数计为写入行数，没有新版本时计删除的行数
+        deleted = self.conn.execute(f'DELETE FROM "{table}" WHERE source_file = ?', (file_path,)).rowcount
+        if stage is None:
+            return deleted
+        names = ', '.join(f'"{name}"' for name in stage[1])
+        return self.conn.execute(f'INSERT INTO "{table}" ({names}) SELECT {names} FROM temp."{stage[0]}"').rowcount
+
+    def _record_file(self, file_path, info, row_count=None):
+        if row_count is None:
+            # 内容没变（例如只是被 touch 过），只更新大小和时间，下次可以走快速路径
+            self.conn.execute(
+                "UPDATE import_files SET file_size = ?, mtime_ns = ? WHERE file_path = ?",
+                (info['file_size'], info['mtime_ns'], file_path))
+            return
+        # 文件记录和数据行一起提交，中途失败时下次会重新导入
+        self.conn.execute('''
+            INSERT OR REPLACE INTO import_files (file_path, file_size, mtime_ns, content_hash, row_count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (file_path, info['file_size'], info['mtime_ns'], info['content_hash'], row_count))
+
+    def _finish_file(self, file_path, info, row_count):
+        """在该文件自己的 SAVEPOINT 中写入目标表和导入记录，出错时只回滚这个文件"""
+        self.conn.execute("SAVEPOINT import_file")
+        try:
+            changed = self._apply_stage(file_path, self.stages.get(file_path))
+            self._record_file(file_path, info, row_count)
+            self.conn.execute("RELEASE import_file")
+        except Exception:
+            self.conn.execute("ROLLBACK TO import_file")
+            self.conn.execute("RELEASE import_file")
+            raise
+        finally:
+            self._drop_stage(file_path)
+        self.stats['changed_rows'] += changed
+
+    def handle(self, message):
+        """处理一条消息，文件处理结束（完成/未变化/失败）时返回 True"""
+        kind, file_path = message[0], message[1]
+        if kind == 'rows':
+            self._stage_rows(file_path, *message[2:])
+            return False
+        if kind == 'unchanged':
+            self.stats['skipped_files'] += 1
+            self._record_file(file_path, message[2])
+            print(f"文件内容未变化，跳过: {file_path}")
+        elif kind == 'done':
+            self._finish_file(file_path, message[2], message[3])
+            if not self.batch_size:
+                self.commit()
+        elif kind == 'error':
+            self.stats['failed_files'] += 1
+            # 只丢弃这个文件的暂存数据，其他文件和已有数据不受影响
+            self._drop_stage(file_path)
+            print(f"解析文件失败 {file_path}: {message[2]}")
+        return True
+
+
+def _writer_loop(writer, queue, pending, errors):
+    """写入线程：从有界队列取消息写库，直到所有文件都处理完"""
+    try:
+        while pending > 0:
+            message = queue.get()
+            try:
+                writer.handle(message)
+            finally:
+                # 文件的最后一条消息处理失败（例如 COMMIT 时 SQLITE_BUSY）也算处理完，
+                # 否则下面的清空循环会一直等这个文件
+                if message[0] != 'rows':
+                    pending -= 1
+        writer.finish()
+    except Exception as e:
+        errors.append(e)
+        writer.rollback()
+        # 继续取走队列里的消息，避免解析进程阻塞在 put 上
+        while pending > 0:
+            message = queue.get()
+            if message[0] != 'rows':
+                pending -= 1
+
+
+def import_files(conn, files, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=None,
+                 report_date=None, force=False, workers=1):
+    """
+    增量导入多个源文件（conn 需为 isolation_level=None，由这里控制事务）
+    workers > 1 时用进程池并行解析，结果经有界队列交给唯一的写入线程；
+    conn 在写入线程中使用，需以 check_same_thread=False 打开
+    返回统计信息字典
+    """
+    records = {} if force else load_file_records(conn, files)
+    tasks = []
+    skipped = 0
+    for file_path in files:
+        stat = os.stat(file_path)
+        info = {'file_size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        record = records.get(file_path)
+        if record and record[0] == info['file_size'] and record[1] == info['mtime_ns']:
+            # 大小和修改时间都没变，连哈希都不用算
+            skipped += 1
+            continue
+        tasks.append((file_path, info, record[2] if record else None, chunk_size, report_date))
+    if skipped:
+        print(f"{skipped} 个文件未变化，已跳过")
+
+    writer = ReportWriter(conn, batch_size)
+    previous = apply_pragmas(conn, STAGE_PRAGMAS)
+    writer.begin()
+    try:
+        reports = [path for path in files if report_format(path) == 'sql']
+        if report_date is not None and reports:
+            # 和本次导入在同一个事务中，导入失败时一起回滚
+            adopt_legacy_rows(conn, report_date, reports[0])
+        _run_writer(writer, tasks, workers)
+    finally:
+        apply_pragmas(conn, previous)
+
+    writer.stats['files'] = len(files)
+    writer.stats['skipped_files'] += skipped
+    return writer.stats
+
+
+def _run_writer(writer, tasks, workers):
+    """串行或并行解析 tasks，由 writer 写库"""
+    if workers <= 1 or len(tasks) <= 1:
+        try:
+            for task in tasks:
+                for message in _safe_file_messages(*task):
+                    writer.handle(message)
+            writer.finish()
+        except Exception:
+            writer.rollback()
+            raise
+    else:
+        queue = multiprocessing.Queue(maxsize=QUEUE_SIZE)
+        errors = []
+        thread = threading.Thread(target=_writer_loop, args=(writer, queue, len(tasks), errors),
+                                  name='sqlite-writer', daemon=True)
+        thread.start()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(queue,)) as executor:
+            futures = {executor.submit(_parse_worker, *task): task[0] for task in tasks}
+            for future, file_path in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    # 解析进程异常退出时没有机会发消息，由这里补一条失败消息
+                    queue.put(('error', file_path, f"{type(e).__name__}: {e}"))
+        thread.join()
+        if errors:
+            raise errors[0]
+
+
+def print_import_stats(stats):
+    """输出导入统计"""
+    print(f"处理文件 {stats['files']} 个，跳过未变化文件 {stats['skipped_files']} 个，"
+          f"解析失败 {stats['failed_files']} 个")
+    print(f"解析 {stats['rows']} 条记录，新增或更新 {stats['changed_rows']} 条")
+
+
+def import_data(paths=None, chunk_size=DEFAULT_CHUNK_SIZE, report_date=None, force=False,
+                workers=1):
+    """流式解析报表文件，增量导入数据库"""
+    files, error = check_import_files(paths, report_date)
+    if error:
+        print(f"错误：{error}")
         return False
-    
-    # 连接数据库
-    conn = sqlite3.connect(db_path)
+
+    # 连接数据库，isolation_level=None：由 import_files 控制事务；
+    # 并行解析时连接交给写入线程使用
+    conn = connect(db_path, 'write', isolation_level=None, check_same_thread=False)
     cursor = conn.cursor()
-    
+
     try:
-        # 准备插入语句
-        insert_sql = "INSERT INTO ad_statistics (country, cost, show_times, cpm, click, ctr, cvr, install, cpi) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
-        
-        # 批量插入数据
-        cursor.executemany(insert_sql, data_rows)
-        conn.commit()
-        
-        print(f"数据导入成功，共导入 {len(data_rows)} 条记录")
-        
+        stats = import_files(conn, files, chunk_size=chunk_size,
+                             report_date=report_date, force=force, workers=workers)
+        print_import_stats(stats)
+
+        if stats['rows'] == 0 and stats['skipped_files'] == 0:
+            print("错误：没有提取到数据")
+            return False
+
         # 验证数据
-        cursor.execute("SELECT * FROM ad_statistics ORDER BY id DESC LIMIT 10")
+        cursor.execute("SELECT * FROM ad_statistics ORDER BY updated_at DESC, id DESC LIMIT 10")
         data = cursor.fetchall()
         print("导入的数据 (最近10条):")
         for row in data:
             print(row)
-        
+
         # 统计数据
         cursor.execute("SELECT COUNT(*) FROM ad_statistics")
         count = cursor.fetchone()[0]
         print(f"数据库中共有 {count} 条广告数据")
-        
+
         return True
-        
+
     except Exception as e:
         print(f"导入数据失败: {e}")
-        conn.rollback()
         return False
     finally:
         conn.close()
 
-def main():
+def bulk_import_data(paths=None, batch_size=BULK_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+                     report_date=None, force=False, workers=1):
+    """
+    大批量导入：单连接建表和写入，每 batch_size 行提交一次事务，
+    导入完成后再创建索引并恢复 PRAGMA，输出导入速度
+    """
+    files, error = check_import_files(paths, report_date)
+    if error:
+        print(f"错误：{error}")
+        return False
+
+    create_directory_if_not_exists(os.path.dirname(db_path))
+    # isolation_level=None：由 import_files 手动控制 BEGIN/COMMIT
+    conn = connect(db_path, 'write', isolation_level=None, check_same_thread=False)
+    previous = apply_pragmas(conn, BULK_PRAGMAS)
+
+    try:
+        create_ad_statistics_table(conn, with_indexes=False)
+        drop_ad_statistics_indexes(conn)
+
+        start = time.perf_counter()
+        stats = import_files(conn, files, chunk_size=chunk_size, batch_size=batch_size,
+                             report_date=report_date, force=force, workers=workers)
+        load_seconds = time.perf_counter() - start
+
+        # 数据写完后再建索引，比逐行维护索引快得多
+        index_start = time.perf_counter()
+        create_ad_statistics_indexes(conn)
+        index_seconds = time.perf_counter() - index_start
+
+        print_import_stats(stats)
+        if stats['rows'] == 0 and stats['skipped_files'] == 0:
+            print("错误：没有提取到数据")
+            return False
+
+        elapsed = load_seconds + index_seconds
+        print(f"写入耗时 {load_seconds:.2f} 秒，建索引耗时 {index_seconds:.2f} 秒，"
+              f"速度 {stats['rows'] / elapsed if elapsed else 0:,.0f} 行/秒")
+        return True
+
+    except Exception as e:
+        print(f"导入数据失败: {e}")
+        return False
+    finally:
+        apply_pragmas(conn, previous)
+        conn.close()
+
+def main(argv=None):
     """主函数"""
+    parser = argparse.ArgumentParser(description='将SQL报表数据导入到SQLite数据库')
+    parser.add_argument('paths', nargs='*',
+                        help='报表文件或目录（.sql/.tsv/.csv），默认导入 union_all.sql')
+    parser.add_argument('--bulk', action='store_true', help='大批量导入模式')
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+                        help='bulk 模式下每个事务提交的行数')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='每次 executemany 写入的行数')
+    parser.add_argument('--report-date', help='报表日期，默认从文件名中提取；文件名中没有日期时必须指定')
+    parser.add_argument('--force', action='store_true', help='忽略文件哈希，重新解析所有文件')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='并行解析的进程数，默认等于 CPU 核数')
+    args = parser.parse_args(argv)
+
     print("开始导入SQL数据到SQLite数据库...")
     print(f"数据库文件: {db_path}")
-    print(f"SQL文件: {sql_file_path}")
-    
-    # 创建表格
-    create_ad_statistics_table()
-    
-    # 导入数据
-    success = import_data()
-    
+    print(f"SQL文件: {', '.join(args.paths) if args.paths else sql_file_path}")
+
+    if args.bulk:
+        success = bulk_import_data(args.paths, batch_size=args.batch_size, chunk_size=args.chunk_size,
+                                   report_date=args.report_date, force=args.force,
+                                   workers=args.workers)
+    else:
+        # 先检查源文件和报表日期，检查不通过时不建表、不升级旧表
+        _, error = check_import_files(args.paths, args.report_date)
+        if error:
+            print(f"错误：{error}")
+            print("导入失败，请检查错误信息")
+            return
+
+        # 创建表格
+        create_ad_statistics_table()
+
+        # 导入数据
+        success = import_data(args.paths, chunk_size=args.chunk_size,
+                              report_date=args.report_date, force=args.force,
+                              workers=args.workers)
+
     if success:
         print("导入完成！")
     else:
@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接膨胀与键唯一性分析
+把 quality_check.sql 中手工执行的检查（join 前后行数、GROUP BY key HAVING count(*) > 1、
+定位膨胀的键）自动化：两张表各按连接键做一次哈希计数，在真正执行 join 之前给出
+键的重复分布、各种 join 的结果行数和膨胀最多的键
+
+说明：
+1. 每张表只读取连接键列，分块计算键的 64 位哈希并计数（不物化 join，内存只和不同键的数量有关）
+2. 连接键任一列为空的行在 SQL 中不会匹配任何行，单独计数（左连接时按 1 行保留）
+3. 键值规范化：整数值的浮点列（如 CSV 中带空值的整数列）按整数比较；
+   两边键的类型不同（如 role_id 一边是字符串一边是整数）时给出提示，此时几乎不会匹配，
+   缺失原因可用 anti-join 诊断进一步分析
+4. 结果行数
+   inner = Σ 左表键出现次数 × 右表键出现次数
+   left  = inner + 左表未匹配行（含空键）；right、full 同理
+5. 膨胀最多的键按 左次数 × 右次数 排序；其键值在计数完成后只对左表的键列再扫描一次取回
+6. 数据来源：DataFrame、CSV/TSV 文件，或 SQLite（"库名:表名" 或 "库名:SELECT ..."，库名见 db_config.json）
+7. 缺失诊断（--missing，对应 lose_problem.csv 中 left join 后记录缺失的原因）：
+   每边各扫描一次，保存不同的 (键哈希, 日期) 及行数、每个键的最早/最晚日期和规范化键哈希，
+   把没有匹配的行按原因分类：
+   null_key         连接键为空
+   type_mismatch    规范化后能匹配，两边键类型不同（如 role_id 一边是字符串一边是整数）
+   format_mismatch  规范化后能匹配，类型相同但格式不同（空格、大小写、1001.0、前导零）
+   date_condition   键存在，但对方没有满足日期条件（如 ltv.sql 的 reg_date <= pay_date）的行
+   out_of_range     键不存在，且本行日期超出对方数据的日期范围（多为两边的日期过滤不一致）
+   absent           键确实不存在
+   右表很大时可用 --bloom 把右表保存为 Bloom 过滤器（只判断键是否存在，不检查日期条件，
+   有约 fp_rate 的误判为匹配），此时只诊断左表
+
+用法：
+    python join_profiler.py active.csv ad.csv --on role_id
+    python join_profiler.py ad_report:active ad_report:ad --left-on role_id log_date --right-on role_id log_date
+    python join_profiler.py register.csv recharge.csv --on role_id --top 20
+    python join_profiler.py register.csv recharge.csv --on role_id --missing \
+        --left-date reg_date --right-date pay_date --date-condition "<="
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+DEFAULT_CHUNK_ROWS = 1000000
+DEFAULT_TOP = 20
+
+# 键计数合并的阈值：累计的分块去重结果超过该行数时合并一次
+COMPACT_ROWS = 5000000
+
+# 键重复次数分布的分组
+MULTIPLICITY_BINS = [1, 2, 3, 6, 11, 101, np.inf]
+MULTIPLICITY_LABELS = ['1', '2', '3-5', '6-10', '11-100', '>100']
+
+# 缺失诊断的分类
+CATEGORIES = {
+    'matched': '匹配',
+    'null_key': '连接键为空',
+    'type_mismatch': '类型不一致',
+    'format_mismatch': '格式不一致',
+    'date_condition': '日期条件不满足',
+    'out_of_range': '超出对方日期范围',
+    'absent': '对方不存在',
+}
+# 日期条件：左表日期 <op> 右表日期；诊断右表时取反向条件
+DATE_CONDITIONS = {'<=': '>=', '<': '>', '>=': '<=', '>': '<', '=': '='}
+DEFAULT_SAMPLES = 5
+DEFAULT_FP_RATE = 0.01
+
+# 没有日期（未指定日期列或日期为空）
+NO_DAY = np.iinfo(np.int64).min
+
+
+def iter_source(source, columns, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None):
+    """按块读取数据来源中的指定列：DataFrame、CSV/TSV 文件路径，或 "库名:表名/SELECT" 形式的 SQLite 查询"""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, max(len(source), 1), chunk_rows):
+            yield source[columns].iloc[start:start + chunk_rows]
+        return
+    if os.path.exists(source):
+        sep = '\t' if source.lower().endswith(('.tsv', '.txt')) else ','
+        yield from pd.read_csv(source, sep=sep, usecols=columns, dtype=dtype, chunksize=chunk_rows)
+        return
+    db_name, _, query = source.partition(':')
+    if not query:
+        raise ValueError(f"无法识别的数据来源: {source}（应为文件路径或 库名:表名）")
+    if not query.lstrip().lower().startswith('select'):
+        query = f'SELECT {", ".join(chr(34) + c + chr(34) for c in columns)} FROM "{query}"'
+    conn = get_connection(db_name, 'read')
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunk_rows):
+        chunk = chunk[columns]
+        # 与 read_csv 的 dtype 一致：空值保持为空
+        yield chunk.apply(lambda column: column.map(dtype, na_action='ignore')) if dtype else chunk
+
+
+def normalize_keys(frame):
+    """键值规范化：整数值的浮点列转为整数，使 1001.0 与 1001 相同"""
+    columns = {}
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_float_dtype(column) and len(column) and (column % 1 == 0).all():
+            column = column.astype(np.int64)
+        columns[name] = column.to_numpy()
+    return pd.DataFrame(columns)
+
+
+def hash_keys(frame):
+    """每行连接键的 64 位哈希（frame 中不应有空值）"""
+    return pd.util.hash_pandas_object(normalize_keys(frame), index=False).to_numpy()
+
+
+_DECIMAL_ZERO = re.compile(r'^([+-]?\d+)\.0*$')
+_LEADING_ZERO = re.compile(r'^0+(?=\d+$)')
+
+
+def _canonical_text(value):
+    text = str(value).strip().lower()
+    # 只有带小数点或以 0 开头的值才需要跑正则
+    if '.' in text or text.startswith('0'):
+        text = _LEADING_ZERO.sub('', _DECIMAL_ZERO.sub(r'\1', text))
+    return text
+
+
+def canonical_keys(frame):
+    """规范化键值：转成去空格的小写字符串，整数去掉 .0 和前导零"""
+    columns = {}
+    for name, column in normalize_keys(frame).items():
+        codes, uniques = pd.factorize(column)
+        if pd.api.types.is_integer_dtype(column):
+            text = uniques.astype(str).astype(object)
+        else:
+            text = np.array([_canonical_text(value) for value in np.asarray(uniques, dtype=object)], dtype=object)
+        columns[name] = text[codes]
+    return pd.DataFrame(columns)
+
+
+def _to_days(column):
+    """日期列转成天数（int64），空值为 NO_DAY；先对不同的值解析"""
+    codes, uniques = pd.factorize(column)
+    days = pd.to_datetime(pd.Series(uniques), errors='coerce').to_numpy().astype('datetime64[D]')
+    days = np.where(np.isnat(days), NO_DAY, days.astype(np.int64))
+    return np.where(codes >= 0, days[np.maximum(codes, 0)], NO_DAY)
+
+
+def _sorted_unique(values):
+    """排好序的不同值（比 np.unique 的哈希实现快）"""
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+
+def _pair_hash(hashes, days):
+    """(键哈希, 日期) 组合的哈希，用于等值日期条件"""
+    with np.errstate(over='ignore'):
+        return hashes ^ (days.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+def key_kinds(frame):
+    """每个键列的类型类别：数值列为 'number'，其他按实际值的 Python 类型"""
+    kinds = []
+    for name in frame.columns:
+        column = frame[name].dropna()
+        if pd.api.types.is_numeric_dtype(column):
+            kinds.append('number')
+        else:
+            kinds.append(type(column.iloc[0]).__name__ if len(column) else 'empty')
+    return kinds
+
+
+class KeyCounter:
+    """分块统计连接键的出现次数（按哈希），空键单独计数"""
+
+    def __init__(self, compact_rows=COMPACT_ROWS):
+        self.compact_rows = compact_rows
+        # 按哈希排序的不同键及其出现次数
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.rows = 0
+        self.null_rows = 0
+        self.kinds = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, keys):
+        """追加一块只含连接键列的 DataFrame"""
+        self.rows += len(keys)
+        null = keys.isna().any(axis=1).to_numpy()
+        self.null_rows += int(null.sum())
+        keys = keys[~null]
+        if not len(keys):
+            return
+        if self.kinds is None:
+            self.kinds = key_kinds(keys)
+        hashes, counts = np.unique(hash_keys(keys), return_counts=True)
+        self._pending.append((hashes, counts))
+        self._pending_rows += len(hashes)
+        if self._pending_rows >= self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        hashes = np.concatenate([self.hashes] + [h for h, _ in self._pending])
+        counts = np.concatenate([self.counts] + [c for _, c in self._pending])
+        order = np.argsort(hashes, kind='stable')
+        hashes, counts = hashes[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]]) if len(hashes) else np.zeros(0, dtype=np.int64)
+        self.hashes, self.counts = hashes[starts], np.add.reduceat(counts, starts) if len(starts) else counts
+        self._pending, self._pending_rows = [], 0
+
+    def finish(self):
+        """合并剩余的分块计数，返回自身"""
+        self._compact()
+        return self
+
+    def distribution(self):
+        """键重复次数分布：每组的不同键数和行数"""
+        groups = pd.cut(self.counts, MULTIPLICITY_BINS, right=False, labels=MULTIPLICITY_LABELS)
+        table = pd.DataFrame({'multiplicity': groups, 'keys': 1, 'rows': self.counts})
+        return table.groupby('multiplicity', observed=False)[['keys', 'rows']].sum()
+
+
+class KeySet:
+    """
+    一边数据的紧凑键集合：不同的 (键哈希, 日期) 及行数，
+    finish() 后另有每个键的最早/最晚日期和规范化键哈希，用于缺失诊断
+    """
+
+    def __init__(self, compact_rows=COMPACT_ROWS):
+        self.compact_rows = compact_rows
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.days = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.canonical = np.zeros(0, dtype=np.uint64)
+        self.rows = 0
+        self.null_rows = 0
+        self.kinds = None
+        self.min_day = self.max_day = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, keys, days=None):
+        """追加一块：keys 为只含连接键列的 DataFrame，days 为对应的天数数组（可选）"""
+        self.rows += len(keys)
+        null = keys.isna().any(axis=1).to_numpy()
+        self.null_rows += int(null.sum())
+        keys = keys[~null]
+        days = np.full(len(keys), NO_DAY, dtype=np.int64) if days is None else days[~null]
+        if not len(keys):
+            return
+        if self.kinds is None:
+            self.kinds = key_kinds(keys)
+        hashes = hash_keys(keys)
+        # 只对本块不同的键做规范化
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        unique_canonical = hash_keys(canonical_keys(keys.iloc[first]))
+        self._pending.append((hashes, days, np.ones(len(hashes), dtype=np.int64),
+                              unique_canonical[np.searchsorted(unique_hashes, hashes)]))
+        self._pending_rows += len(hashes)
+        if self._pending_rows >= self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [(self.hashes, self.days, self.counts, self.canonical)] + self._pending
+        hashes, days, counts, canonical = (np.concatenate(arrays) for arrays in zip(*parts))
+        order = np.lexsort((days, hashes))
+        hashes, days, counts, canonical = hashes[order], days[order], counts[order], canonical[order]
+        starts = (np.flatnonzero(np.r_[True, (hashes[1:] != hashes[:-1]) | (days[1:] != days[:-1])])
+                  if len(hashes) else np.zeros(0, dtype=np.int64))
+        self.hashes, self.days, self.canonical = hashes[starts], days[starts], canonical[starts]
+        self.counts = np.add.reduceat(counts, starts) if len(starts) else counts
+        self._pending, self._pending_rows = [], 0
+
+    def finish(self):
+        """合并分块结果，计算每个键的日期范围和规范化键集合，返回自身"""
+        self._compact()
+        key_start = (np.flatnonzero(np.r_[True, self.hashes[1:] != self.hashes[:-1]])
+                     if len(self.hashes) else np.zeros(0, dtype=np.int64))
+        self.key_hashes = self.hashes[key_start]
+        dated = self.days != NO_DAY
+        big = np.iinfo(np.int64).max
+        if len(key_start):
+            self.key_min_days = np.minimum.reduceat(np.where(dated, self.days, big), key_start)
+            self.key_max_days = np.maximum.reduceat(np.where(dated, self.days, NO_DAY), key_start)
+        else:
+            self.key_min_days = self.key_max_days = np.zeros(0, dtype=np.int64)
+        self.canonical_set = _sorted_unique(self.canonical)
+        self._pair_hashes = None
+        if dated.any():
+            self.min_day, self.max_day = int(self.days[dated].min()), int(self.days[dated].max())
+        return self
+
+    def contains(self, hashes):
+        """各键是否存在，以及存在时在 key_hashes 中的位置"""
+        position = np.minimum(np.searchsorted(self.key_hashes, hashes), max(len(self.key_hashes) - 1, 0))
+        found = (self.key_hashes[position] == hashes) if len(self.key_hashes) else np.zeros(len(hashes), dtype=bool)
+        return found, position
+
+    def contains_canonical(self, canonical):
+        position = np.minimum(np.searchsorted(self.canonical_set, canonical), max(len(self.canonical_set) - 1, 0))
+        return (self.canonical_set[position] == canonical) if len(self.canonical_set) else np.zeros(len(canonical), dtype=bool)
+
+    def date_matches(self, hashes, days, condition):
+        """已存在的键中，是否有日期满足 对方日期 <condition> 本集合日期 的行（与 SQL 相同，空日期不满足）"""
+        _, position = self.contains(hashes)
+        if condition == '=':
+            if self._pair_hashes is None:
+                self._pair_hashes = _sorted_unique(_pair_hash(self.hashes, self.days))
+            pairs = _pair_hash(hashes, days)
+            position = np.minimum(np.searchsorted(self._pair_hashes, pairs), max(len(self._pair_hashes) - 1, 0))
+            match = (self._pair_hashes[position] == pairs) if len(self._pair_hashes) else np.zeros(len(hashes), dtype=bool)
+        else:
+            compare = {'<=': np.less_equal, '<': np.less, '>=': np.greater_equal, '>': np.greater}[condition]
+            bound = self.key_max_days if condition in ('<=', '<') else self.key_min_days
+            match = compare(days, bound[position]) & (days != NO_DAY) & (bound[position] != NO_DAY)
+        return match
+
+
+class BloomFilter:
+    """按 64 位哈希工作的 Bloom 过滤器（双重哈希取 k 个位置）"""
+
+    def __init__(self, capacity, fp_rate=DEFAULT_FP_RATE):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)), 8)
+        self.k = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        low, high = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.k, dtype=np.uint64)
+        return (low[:, None] + steps * high[:, None]) % np.uint64(self.size)
+
+    def add(self, hashes):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def contains(self, hashes):
+        positions = self._positions(hashes)
+        bits = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=1)
+
+
+class BloomKeySet:
+    """只判断键（及规范化键）是否存在的 Bloom 版键集合，用于很大的对方表；不支持日期条件"""
+
+    def __init__(self, capacity, fp_rate=DEFAULT_FP_RATE):
+        self.exact = BloomFilter(capacity, fp_rate)
+        self.canonical = BloomFilter(capacity, fp_rate)
+        self.fp_rate = fp_rate
+        self.rows = 0
+        self.null_rows = 0
+        self.kinds = None
+        self.min_day = self.max_day = None
+
+    def add(self, keys, days=None):
+        self.rows += len(keys)
+        null = keys.isna().any(axis=1).to_numpy()
+        self.null_rows += int(null.sum())
+        keys = keys[~null]
+        if not len(keys):
+            return
+        if self.kinds is None:
+            self.kinds = key_kinds(keys)
+        hashes = hash_keys(keys)
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        self.exact.add(unique_hashes)
+        self.canonical.add(_sorted_unique(hash_keys(canonical_keys(keys.iloc[first]))))
+        if days is not None:
+            dated = days[~null][days[~null] != NO_DAY]
+            if len(dated):
+                low, high = int(dated.min()), int(dated.max())
+                self.min_day = low if self.min_day is None else min(self.min_day, low)
+                self.max_day = high if self.max_day is None else max(self.max_day, high)
+
+    def finish(self):
+        return self
+
+    def contains(self, hashes):
+        return self.exact.contains(hashes), None
+
+    def contains_canonical(self, canonical):
+        return self.canonical.contains(canonical)
+
+    def date_matches(self, hashes, days, condition):
+        return np.ones(len(hashes), dtype=bool)
+
+
+def build_key_set(source, columns, date_column=None, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None,
+                  bloom_capacity=None, fp_rate=DEFAULT_FP_RATE):
+    """扫描一次数据来源，构建键集合（bloom_capacity 不为空时为 Bloom 版）"""
+    key_set = BloomKeySet(bloom_capacity, fp_rate) if bloom_capacity else KeySet()
+    read_columns = columns + ([date_column] if date_column and date_column not in columns else [])
+    for chunk in iter_source(source, read_columns, chunk_rows, dtype):
+        days = _to_days(chunk[date_column]) if date_column else None
+        key_set.add(chunk[columns], days)
+    return key_set.finish()
+
+
+def classify_missing(side, other, condition=None):
+    """
+    把 side 的每个 (键, 日期) 按能否在 other 中匹配分类
+    返回 (分类数组, 与 side.hashes 对应)；空键行另见 side.null_rows
+    """
+    categories = np.full(len(side.hashes), 'absent', dtype=object)
+    found, _ = other.contains(side.hashes)
+    date_ok = np.ones(len(side.hashes), dtype=bool)
+    if condition and found.any():
+        date_ok[found] = other.date_matches(side.hashes[found], side.days[found], condition)
+    categories[found & date_ok] = 'matched'
+    categories[found & ~date_ok] = 'date_condition'
+
+    rest = ~found
+    canonical_found = np.zeros(len(side.hashes), dtype=bool)
+    canonical_found[rest] = other.contains_canonical(side.canonical[rest])
+    kinds_differ = side.kinds is not None and other.kinds is not None and side.kinds != other.kinds
+    categories[canonical_found] = 'type_mismatch' if kinds_differ else 'format_mismatch'
+
+    if other.min_day is not None:
+        outside = rest & ~canonical_found & (side.days != NO_DAY) & (
+            (side.days < other.min_day) | (side.days > other.max_day))
+        categories[outside] = 'out_of_range'
+    return categories
+
+
+def summarize_missing(side, categories):
+    """按分类汇总行数和不同键数"""
+    table = pd.DataFrame({'category': categories, 'hash': side.hashes, 'rows': side.counts})
+    summary = table.groupby('category').agg(rows=('rows', 'sum'), keys=('hash', 'nunique'))
+    summary.loc['null_key'] = [side.null_rows, 0]
+    summary = summary.reindex(list(CATEGORIES)).fillna(0).astype(np.int64)
+    summary['share'] = summary['rows'] / side.rows if side.rows else np.nan
+    summary.insert(0, 'label', [CATEGORIES[name] for name in summary.index])
+    return summary
+
+
+def _sample_keys(source, columns, hashes, categories, samples, chunk_rows, dtype):
+    """每个缺失分类取几个键值示例：{分类: [键值元组, ...]}"""
+    wanted = {}
+    for category in CATEGORIES:
+        if category in ('matched', 'null_key'):
+            continue
+        picked = pd.unique(hashes[categories == category])[:samples]
+        if len(picked):
+            wanted[category] = picked
+    if not wanted:
+        return {}
+    values = lookup_keys(source, columns, np.concatenate(list(wanted.values())), chunk_rows, dtype)
+    return {category: [values[h] for h in picked if h in values] for category, picked in wanted.items()}
+
+
+def diagnose_missing(left, right, left_on, right_on=None, left_date=None, right_date=None, condition=None,
+                     samples=DEFAULT_SAMPLES, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None,
+                     bloom_capacity=None, fp_rate=DEFAULT_FP_RATE):
+    """
+    诊断 left JOIN right ON left_on = right_on [AND left_date <condition> right_date] 中没有匹配的行
+    返回报告 dict：left / right 为各分类的行数、键数和占比，left_samples / right_samples 为键值示例
+    bloom_capacity 不为空时右表为 Bloom 过滤器，只诊断左表，且不检查日期条件
+    """
+    left_on = [left_on] if isinstance(left_on, str) else list(left_on)
+    right_on = left_on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+    if len(left_on) != len(right_on):
+        raise ValueError('左右连接键的列数必须相同')
+    if condition and condition not in DATE_CONDITIONS:
+        raise ValueError(f"日期条件应为 {', '.join(DATE_CONDITIONS)} 之一")
+    if condition and not (left_date and right_date):
+        raise ValueError('指定日期条件时需要 left_date 和 right_date')
+
+    started = time.perf_counter()
+    left_set = build_key_set(left, left_on, left_date, chunk_rows, dtype)
+    right_set = build_key_set(right, right_on, right_date, chunk_rows, dtype, bloom_capacity, fp_rate)
+
+    report = {'left_on': left_on, 'right_on': right_on, 'condition': condition,
+              'left_date': left_date, 'right_date': right_date, 'bloom': bool(bloom_capacity),
+              'left_kinds': left_set.kinds, 'right_kinds': right_set.kinds}
+    for name, side, other, source, columns, side_condition in (
+            ('left', left_set, right_set, left, left_on, condition),
+            ('right', right_set, left_set, right, right_on, DATE_CONDITIONS.get(condition))):
+        if not isinstance(side, KeySet):
+            report[name], report[f'{name}_samples'] = None, {}
+            continue
+        categories = classify_missing(side, other, side_condition)
+        report[name] = summarize_missing(side, categories)
+        report[f'{name}_samples'] = _sample_keys(source, columns, side.hashes, categories,
+                                                 samples, chunk_rows, dtype) if samples else {}
+        report[f'{name}_date_range'] = tuple(None if day is None else str(np.datetime64(day, 'D'))
+                                             for day in (side.min_day, side.max_day))
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def print_missing(report):
+    """输出缺失诊断报告"""
+    left_on, right_on = ', '.join(report['left_on']), ', '.join(report['right_on'])
+    condition = (f" AND {report['left_date']} {report['condition']} {report['right_date']}"
+                 if report['condition'] else '')
+    print(f"缺失诊断: 左表 ({left_on}) = 右表 ({right_on}){condition}，耗时 {report['seconds']:.2f}s")
+    if report['left_kinds'] != report['right_kinds']:
+        print(f"两边键的类型: 左 {report['left_kinds']}，右 {report['right_kinds']}")
+    if report['bloom']:
+        print("右表使用 Bloom 过滤器：只诊断左表，不检查日期条件，少量未匹配的行可能被误判为匹配")
+    for name, label in (('left', '左表'), ('right', '右表')):
+        summary = report[name]
+        if summary is None:
+            continue
+        date_range = report.get(f'{name}_date_range', (None, None))
+        print(f"{label}（日期范围 {date_range[0] or '-'} ~ {date_range[1] or '-'}）:")
+        print(summary.to_string(formatters={'share': '{:.2%}'.format}))
+        for category, values in report[f'{name}_samples'].items():
+            print(f"  {CATEGORIES[category]} 示例: {', '.join(str(v[0] if len(v) == 1 else v) for v in values)}")
+
+
+def count_keys(source, columns, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None):
+    """对一个数据来源的连接键做一次哈希计数"""
+    counter = KeyCounter()
+    for chunk in iter_source(source, columns, chunk_rows, dtype):
+        counter.add(chunk)
+    return counter.finish()
+
+
+def lookup_keys(source, columns, hashes, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None):
+    """再扫描一次键列，取回指定哈希对应的键值：{哈希: 键值元组}"""
+    wanted = np.asarray(sorted(hashes), dtype=np.uint64)
+    found = {}
+    for chunk in iter_source(source, columns, chunk_rows, dtype):
+        chunk = chunk.dropna()
+        if not len(chunk):
+            continue
+        chunk_hashes = hash_keys(chunk)
+        hit = np.isin(chunk_hashes, wanted)
+        for value, row in zip(chunk_hashes[hit], normalize_keys(chunk[hit]).itertuples(index=False, name=None)):
+            found.setdefault(value, row)
+        if len(found) == len(wanted):
+            break
+    return found
+
+
+def compare_counts(left, right, top=DEFAULT_TOP):
+    """由两边的键计数得到 join 结果行数和膨胀最多的键（只含哈希）"""
+    _, left_index, right_index = np.intersect1d(left.hashes, right.hashes, assume_unique=True, return_indices=True)
+    left_matched, right_matched = left.counts[left_index], right.counts[right_index]
+    products = left_matched * right_matched
+    inner = int(products.sum())
+    left_unmatched = left.rows - int(left_matched.sum())
+    right_unmatched = right.rows - int(right_matched.sum())
+
+    order = np.argsort(-products, kind='stable')[:top]
+    top_keys = pd.DataFrame({
+        'hash': left.hashes[left_index][order],
+        'left_count': left_matched[order],
+        'right_count': right_matched[order],
+        'join_rows': products[order],
+        'extra_rows': products[order] - left_matched[order],
+    })
+    top_keys = top_keys[top_keys['right_count'] > 1].reset_index(drop=True)
+    return {
+        'left_rows': left.rows,
+        'right_rows': right.rows,
+        'left_null_keys': left.null_rows,
+        'right_null_keys': right.null_rows,
+        'left_distinct': len(left.hashes),
+        'right_distinct': len(right.hashes),
+        'left_duplicate_keys': int((left.counts > 1).sum()),
+        'right_duplicate_keys': int((right.counts > 1).sum()),
+        'matched_keys': len(left_index),
+        'left_only_keys': len(left.hashes) - len(left_index),
+        'right_only_keys': len(right.hashes) - len(right_index),
+        'inner_rows': inner,
+        'left_join_rows': inner + left_unmatched,
+        'right_join_rows': inner + right_unmatched,
+        'full_join_rows': inner + left_unmatched + right_unmatched,
+        'left_expansion': (inner + left_unmatched) / left.rows if left.rows else np.nan,
+        'key_kinds_match': left.kinds is None or right.kinds is None or left.kinds == right.kinds,
+        'left_kinds': left.kinds,
+        'right_kinds': right.kinds,
+        'top_keys': top_keys,
+    }
+
+
+def profile_join(left, right, left_on, right_on=None, top=DEFAULT_TOP, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None):
+    """
+    在不执行 join 的情况下分析 left JOIN right ON left_on = right_on
+    返回报告 dict（行数、键唯一性、各种 join 的结果行数、膨胀最多的键及其键值、重复分布）
+    """
+    left_on = [left_on] if isinstance(left_on, str) else list(left_on)
+    right_on = left_on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+    if len(left_on) != len(right_on):
+        raise ValueError('左右连接键的列数必须相同')
+
+    started = time.perf_counter()
+    left_counter = count_keys(left, left_on, chunk_rows, dtype)
+    right_counter = count_keys(right, right_on, chunk_rows, dtype)
+    report = compare_counts(left_counter, right_counter, top)
+    report['left_on'], report['right_on'] = left_on, right_on
+
+    top_keys = report['top_keys']
+    values = lookup_keys(left, left_on, top_keys['hash'], chunk_rows, dtype) if len(top_keys) else {}
+    for position, column in enumerate(left_on):
+        top_keys.insert(position, column, [values.get(h, (None,) * len(left_on))[position] for h in top_keys['hash']])
+    report['top_keys'] = top_keys.drop(columns='hash')
+    report['distribution'] = pd.concat({'left': left_counter.distribution(), 'right': right_counter.distribution()},
+                                       axis=1)
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def print_profile(report):
+    """输出分析报告"""
+    left_on, right_on = ', '.join(report['left_on']), ', '.join(report['right_on'])
+    print(f"连接键: 左表 ({left_on}) = 右表 ({right_on})，分析耗时 {report['seconds']:.2f}s")
+    for side, name in (('left', '左表'), ('right', '右表')):
+        rows, distinct = report[f'{side}_rows'], report[f'{side}_distinct']
+        print(f"{name}: {rows} 行，空键 {report[f'{side}_null_keys']} 行，不同键 {distinct} 个，"
+              f"重复键 {report[f'{side}_duplicate_keys']} 个"
+              + ("（键唯一）" if report[f'{side}_duplicate_keys'] == 0 else ""))
+    print(f"匹配的键 {report['matched_keys']} 个，只在左表 {report['left_only_keys']} 个，"
+          f"只在右表 {report['right_only_keys']} 个")
+    if not report['key_kinds_match']:
+        print(f"警告：两边键的类型不同（左 {report['left_kinds']}，右 {report['right_kinds']}），"
+              f"值相同也不会匹配，请检查类型转换")
+    print(f"预计结果行数: inner {report['inner_rows']}，left {report['left_join_rows']}，"
+          f"right {report['right_join_rows']}，full {report['full_join_rows']}")
+    expansion = report['left_expansion']
+    print(f"left join 行数 / 左表行数 = {expansion:.4f}" + ("（数据膨胀）" if expansion > 1 else ""))
+    print("键重复次数分布:")
+    print(report['distribution'].to_string())
+    if len(report['top_keys']):
+        print("膨胀最多的键:")
+        print(report['top_keys'].to_string(index=False))
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='在执行 join 之前分析键唯一性和结果行数')
+    parser.add_argument('left', help='左表：CSV/TSV 文件，或 库名:表名 / 库名:SELECT ...')
+    parser.add_argument('right', help='右表：同上')
+    parser.add_argument('--on', nargs='+', help='两边同名的连接键')
+    parser.add_argument('--left-on', nargs='+', help='左表连接键')
+    parser.add_argument('--right-on', nargs='+', help='右表连接键')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help=f'输出膨胀最多的键的个数（默认 {DEFAULT_TOP}）')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='每块读取行数')
+    parser.add_argument('--as-string', action='store_true', help='键列按字符串读取（保留前导零等格式）')
+    parser.add_argument('--missing', action='store_true', help='诊断没有匹配的行（缺失原因分类）')
+    parser.add_argument('--left-date', help='左表日期列（缺失诊断）')
+    parser.add_argument('--right-date', help='右表日期列（缺失诊断）')
+    parser.add_argument('--date-condition', choices=list(DATE_CONDITIONS), help='连接中的日期条件：左表日期 <op> 右表日期')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='每个分类输出的键值示例数')
+    parser.add_argument('--bloom', type=int, help='右表用 Bloom 过滤器保存，参数为预计的不同键数')
+    parser.add_argument('--fp-rate', type=float, default=DEFAULT_FP_RATE, help='Bloom 过滤器误判率')
+    args = parser.parse_args(argv)
+
+    left_on = args.left_on or args.on
+    right_on = args.right_on or args.on
+    if not left_on or not right_on:
+        parser.error('需要 --on，或同时指定 --left-on 和 --right-on')
+    pd.set_option('display.width', 200)
+    if args.missing:
+        report = diagnose_missing(args.left, args.right, left_on, right_on, args.left_date, args.right_date,
+                                  args.date_condition, args.samples, args.chunk_rows,
+                                  dtype=str if args.as_string else None,
+                                  bloom_capacity=args.bloom, fp_rate=args.fp_rate)
+        print_missing(report)
+        return
+    report = profile_join(args.left, args.right, left_on, right_on, args.top, args.chunk_rows,
+                          dtype=str if args.as_string else None)
+    print_profile(report)
+
+if __name__ == "__main__":
+    main()
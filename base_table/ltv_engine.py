@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LTV 计算引擎（本地版 ltv.sql）
+用注册表和订单表计算各注册日期的 LTV1~LTVn 及子商品贡献度
+
+说明：
+1. 口径与 ltv.sql 一致
+   day_diff = pay_date - reg_date + 1，只统计 pay_date >= reg_date 的订单
+   LTVn = day_diff <= n 的充值金额 / 注册人数
+   子商品 LTVn = 该商品 day_diff <= n 的金额 / 该注册日期内购买过该商品的人数（item_user_cnt）
+2. 内部保存 注册日期 × day_diff 的每日金额矩阵（以及 注册日期 × 商品 × day_diff），
+   一次 cumsum 得到所有天数的累计值，LTV30、LTV90 与 LTV7 的代价相同（受 max_horizon 限制）
+3. 贡献度 = 商品累计金额 / 全部累计金额（即分母都取注册人数时的 item_ltv / ltv）
+4. 增量：add_day 追加一天的注册用户和当天的订单，只更新涉及的单元格，已有注册日期不重算
+5. 没有充值的用户只计入注册人数，不单独产生"空商品"行；
+   day_diff 超过 max_horizon 的订单不计入金额和购买人数
+
+用法：
+    python ltv_engine.py --register register.csv --recharge recharge.csv --horizons 1 3 7 30
+    register.csv: role_id, reg_date       recharge.csv: role_id, pay_date, item_name, money
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HORIZON = 90
+DEFAULT_HORIZONS = (1, 2, 3, 4, 5, 6, 7)
+
+# 商品编码在 (用户, 商品) 组合键中占用的位数
+_ITEM_BITS = 20
+
+
+def _to_days(values):
+    """日期列转成 datetime64[D] 数组"""
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+
+
+class LTVEngine:
+    """按注册日期维护每日充值矩阵的 LTV 引擎"""
+
+    def __init__(self, max_horizon=DEFAULT_HORIZON):
+        self.max_horizon = max_horizon
+        # 注册日期（队列）
+        self.cohort_dates = np.array([], dtype='datetime64[D]')
+        self.cohort_users = np.zeros(0, dtype=np.int64)
+        # 用户 -> 用户编码 -> 所属队列
+        self._roles = pd.Index([])
+        self._role_cohort = np.zeros(0, dtype=np.int64)
+        # 商品
+        self._items = pd.Index([])
+        # 每日金额：队列 × day_diff，队列 × 商品 × day_diff
+        self.revenue = np.zeros((0, max_horizon))
+        self.item_revenue = np.zeros((0, 0, max_horizon))
+        # 队列 × 商品 的购买人数，以及已计入的 (用户, 商品) 组合
+        self.item_users = np.zeros((0, 0), dtype=np.int64)
+        self._buyer_keys = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_frames(cls, register, recharge, max_horizon=DEFAULT_HORIZON):
+        """由注册表（role_id, reg_date）和订单表（role_id, pay_date, item_name, money）构建"""
+        engine = cls(max_horizon)
+        engine.add_registrations(register)
+        engine.add_recharges(recharge)
+        return engine
+
+    def _cohort_index(self, dates):
+        """返回各日期的队列下标，新日期追加为新队列"""
+        new_dates = np.setdiff1d(np.unique(dates), self.cohort_dates)
+        if len(new_dates):
+            self.cohort_dates = np.concatenate([self.cohort_dates, new_dates])
+            self.cohort_users = np.concatenate([self.cohort_users, np.zeros(len(new_dates), dtype=np.int64)])
+            grow = len(new_dates)
+            self.revenue = np.vstack([self.revenue, np.zeros((grow, self.max_horizon))])
+            self.item_revenue = np.concatenate(
+                [self.item_revenue, np.zeros((grow,) + self.item_revenue.shape[1:])], axis=0)
+            self.item_users = np.vstack([self.item_users, np.zeros((grow, self.item_users.shape[1]), dtype=np.int64)])
+        order = np.argsort(self.cohort_dates)
+        return order[np.searchsorted(self.cohort_dates, dates, sorter=order)]
+
+    def _item_index(self, names):
+        """返回各商品的编码，新商品追加"""
+        new_items = pd.Index(pd.unique(names)).difference(self._items)
+        if len(new_items):
+            self._items = self._items.append(new_items)
+            grow = len(new_items)
+            self.item_revenue = np.concatenate(
+                [self.item_revenue, np.zeros((self.item_revenue.shape[0], grow, self.max_horizon))], axis=1)
+            self.item_users = np.hstack([self.item_users, np.zeros((self.item_users.shape[0], grow), dtype=np.int64)])
+        return self._items.get_indexer(names)
+
+    def add_registrations(self, register):
+        """追加注册用户；已注册过的用户忽略（注册表应为首次登录）"""
+        register = register[['role_id', 'reg_date']].dropna()
+        register = register[~register['role_id'].isin(self._roles)]
+        dates = _to_days(register['reg_date'])
+        # 同一用户出现多次时取最早的注册日期
+        order = np.argsort(dates, kind='stable')
+        roles = register['role_id'].to_numpy()[order]
+        dates = dates[order]
+        roles, first = np.unique(roles, return_index=True)
+        dates = dates[first]
+        cohorts = self._cohort_index(dates)
+        self._roles = self._roles.append(pd.Index(roles))
+        self._role_cohort = np.concatenate([self._role_cohort, cohorts])
+        np.add.at(self.cohort_users, cohorts, 1)
+        return len(roles)
+
+    def add_recharges(self, recharge):
+        """追加订单：按 (队列, 商品, day_diff) 累加金额，只更新涉及的单元格"""
+        recharge = recharge[['role_id', 'pay_date', 'item_name', 'money']]
+        role_codes = self._roles.get_indexer(recharge['role_id'])
+        known = role_codes >= 0
+        recharge, role_codes = recharge[known], role_codes[known]
+        cohorts = self._role_cohort[role_codes]
+        day_diff = (_to_days(recharge['pay_date']) - self.cohort_dates[cohorts]).astype(np.int64) + 1
+        valid = (day_diff >= 1) & (day_diff <= self.max_horizon)
+        recharge, role_codes, cohorts, day_diff = recharge[valid], role_codes[valid], cohorts[valid], day_diff[valid]
+        money = pd.to_numeric(recharge['money'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+        np.add.at(self.revenue, (cohorts, day_diff - 1), money)
+        item_names = recharge['item_name'].fillna('').astype(str).to_numpy()
+        items = self._item_index(item_names)
+        np.add.at(self.item_revenue, (cohorts, items, day_diff - 1), money)
+
+        # 购买人数：只计入第一次出现的 (用户, 商品) 组合
+        keys = np.unique((role_codes.astype(np.int64) << _ITEM_BITS) | items)
+        new_keys = keys[~np.isin(keys, self._buyer_keys, assume_unique=True)]
+        if len(new_keys):
+            self._buyer_keys = np.union1d(self._buyer_keys, new_keys)
+            new_roles = new_keys >> _ITEM_BITS
+            new_items = new_keys & ((1 << _ITEM_BITS) - 1)
+            np.add.at(self.item_users, (self._role_cohort[new_roles], new_items), 1)
+        return int(valid.sum())
+
+    def add_day(self, register, recharge):
+        """追加一天：当天的新注册用户和当天的所有订单（含老用户的）"""
+        self.add_registrations(register)
+        return self.add_recharges(recharge)
+
+    def _sorted(self):
+        return np.argsort(self.cohort_dates)
+
+    def ltv_matrix(self):
+        """注册日期 × day_diff 的累计 LTV 矩阵（一次 cumsum）"""
+        order = self._sorted()
+        cumulative = np.cumsum(self.revenue[order], axis=1)
+        users = self.cohort_users[order].astype(np.float64)
+        ltv = np.divide(cumulative, users[:, None], out=np.full_like(cumulative, np.nan),
+                        where=users[:, None] > 0)
+        return pd.DataFrame(ltv, index=pd.Index(self.cohort_dates[order].astype(str), name='reg_date'),
+                            columns=[f"ltv_{d}d" for d in range(1, self.max_horizon + 1)])
+
+    def ltv_table(self, horizons=DEFAULT_HORIZONS):
+        """与 ltv.sql 的 ltv CTE 相同的表：reg_date, user_cnt, ltv_1d ..."""
+        self._check_horizons(horizons)
+        matrix = self.ltv_matrix()
+        table = matrix[[f"ltv_{d}d" for d in horizons]]
+        table.insert(0, 'user_cnt', self.cohort_users[self._sorted()])
+        return table.reset_index()
+
+    def _item_cumulative(self):
+        order = self._sorted()
+        return order, np.cumsum(self.item_revenue[order], axis=2)
+
+    def item_ltv_table(self, horizons=DEFAULT_HORIZONS):
+        """与 ltv.sql 的 item_ltv CTE 相同的表：reg_date, item_name, item_user_cnt, item_ltv_1d ..."""
+        self._check_horizons(horizons)
+        order, cumulative = self._item_cumulative()
+        users = self.item_users[order]
+        cohort_index, item_index = np.nonzero(users)
+        columns = {
+            'reg_date': self.cohort_dates[order][cohort_index].astype(str),
+            'item_name': self._items.to_numpy()[item_index],
+            'item_user_cnt': users[cohort_index, item_index],
+        }
+        for d in horizons:
+            columns[f"item_ltv_{d}d"] = cumulative[cohort_index, item_index, d - 1] / users[cohort_index, item_index]
+        return pd.DataFrame(columns).sort_values(['reg_date', 'item_name'], ignore_index=True)
+
+    def item_contribution(self, horizon=7):
+        """子商品 horizon 日贡献度：商品累计金额 / 全部累计金额"""
+        self._check_horizons([horizon])
+        order, cumulative = self._item_cumulative()
+        item_total = cumulative[:, :, horizon - 1]
+        total = item_total.sum(axis=1, keepdims=True)
+        share = np.divide(item_total, total, out=np.full_like(item_total, np.nan), where=total > 0)
+        cohort_index, item_index = np.nonzero(self.item_users[order])
+        return pd.DataFrame({
+            'reg_date': self.cohort_dates[order][cohort_index].astype(str),
+            'item_name': self._items.to_numpy()[item_index],
+            'contribution': share[cohort_index, item_index],
+        }).sort_values(['reg_date', 'item_name'], ignore_index=True)
+
+    def _check_horizons(self, horizons):
+        if max(horizons) > self.max_horizon or min(horizons) < 1:
+            raise ValueError(f"天数必须在 1~{self.max_horizon} 之间（max_horizon）")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='按注册日期计算 LTV 和子商品贡献度')
+    parser.add_argument('--register', required=True, help='注册表 CSV：role_id, reg_date')
+    parser.add_argument('--recharge', required=True, help='订单表 CSV：role_id, pay_date, item_name, money')
+    parser.add_argument('--horizons', type=int, nargs='*', default=list(DEFAULT_HORIZONS), help='LTV 天数')
+    parser.add_argument('--items', action='store_true', help='同时输出子商品 LTV 和贡献度')
+    args = parser.parse_args(argv)
+
+    engine = LTVEngine.from_frames(pd.read_csv(args.register), pd.read_csv(args.recharge),
+                                   max_horizon=max(max(args.horizons), 7))
+    pd.set_option('display.width', 260)
+    print(engine.ltv_table(args.horizons).to_string(index=False))
+    if args.items:
+        print(engine.item_ltv_table(args.horizons).to_string(index=False))
+        print(engine.item_contribution(max(args.horizons)).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+物化注册表（首次登录）
+在 ta_store 数据库中维护每个 role_id 一行的注册表：首次登录时间、注册日期、国家、时区、
+版本、包名和安装时间，每天新到的登录事件按主键查找后合并，下游报表不再对全部登录历史做
+row_number() over(partition by "#account_id" order by event_time)
+
+说明：
+1. 口径与 ltv.sql / benchmark.sql 中的 register 一致
+   登录事件为 lobby_enter、ta_app_start（--events 可改，如 gamehub.sql 的四个事件），
+   按 "#event_time" 取每个用户最早的一行；reg_date 为该行的 "$part_date"，
+   reg_local_time 为换算成 UTC+8 的本地时间（与 gamehub.sql 的 reg_local_time 相同）
+   与 SQL 的差别：SQL 只在查询区间内取第一次登录，区间开始前登录过的老用户也会算作区间内注册；
+   物化表从 START_DATE 起累计，是真正的首次登录
+2. 增量：每个分片先在 TA 端取分片内每个用户最早的一行，再在本地按 role_id 查已有的注册记录，
+   只写入新用户和首次登录时间更早的用户（迟到数据）；合并取最小值，重复处理同一天结果不变
+3. register_partitions 记录每天的注册人数；迟到窗口（LATENESS_DAYS）之前的分区标记为完整，
+   之后不再拉取，窗口内的分区每次刷新都重新合并
+4. register 以 role_id 为主键（WITHOUT ROWID），另有 reg_date 索引，按注册日期区间读取走索引
+5. register_meta 记录建表时使用的登录事件，事件列表不同时需要 --full 重建
+
+用法：
+    python register_table.py refresh                                   # 增量刷新到今天
+    python register_table.py refresh --full --events ta_app_start enter_game lobby_enter login_client
+    python register_table.py export --start 2025-12-29 --end 2026-01-07 --out register.csv
+    python register_table.py lookup 1001 1002
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+from join_profiler import normalize_keys
+from subgame_engine import to_local_time
+from ta_cache import LATENESS_DAYS, contiguous_ranges
+from ta_client import (DATE_FORMAT, DEFAULT_FETCH_WORKERS, DEFAULT_RETRIES, DEFAULT_SLICE_DAYS,
+                       date_range, date_slices, fetch_slices, parse_date)
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+STORE_DB = 'ta_store'
+START_DATE = '2025-12-29'
+
+# 与 ltv.sql / benchmark.sql 中 register 的登录事件一致
+LOGIN_EVENTS = ('lobby_enter', 'ta_app_start')
+
+# TA 列名 -> 注册表列名
+EVENT_COLUMNS = {
+    '#account_id': 'role_id',
+    '$part_date': 'reg_date',
+    '#event_time': 'reg_time',
+    '#country': 'country',
+    '#zone_offset': 'zone_offset',
+    '#app_version': 'app_version',
+    '#bundle_id': 'pack',
+    '#install_time': 'install_time',
+}
+REGISTER_COLUMNS = ['role_id', 'reg_date', 'reg_time', 'reg_local_time', 'country', 'zone_offset',
+                    'app_version', 'pack', 'install_time']
+
+# 时间统一保存为毫秒精度的字符串，字符串顺序即时间顺序
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# 按 role_id 查找时每条 SQL 的参数个数（SQLite 默认上限 999）
+LOOKUP_BATCH = 500
+
+
+def get_sql(start_date='{start_date}', end_date='{end_date}', events=LOGIN_EVENTS):
+    # register：只在分片内取每个用户最早的一行，跨分片的合并在本地完成
+    sql = '''
+        SELECT role_id, reg_date, reg_time, country, zone_offset, app_version, pack, install_time
+        FROM (
+            SELECT "#account_id" role_id, "$part_date" reg_date, "#event_time" reg_time, "#country" country,
+                "#zone_offset" zone_offset, "#app_version" app_version, "#bundle_id" pack,
+                "#install_time" install_time,
+                row_number() over(partition by "#account_id" order by "#event_time") rn
+            FROM v_event_4
+            WHERE "$part_event" IN ({events}) AND "$part_date" >= '{start_date}' AND "$part_date" <= '{end_date}'
+        ) t
+        WHERE rn = 1
+        '''.format(events=', '.join(f"'{event}'" for event in events), start_date=start_date, end_date=end_date)
+    return sql
+
+
+def create_tables(conn):
+    """创建注册表、分区记录表和元数据表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS register (
+        role_id TEXT PRIMARY KEY,
+        reg_date TEXT NOT NULL,
+        reg_time TEXT NOT NULL,
+        reg_local_time TEXT,
+        country TEXT,
+        zone_offset REAL,
+        app_version TEXT,
+        pack TEXT,
+        install_time TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_register_reg_date ON register (reg_date)")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS register_partitions (
+        log_date TEXT PRIMARY KEY,
+        new_users INTEGER NOT NULL,
+        is_final INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS register_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''')
+    conn.commit()
+
+
+def check_events(conn, events, rebuild=False):
+    """
+    检查登录事件是否与建表时一致；rebuild=True 时清空注册表并记录新的事件列表
+    已有数据的事件列表不同时抛出 ValueError（首次登录只能变早，换口径必须重建）
+    """
+    value = ','.join(sorted(events))
+    row = conn.execute("SELECT value FROM register_meta WHERE key = 'login_events'").fetchone()
+    if row and row[0] != value and not rebuild:
+        raise ValueError(f"注册表使用的登录事件为 {row[0]}，与 {value} 不同，请加 --full 重建")
+    if rebuild or not row:
+        try:
+            conn.execute("BEGIN")
+            if rebuild:
+                conn.execute("DELETE FROM register")
+                conn.execute("DELETE FROM register_partitions")
+            conn.execute("INSERT OR REPLACE INTO register_meta (key, value) VALUES ('login_events', ?)", (value,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def final_partitions(conn):
+    """已完整物化、不再刷新的分区"""
+    return {row[0] for row in conn.execute("SELECT log_date FROM register_partitions WHERE is_final = 1")}
+
+
+def _format_times(values):
+    times = pd.to_datetime(pd.Series(values), errors='coerce').reset_index(drop=True)
+    return times.dt.strftime(TIME_FORMAT).str[:-3].where(times.notna(), None)
+
+
+def role_keys(values):
+    """
+    role_id 统一转成字符串主键（values 中不应有空值）
+    分片中有空的 "#account_id" 时 read_csv 会把整列读成浮点数，先把整数值的浮点数转成整数，
+    否则同一个用户会以 "1001.0" 和 "1001" 写成两行
+    """
+    values = pd.Series(values).reset_index(drop=True)
+    return normalize_keys(values.to_frame('role_id'))['role_id'].astype(str)
+
+
+def first_logins(events):
+    """
+    每个用户最早的一次登录（列为 TA 列名或注册表列名均可）
+    返回 REGISTER_COLUMNS 列的 DataFrame，每个 role_id 一行
+    """
+    events = events.rename(columns=EVENT_COLUMNS)
+    logins = pd.DataFrame({column: events[column].reset_index(drop=True) if column in events else None
+                           for column in EVENT_COLUMNS.values()})
+    logins['reg_time'] = _format_times(logins['reg_time'])
+    logins = logins.dropna(subset=['role_id', 'reg_time'])
+    logins['role_id'] = role_keys(logins['role_id']).to_numpy()
+    logins = logins.sort_values('reg_time', kind='stable').drop_duplicates('role_id')
+    logins['reg_date'] = logins['reg_date'].astype(str).str[:10]
+    logins['zone_offset'] = pd.to_numeric(logins['zone_offset'], errors='coerce')
+    logins['reg_local_time'] = _format_times(to_local_time(logins['reg_time'], logins['zone_offset'])).to_numpy()
+    logins['install_time'] = _format_times(logins['install_time']).to_numpy()
+    return logins[REGISTER_COLUMNS].reset_index(drop=True)
+
+
+def lookup(role_ids, conn=None):
+    """按 role_id（主键）查注册记录，不存在的用户不返回"""
+    conn = conn or get_connection(STORE_DB, 'read')
+    role_ids = list(pd.unique(role_keys(pd.Series(role_ids).dropna())))
+    parts = []
+    for start in range(0, len(role_ids), LOOKUP_BATCH):
+        batch = role_ids[start:start + LOOKUP_BATCH]
+        parts.append(pd.read_sql_query(
+            f"SELECT {', '.join(REGISTER_COLUMNS)} FROM register WHERE role_id IN ({', '.join('?' * len(batch))})",
+            conn, params=batch))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=REGISTER_COLUMNS)
+
+
+def merge_first_logins(conn, dates, logins, cutoff):
+    """
+    把一批首次登录候选合并进注册表：只写入新用户和首次登录时间更早的用户
+    dates 为本批覆盖的分区，早于 cutoff 的标记为完整；返回 (新用户数, 提前的用户数)
+    """
+    existing = lookup(logins['role_id'], conn).set_index('role_id')['reg_time']
+    previous = logins['role_id'].map(existing)
+    is_new = previous.isna()
+    earlier = ~is_new & (logins['reg_time'] < previous.fillna(''))
+    changed = logins[is_new | earlier]
+    # 首次登录提前的用户，原来的注册日期人数也要重新统计
+    affected = set(dates) | set(changed['reg_date']) | set(lookup(logins.loc[earlier, 'role_id'], conn)['reg_date'])
+    rows = list(changed.astype(object).where(changed.notna(), None).itertuples(index=False, name=None))
+    try:
+        conn.execute("BEGIN")
+        conn.executemany(f'''
+        INSERT INTO register ({', '.join(REGISTER_COLUMNS)}, updated_at)
+        VALUES ({', '.join('?' * len(REGISTER_COLUMNS))}, CURRENT_TIMESTAMP)
+        ON CONFLICT(role_id) DO UPDATE SET
+            {', '.join(f'{column} = excluded.{column}' for column in REGISTER_COLUMNS[1:])},
+            updated_at = CURRENT_TIMESTAMP
+        WHERE excluded.reg_time < register.reg_time
+        ''', rows)
+        placeholders = ', '.join('?' * len(affected))
+        counts = dict(conn.execute(f'''
+            SELECT reg_date, COUNT(*) FROM register WHERE reg_date IN ({placeholders}) GROUP BY reg_date
+            ''', sorted(affected)).fetchall()) if affected else {}
+        final = {date: int(date < cutoff) for date in dates}
+        conn.executemany('''
+        INSERT INTO register_partitions (log_date, new_users, is_final, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(log_date) DO UPDATE SET
+            new_users = excluded.new_users,
+            is_final = MAX(is_final, excluded.is_final),
+            updated_at = CURRENT_TIMESTAMP
+        ''', [(date, counts.get(date, 0), final.get(date, 0)) for date in sorted(affected)])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return int(is_new.sum()), int(earlier.sum())
+
+
+def _cutoff(today=None, lateness_days=LATENESS_DAYS):
+    today = parse_date(today or datetime.date.today())
+    return (today - datetime.timedelta(days=lateness_days)).strftime(DATE_FORMAT)
+
+
+def update_from_events(events, login_events=LOGIN_EVENTS, lateness_days=LATENESS_DAYS, today=None):
+    """用本地的原始登录事件（如 ta_sync 同步的分区）更新注册表，返回 (新用户数, 提前的用户数)"""
+    conn = get_connection(STORE_DB, 'write')
+    create_tables(conn)
+    check_events(conn, login_events)
+    if '$part_event' in events:
+        events = events[events['$part_event'].isin(login_events)]
+    logins = first_logins(events)
+    dates = sorted(events['$part_date'].astype(str).str[:10].unique()) if '$part_date' in events else []
+    return merge_first_logins(conn, dates, logins, _cutoff(today, lateness_days))
+
+
+def refresh(start_date=START_DATE, end_date=None, lateness_days=LATENESS_DAYS, full=False, today=None,
+            events=LOGIN_EVENTS, slice_days=DEFAULT_SLICE_DAYS, max_workers=DEFAULT_FETCH_WORKERS,
+            retries=DEFAULT_RETRIES):
+    """
+    增量刷新到 end_date（默认今天）：拉取尚未完整物化的分区并合并，返回新用户数
+    full=True 时清空注册表后重新拉取；拉取失败的分区保持原样，下次刷新重试
+    """
+    end_date = end_date or datetime.date.today().strftime(DATE_FORMAT)
+    cutoff = _cutoff(today, lateness_days)
+    conn = get_connection(STORE_DB, 'write')
+    create_tables(conn)
+    check_events(conn, events, rebuild=full)
+
+    done = final_partitions(conn)
+    pending = [date for date in date_range(start_date, end_date) if date not in done]
+    if not pending:
+        print(f"{start_date}~{end_date} 的分区都已物化，无需刷新")
+        return 0
+    slices = [piece for start, end in contiguous_ranges(pending) for piece in date_slices(start, end, slice_days)]
+    print(f"刷新 {len(pending)} 个分区（{cutoff} 及之后的分区每次重新合并），共 {len(slices)} 个分片")
+    ordered, failed = fetch_slices(get_sql(events=events), slices, max_workers, retries)
+
+    new_users = earlier_users = 0
+    for piece, logins in ordered:
+        added, moved = merge_first_logins(conn, date_range(*piece), first_logins(logins), cutoff)
+        new_users += added
+        earlier_users += moved
+    if failed:
+        print(f"警告：{len(failed)} 个分片拉取失败，下次刷新重试: "
+              f"{', '.join(f'{start}~{end}' for (start, end), _ in failed)}")
+    print(f"新增 {new_users} 个用户，{earlier_users} 个用户的首次登录提前")
+    return new_users
+
+
+def load_register(start_date=None, end_date=None, conn=None):
+    """按注册日期区间读取注册表（走 reg_date 索引），可直接替代 SQL 中的 register"""
+    conn = conn or get_connection(STORE_DB, 'read')
+    conditions, params = [], []
+    if start_date:
+        conditions.append('reg_date >= ?')
+        params.append(parse_date(start_date).strftime(DATE_FORMAT))
+    if end_date:
+        conditions.append('reg_date <= ?')
+        params.append(parse_date(end_date).strftime(DATE_FORMAT))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return pd.read_sql_query(f"SELECT {', '.join(REGISTER_COLUMNS)} FROM register {where} ORDER BY reg_date, reg_time",
+                             conn, params=params)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='物化注册表（首次登录）的增量维护和查询')
+    subparsers = parser.add_subparsers(dest='command')
+
+    refresh_parser = subparsers.add_parser('refresh', help='从 TA 增量刷新注册表')
+    refresh_parser.add_argument('--start', default=START_DATE, help=f'开始日期（默认 {START_DATE}）')
+    refresh_parser.add_argument('--end', help='结束日期（默认今天）')
+    refresh_parser.add_argument('--full', action='store_true', help='清空注册表后重新拉取')
+    refresh_parser.add_argument('--events', nargs='+', default=list(LOGIN_EVENTS), help='登录事件')
+    refresh_parser.add_argument('--lateness-days', type=int, default=LATENESS_DAYS,
+                                help=f'迟到窗口天数（默认 {LATENESS_DAYS}）')
+
+    export_parser = subparsers.add_parser('export', help='按注册日期区间导出注册表')
+    export_parser.add_argument('--start', help='注册开始日期')
+    export_parser.add_argument('--end', help='注册结束日期')
+    export_parser.add_argument('--out', help='保存为 CSV')
+
+    lookup_parser = subparsers.add_parser('lookup', help='按 role_id 查注册记录')
+    lookup_parser.add_argument('role_ids', nargs='+', help='role_id 列表')
+    args = parser.parse_args(argv)
+
+    if args.command == 'refresh':
+        refresh(args.start, args.end, args.lateness_days, args.full, events=args.events)
+        return
+    if args.command == 'export':
+        table = load_register(args.start, args.end)
+    elif args.command == 'lookup':
+        table = lookup(args.role_ids)
+    else:
+        parser.print_help()
+        return
+    pd.set_option('display.width', 200)
+    print(table.head(50).to_string(index=False))
+    print(f"共 {len(table)} 行")
+    if getattr(args, 'out', None):
+        table.to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报表解析模块
+流式解析 SELECT ... UNION (SELECT ...) 形式的字面量报表（如 union_all.sql）
+
+说明：
+1. 按块读取文件，用正则逐行匹配，内存占用与文件大小无关
+2. 只提取全部由字面量组成的 select 行，含字段名/函数的查询语句会被跳过
+3. 百分比字面量（如 1.17%）转换为小数（0.0117）
+4. "总计" 汇总行默认跳过，避免与明细行重复计算
+5. 按 chunk_size 分批产出已转换类型的元组，可直接交给 executemany
+
+另外支持 result.tsv / ltv.csv 这类分隔符文本报表（iter_delimited_chunks）：
+自动识别表头行，数字转换成 int/float，空单元格转为 None
+"""
+
+import csv
+import itertools
+import os
+import re
+
+# ad_statistics 表的字段顺序及类型
+AD_COLUMNS = ['country', 'cost', 'show_times', 'cpm', 'click', 'ctr', 'cvr', 'install', 'cpi']
+AD_COLUMN_TYPES = {
+    'country': str,
+    'cost': float,
+    'show_times': int,
+    'cpm': float,
+    'click': int,
+    'ctr': float,
+    'cvr': float,
+    'install': int,
+    'cpi': float,
+}
+
+# 报表中的汇总行标识
+TOTAL_LABEL = '总计'
+
+# 支持的报表文件类型
+REPORT_FORMATS = {'.sql': 'sql', '.tsv': 'tsv', '.csv': 'csv'}
+
+# 默认读取块大小（字符）和每批行数
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_CHUNK_SIZE = 5000
+
+# select 列表在这些关键字处结束
+_END_KEYWORDS = r'(?:union|from|where|select|group|order|limit|having)\b'
+
+# 字符串写成展开形式（'[^']*(?:''[^']*)*'），整段非引号字符一次匹配，不必逐字符尝试分支
+_STRING = r"'[^']*(?:''[^']*)*'" + r'|"[^"]*(?:""[^"]*)*"'
+_LITERAL = r"""(?:""" + _STRING + r"""|[-+]?(?:\d+(?:\.\d*)?|\.\d+)%?|null\b)"""
+_ALIAS = r'(?:\s+as\b)?\s+(?!' + _END_KEYWORDS + r')[^\W\d]\w*'
+_ITEM = _LITERAL + r'(?:' + _ALIAS + r')?'
+_GAP = r'(?:\s|--[^\n]*|/\*.*?\*/)*'
+
+# 整个 select 列表都是字面量时才匹配，其余的查询语句不会命中
+_ROW_RE = re.compile(
+    r'\bselect\b' + _GAP
+    + r'(?P<items>' + _ITEM + r'(?:' + _GAP + r',' + _GAP + _ITEM + r')*)'
+    + r'(?=' + _GAP + r'(?:[);]|' + _END_KEYWORDS + r'|\Z))',
+    re.IGNORECASE | re.DOTALL)
+
+# 常见的简单行（没有别名和注释、字符串中没有逗号，如 union_all.sql 中的 (select "IN",707,...)）
+# 走快速路径：一次匹配后按逗号拆分，不再逐项跑 _ITEM_RE；其余的行用 _ROW_RE + _parse_items
+_PLAIN_LITERAL = (r"""(?:'[^',]*(?:''[^',]*)*'|"[^",]*(?:""[^",]*)*"|[-+]?(?:\d+(?:\.\d*)?|\.\d+)%?|null\b)""")
+_PLAIN_ROW_RE = re.compile(
+    r'\bselect\s+(?P<items>' + _PLAIN_LITERAL + r'(?:\s*,\s*' + _PLAIN_LITERAL + r')*)'
+    + r'(?=\s*(?:[);]|' + _END_KEYWORDS + r'|\Z))',
+    re.IGNORECASE)
+
+# 扫描时只在候选位置停下：select 的首字母、引号、注释开头；其余字符直接跳过
+_CANDIDATE_RE = re.compile(r"""[sS'"/-]""")
+# 字符串和注释整体跳过，避免把其中的 select 当成语句
+_SKIP_RE = re.compile(_STRING + r'|--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+_ITEM_RE = re.compile(
+    r'(?P<literal>' + _LITERAL + r')(?:(?:\s+as\b)?\s+(?P<alias>[^\W\d]\w*))?',
+    re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_SELECT_RE = re.compile(r'\bselect\b', re.IGNORECASE)
+
+
+def _parse_items(items):
+    """拆分字面量 select 列表，返回 (字面量文本列表, 别名列表)"""
+    if '--' in items or '/*' in items:
+        items = _COMMENT_RE.sub(' ', items)
+    pairs = _ITEM_RE.findall(items)
+    return [literal for literal, _ in pairs], [alias.lower() for _, alias in pairs]
+
+
+def _iter_rows(buf, end):
+    """
+    在 buf[:end] 中按顺序查找字面量 select 行，产出 (值列表, 别名列表)
+    先用单字符类跳到下一个候选位置，只在候选位置尝试匹配字符串/注释或 select 行，
+    避免在每个字符上都尝试整个正则分支；s 开头但不是 select 的位置只做一次字符串比较
+    """
+    search = _CANDIDATE_RE.search
+    pos = 0
+    while True:
+        m = search(buf, pos, end)
+        if m is None:
+            return
+        start = m.start()
+        char = buf[start]
+        if char in 'sS':
+            if buf[start:start + 6].lower() == 'select':
+                row = _PLAIN_ROW_RE.match(buf, start, end)
+                if row is not None:
+                    items = row.group('items').split(',')
+                    yield [item.strip() for item in items], [''] * len(items)
+                    pos = row.end()
+                    continue
+                row = _ROW_RE.match(buf, start, end)
+                if row is not None:
+                    yield _parse_items(row.group('items'))
+                    pos = row.end()
+                    continue
+        else:
+            skip = _SKIP_RE.match(buf, start, end)
+            if skip is not None:
+                pos = skip.end()
+                continue
+        pos = start + 1
+
+
+def _split_point(buf):
+    """
+    找到可以安全解析到的位置：最后一个 select 所在行的行首；
+    没有 select 时退回到最后一个换行符，避免截断注释或关键字
+    用 lower() + rfind 从末尾往前找，再用 _SELECT_RE 确认词边界，不必对整个缓冲区跑正则
+    """
+    # IGNORECASE 下 ſ（U+017F）也与 s 匹配，一并换成 s（长度不变）
+    lowered = buf.lower().replace('\u017f', 's')
+    last = -1
+    if len(lowered) == len(buf):
+        last = lowered.rfind('select')
+        while last >= 0 and not _SELECT_RE.match(buf, last):
+            last = lowered.rfind('select', 0, last)
+    else:
+        # 个别字符转小写后长度会变，位置对不上，退回逐个匹配
+        for m in _SELECT_RE.finditer(buf):
+            last = m.start()
+    if last < 0:
+        return buf.rfind('\n') + 1
+    line_start = buf.rfind('\n', 0, last) + 1
+    return line_start if line_start > 0 else last
+
+
+def iter_select_literals(f, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    按块读取文件对象，产出其中字面量 select 行的 (值列表, 别名列表)
+
+    每次只解析到缓冲区中最后一个 select 之前，剩余部分与下一块拼接后再解析，
+    因此跨越块边界的行不会被截断
+    """
+    buf = ''
+    while True:
+        block = f.read(block_size)
+        eof = not block
+        buf += block
+        cut = len(buf) if eof else _split_point(buf)
+        yield from _iter_rows(buf, cut)
+        buf = buf[cut:]
+        if eof:
+            break
+
+
+def _convert(text, column_type):
+    """把字面量文本转换为目标列类型，百分比（如 1.17%）转为小数"""
+    if text[0] in '\'"':
+        text = text[1:-1].replace(text[0] * 2, text[0])
+        if column_type is str:
+            return text
+        text = text.strip()
+    elif column_type is str:
+        return None if text.lower() == 'null' else text
+    elif text.lower() == 'null':
+        return None
+    if text.endswith('%'):
+        # 用科学计数法换算，避免 1.17 / 100 产生 0.011699999999999999
+        value = float(text[:-1] + 'e-2')
+    elif column_type is int:
+        try:
+            return int(text)
+        except ValueError:
+            value = float(text)
+    else:
+        value = float(text)
+    return int(value) if column_type is int else value
+
+
+def _converter(column_type):
+    """返回列类型对应的转换函数，常见的不带引号数字走快速路径"""
+    if column_type is str:
+        return lambda text: _convert(text, str)
+
+    def convert(text):
+        try:
+            return column_type(text)
+        except ValueError:
+            return _convert(text, column_type)
+    return convert
+
+
+def iter_report_rows(file_path, columns=AD_COLUMNS, column_types=AD_COLUMN_TYPES,
+                     skip_total=True, block_size=DEFAULT_BLOCK_SIZE, encoding='utf-8'):
+    """
+    逐行产出报表中的数据，每行是按 columns 顺序排列、已转换类型的元组
+
+    同一个 UNION 链中，首个 select 的别名（如 'BR' as country）决定列的对应关系，
+    后续没有别名的 select 按位置对应
+    """
+    converters = [_converter(column_types[column]) for column in columns]
+    plan = list(zip(converters, range(len(columns))))
+    label_index = columns.index('country') if 'country' in columns else 0
+    skipped = 0
+    with open(file_path, 'r', encoding=encoding) as f:
+        for values, aliases in iter_select_literals(f, block_size):
+            if len(values) != len(columns):
+                skipped += 1
+                continue
+            if all(aliases) and sorted(aliases) == sorted(columns):
+                plan = list(zip(converters, [aliases.index(column) for column in columns]))
+            try:
+                row = tuple([convert(values[i]) for convert, i in plan])
+            except ValueError:
+                skipped += 1
+                continue
+            if skip_total and row[label_index] == TOTAL_LABEL:
+                continue
+            yield row
+    if skipped:
+        print(f"警告：{file_path} 中有 {skipped} 行无法解析，已跳过")
+
+
+def iter_report_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """按 chunk_size 分批产出报表数据行（列表），用于 executemany 批量写入"""
+    chunk = []
+    for row in iter_report_rows(file_path, **kwargs):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def report_format(file_path):
+    """根据扩展名判断报表格式，不支持的格式返回 None"""
+    return REPORT_FORMATS.get(os.path.splitext(file_path)[1].lower())
+
+
+def _infer_value(text):
+    """分隔符文本中的单元格：空值转 None，数字转 int/float，其余保留字符串"""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        if text.endswith('%'):
+            return float(text[:-1] + 'e-2')
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _pick_header(rows):
+    """
+    在前几行中找表头：第一个非空单元格不少于一半的行
+    （ltv.csv 第一行是“注册表/订单表”这样的分组标题，第二行才是字段名）
+    """
+    for i, row in enumerate(rows):
+        filled = sum(1 for cell in row if cell.strip())
+        if row and filled * 2 >= len(row):
+            return i
+    return 0
+
+
+def _column_names(header):
+    """整理表头：去掉空列名，重复列名加序号，返回 (列下标列表, 列名列表)"""
+    indexes, names, seen = [], [], {}
+    for i, cell in enumerate(header):
+        name = cell.strip()
+        if not name:
+            continue
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}_{seen[name]}"
+        indexes.append(i)
+        names.append(name)
+    return indexes, names
+
+
+def iter_delimited_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=None,
+                          encoding='utf-8-sig', header_scan_rows=10):
+    """
+    流式读取 TSV/CSV 报表，返回 (列名列表, 数据块迭代器)
+    数据块是按列名顺序排列的元组列表；全空的行会被跳过
+    """
+    if delimiter is None:
+        delimiter = '\t' if report_format(file_path) == 'tsv' else ','
+    f = open(file_path, 'r', encoding=encoding, newline='')
+    reader = csv.reader(f, delimiter=delimiter)
+    head = list(itertools.islice(reader, header_scan_rows))
+    header_index = _pick_header(head)
+    indexes, columns = _column_names(head[header_index] if head else [])
+
+    def chunks():
+        with f:
+            chunk = []
+            for row in itertools.chain(head[header_index + 1:], reader):
+                values = tuple(_infer_value(row[i]) if i < len(row) else None for i in indexes)
+                if all(value is None for value in values):
+                    continue
+                chunk.append(values)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    return columns, chunks()
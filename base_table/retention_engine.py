@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+留存计算引擎（位图）
+每个用户保存一个相对注册日期的活跃位图：第 k 位表示注册后第 k+1 天（day_diff = k+1）是否活跃，
+留存类指标都转换成位运算，不再依赖远程 SQL 的窗口函数
+
+说明：
+1. 口径与 gamehub.sql 一致
+   day_diff = 活跃日期 - 注册日期 + 1，注册当天为第 1 天
+   is_keepN：第 N 天活跃；lt_cnt：前 7 天的活跃天数
+2. 位图按 64 天一个 uint64 保存，window_days 决定能计算的最大天数（默认 128 天）
+3. 支持的查询
+   N 日留存（第 N 天活跃）、滚动留存（第 N 天及之后任一天活跃）、任意天数区间内活跃、
+   注册日期 × 天数 的留存矩阵、每个用户的 is_keep2..7 / lt_cnt
+4. 未满 N 天的注册日期（注册日期 + N - 1 晚于最后活跃日期 as_of），N 日留存为空
+5. 增量：add_registrations / add_activity 可按天追加，已有位图只做按位或
+
+用法：
+    python retention_engine.py --register register.csv --logins logins.csv --days 2 3 7 30
+    register.csv: role_id, reg_date       logins.csv: role_id, log_date
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_WINDOW_DAYS = 128
+DEFAULT_DAYS = (2, 3, 4, 5, 6, 7)
+_WORD_BITS = 64
+
+
+def _to_days(values):
+    """日期列转成 datetime64[D] 数组"""
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+
+
+class RetentionEngine:
+    """按用户保存活跃位图的留存引擎"""
+
+    def __init__(self, window_days=DEFAULT_WINDOW_DAYS):
+        self.words = -(-window_days // _WORD_BITS)
+        self.window_days = self.words * _WORD_BITS
+        self._roles = pd.Index([])
+        self.reg_dates = np.array([], dtype='datetime64[D]')
+        self.bits = np.zeros((0, self.words), dtype=np.uint64)
+        # 最后一天有活跃数据的日期，用于判断各注册日期是否已满 N 天
+        self.as_of = None
+        # 注册日期分组（排序结果），新增注册用户后重新计算
+        self._cohort_cache = None
+
+    @classmethod
+    def from_frames(cls, register, logins, window_days=DEFAULT_WINDOW_DAYS):
+        """由注册表（role_id, reg_date）和登录表（role_id, log_date）构建"""
+        engine = cls(window_days)
+        engine.add_registrations(register)
+        engine.add_activity(logins)
+        return engine
+
+    def add_registrations(self, register):
+        """追加注册用户；已注册过的用户忽略，同一用户出现多次时取最早的日期"""
+        register = register[['role_id', 'reg_date']].dropna()
+        register = register[~register['role_id'].isin(self._roles)]
+        dates = _to_days(register['reg_date'])
+        order = np.argsort(dates, kind='stable')
+        roles, first = np.unique(register['role_id'].to_numpy()[order], return_index=True)
+        self._roles = self._roles.append(pd.Index(roles))
+        self.reg_dates = np.concatenate([self.reg_dates, dates[order][first]])
+        self.bits = np.vstack([self.bits, np.zeros((len(roles), self.words), dtype=np.uint64)])
+        self._cohort_cache = None
+        return len(roles)
+
+    def add_activity(self, logins):
+        """追加活跃记录（role_id, log_date），对应位置为 1；未注册用户和窗口外的日期忽略"""
+        users = self._roles.get_indexer(logins['role_id'])
+        dates = _to_days(logins['log_date'])
+        known = users >= 0
+        users, dates = users[known], dates[known]
+        if len(dates):
+            latest = dates.max()
+            self.as_of = latest if self.as_of is None else max(self.as_of, latest)
+        offset = (dates - self.reg_dates[users]).astype(np.int64)
+        valid = (offset >= 0) & (offset < self.window_days)
+        self._set_bits(users[valid], offset[valid])
+        return int(valid.sum())
+
+    def _set_bits(self, users, offset):
+        """把 users 各自第 offset 位（day_diff = offset + 1）置为 1"""
+        masks = np.left_shift(np.uint64(1), (offset % _WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(self.bits, (users, offset // _WORD_BITS), masks)
+
+    def _range_mask(self, first_day, last_day):
+        """day_diff 在 [first_day, last_day] 内的位掩码（每个 word 一个 uint64）"""
+        masks = np.zeros(self.words, dtype=np.uint64)
+        first, last = max(first_day - 1, 0), min(last_day, self.window_days) - 1
+        for word in range(self.words):
+            low, high = max(first, word * _WORD_BITS), min(last, word * _WORD_BITS + _WORD_BITS - 1)
+            if low > high:
+                continue
+            width = high - low + 1
+            block = np.uint64(0xFFFFFFFFFFFFFFFF) if width == _WORD_BITS else np.uint64((1 << width) - 1)
+            masks[word] = block << np.uint64(low - word * _WORD_BITS)
+        return masks
+
+    def active_between(self, first_day, last_day):
+        """每个用户在 day_diff 为 [first_day, last_day] 的任一天是否活跃（bool 数组）"""
+        masks = self._range_mask(first_day, last_day)
+        active = np.zeros(len(self.bits), dtype=bool)
+        # 只检查掩码覆盖到的 word
+        for word in np.flatnonzero(masks):
+            active |= (self.bits[:, word] & masks[word]) != 0
+        return active
+
+    def retained(self, day, rolling=False):
+        """N 日留存（第 N 天活跃）；rolling=True 时为第 N 天及之后任一天活跃"""
+        return self.active_between(day, self.window_days if rolling else day)
+
+    def active_days(self, first_day=1, last_day=7):
+        """每个用户在 [first_day, last_day] 内的活跃天数"""
+        masked = self.bits & self._range_mask(first_day, last_day)
+        counts = np.unpackbits(masked.view(np.uint8), axis=1)
+        return counts.sum(axis=1)
+
+    def user_flags(self, days=DEFAULT_DAYS, lt_days=7):
+        """每个用户的 is_keepN 和 lt_cnt（与 gamehub.sql 中的同名列一致）"""
+        flags = {'role_id': self._roles.to_numpy(), 'reg_date': self.reg_dates.astype(str)}
+        for day in days:
+            flags[f"is_keep{day}"] = self.retained(day).astype(np.int8)
+        flags['lt_cnt'] = self.active_days(1, lt_days)
+        return pd.DataFrame(flags)
+
+    def _mature(self, cohort_dates, day):
+        """注册日期是否已满 day 天"""
+        if self.as_of is None:
+            return np.zeros(len(cohort_dates), dtype=bool)
+        return cohort_dates + np.timedelta64(day - 1, 'D') <= self.as_of
+
+    def _cohorts(self):
+        """注册日期分组：(按注册日期排序的用户下标, 注册日期, 各组起始位置, 每个用户的组号, 各组人数)"""
+        if self._cohort_cache is None:
+            order = np.argsort(self.reg_dates, kind='stable')
+            cohort_dates, starts = np.unique(self.reg_dates[order], return_index=True)
+            users = np.diff(np.append(starts, len(order)))
+            cohorts = np.empty(len(order), dtype=np.int64)
+            cohorts[order] = np.repeat(np.arange(len(cohort_dates)), users)
+            self._cohort_cache = (order, cohort_dates, starts, cohorts, users)
+        return self._cohort_cache
+
+    def cohort_retention(self, days=DEFAULT_DAYS, rolling=False):
+        """按注册日期汇总：user_cnt 和各天的留存率（未满天数为空）"""
+        _, cohort_dates, _, cohorts, users = self._cohorts()
+        table = {'reg_date': cohort_dates.astype(str), 'user_cnt': users}
+        prefix = 'rolling_keep' if rolling else 'keep'
+        for day in days:
+            kept = np.bincount(cohorts, weights=self.retained(day, rolling), minlength=len(cohort_dates))
+            rate = kept / np.maximum(users, 1)
+            rate[~self._mature(cohort_dates, day)] = np.nan
+            table[f"{prefix}_{day}d"] = rate
+        return pd.DataFrame(table)
+
+    def cohort_matrix(self, max_day=30):
+        """注册日期 × day_diff（1..max_day）的留存率矩阵，一次解包位图后按注册日期分段求和"""
+        max_day = min(max_day, self.window_days)
+        order, cohort_dates, starts, _, users = self._cohorts()
+        # 只解包前 max_day 位所在的字节；小端序解包后第 k 列即 day_diff = k + 1
+        n_bytes = -(-max_day // 8)
+        packed = self.bits.view(np.uint8)[order, :n_bytes]
+        active = np.unpackbits(packed, axis=1, bitorder='little')[:, :max_day]
+        kept = (np.add.reduceat(active, starts, axis=0, dtype=np.int64) if len(order)
+                else np.zeros((0, max_day)))
+        rates = kept / np.maximum(users, 1)[:, None]
+        for day in range(1, max_day + 1):
+            rates[~self._mature(cohort_dates, day), day - 1] = np.nan
+        matrix = pd.DataFrame(rates, index=pd.Index(cohort_dates.astype(str), name='reg_date'),
+                              columns=[f"day{day}" for day in range(1, max_day + 1)])
+        matrix.insert(0, 'user_cnt', users)
+        return matrix
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='用活跃位图计算留存')
+    parser.add_argument('--register', required=True, help='注册表 CSV：role_id, reg_date')
+    parser.add_argument('--logins', required=True, help='登录表 CSV：role_id, log_date')
+    parser.add_argument('--days', type=int, nargs='*', default=list(DEFAULT_DAYS), help='留存天数')
+    parser.add_argument('--rolling', action='store_true', help='滚动留存（第 N 天及之后任一天活跃）')
+    parser.add_argument('--matrix', type=int, help='输出注册日期 × 天数的留存矩阵，指定最大天数')
+    args = parser.parse_args(argv)
+
+    engine = RetentionEngine.from_frames(pd.read_csv(args.register), pd.read_csv(args.logins),
+                                         window_days=max(DEFAULT_WINDOW_DAYS, max(args.days), args.matrix or 0))
+    pd.set_option('display.width', 260)
+    print(engine.cohort_retention(args.days, args.rolling).to_string(index=False))
+    if args.matrix:
+        print(engine.cohort_matrix(args.matrix).round(4).to_string())
+
+if __name__ == "__main__":
+    main()
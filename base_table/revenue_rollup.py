@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日分国家订单总额的物化汇总（本地版 month_lastdate.sql）
+在 ta_store 数据库中维护 (log_date, country) 粒度的订单总额，按分区增量更新，
+月末、周末、月累计（MTD）、季累计（QTD）等日历查询都走主键索引，不再重新扫描事件
+
+说明：
+1. 口径与 month_lastdate.sql 一致
+   log_date 为 "$part_date"，country 为 "#country"（空值记为空字符串），money 为 cast(game_id as int)
+   月末：log_date 为当月最后一天的行（没有数据的月末不输出）
+2. 汇总在 TA 端完成，每个分区只传回 (log_date, country) 几百行；也可以用 update_from_events
+   把本地已有的原始事件（如 ta_sync 同步的分区）汇总后写入
+3. 增量：revenue_partitions 表记录已物化的分区；迟到窗口（LATENESS_DAYS）之前的分区标记为完整，
+   之后不再拉取，窗口内的分区每次刷新都整天替换
+4. daily_country_revenue 以 (log_date, country) 为主键（WITHOUT ROWID），
+   月末/周末查询按日期列表点查，MTD/QTD 按日期区间范围扫描
+
+用法：
+    python revenue_rollup.py refresh                                   # 增量刷新到今天
+    python revenue_rollup.py month-end --start 2025-12-29 --end 2026-01-07 --out result.tsv
+    python revenue_rollup.py week-end --start 2025-12-29 --end 2026-01-07
+    python revenue_rollup.py mtd --date 2026-01-07
+    python revenue_rollup.py qtd --date 2026-01-07
+"""
+
+import argparse
+import calendar
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+from ta_cache import LATENESS_DAYS, contiguous_ranges
+from ta_client import (DATE_FORMAT, DEFAULT_FETCH_WORKERS, DEFAULT_RETRIES, DEFAULT_SLICE_DAYS,
+                       date_range, date_slices, fetch_slices, parse_date)
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+STORE_DB = 'ta_store'
+START_DATE = '2025-12-29'
+
+# 与 month_lastdate.sql 中 recharge 的定义一致
+MONEY_EXPR = 'cast(game_id as int)'
+EVENT_NAME = 'game_end'
+
+# result.tsv 的日期格式
+OUTPUT_DATE_FORMAT = '%Y/%m/%d'
+# week-end 默认以周日为一周的最后一天（Monday=0）
+WEEK_END_DAY = 6
+
+
+def get_sql(start_date='{start_date}', end_date='{end_date}'):
+    # recharge2：在 TA 端按 (log_date, country) 汇总，每个分区只返回几百行
+    sql = '''
+        SELECT "$part_date" log_date, "#country" country, sum({money}) total_money, count(*) order_cnt
+        FROM v_event_4
+        WHERE "$part_event"='{event}' AND "$part_date">='{start_date}' AND "$part_date"<='{end_date}'
+        GROUP BY 1, 2
+        '''.format(money=MONEY_EXPR, event=EVENT_NAME, start_date=start_date, end_date=end_date)
+    return sql
+
+
+def create_tables(conn):
+    """创建汇总表和分区记录表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS daily_country_revenue (
+        log_date TEXT NOT NULL,
+        country TEXT NOT NULL,
+        total_money REAL NOT NULL,
+        order_cnt INTEGER NOT NULL,
+        PRIMARY KEY (log_date, country)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS revenue_partitions (
+        log_date TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL,
+        total_money REAL NOT NULL,
+        is_final INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+def final_partitions(conn):
+    """已完整物化、不再刷新的分区"""
+    return {row[0] for row in conn.execute("SELECT log_date FROM revenue_partitions WHERE is_final = 1")}
+
+
+def aggregate_events(events, money_column='game_id'):
+    """把原始 game_end 事件汇总成 (log_date, country, total_money, order_cnt)"""
+    data = pd.DataFrame({
+        'log_date': events['$part_date'].astype(str).str[:10],
+        'country': events['#country'].fillna('').astype(str) if '#country' in events else '',
+        'money': pd.to_numeric(events[money_column], errors='coerce').fillna(0).astype('int64'),
+    })
+    return (data.groupby(['log_date', 'country'], sort=True)['money']
+            .agg(total_money='sum', order_cnt='size').reset_index())
+
+
+def replace_partitions(conn, dates, daily, cutoff):
+    """在一个事务内整天替换 dates 的汇总数据；早于 cutoff 的分区标记为完整"""
+    daily = daily.assign(log_date=daily['log_date'].astype(str).str[:10],
+                         country=daily['country'].fillna('').astype(str))
+    rows = list(daily[['log_date', 'country', 'total_money', 'order_cnt']].itertuples(index=False, name=None))
+    totals = daily.groupby('log_date')['total_money'].agg(['size', 'sum'])
+    try:
+        conn.execute("BEGIN")
+        conn.executemany("DELETE FROM daily_country_revenue WHERE log_date = ?", [(date,) for date in dates])
+        conn.executemany('''
+        INSERT INTO daily_country_revenue (log_date, country, total_money, order_cnt) VALUES (?, ?, ?, ?)
+        ON CONFLICT(log_date, country) DO UPDATE SET
+            total_money = total_money + excluded.total_money,
+            order_cnt = order_cnt + excluded.order_cnt
+        ''', rows)
+        conn.executemany('''
+        INSERT INTO revenue_partitions (log_date, row_count, total_money, is_final, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(log_date) DO UPDATE SET
+            row_count = excluded.row_count,
+            total_money = excluded.total_money,
+            is_final = excluded.is_final,
+            updated_at = CURRENT_TIMESTAMP
+        ''', [(date,
+               int(totals.loc[date, 'size']) if date in totals.index else 0,
+               float(totals.loc[date, 'sum']) if date in totals.index else 0.0,
+               int(date < cutoff)) for date in dates])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def _cutoff(today=None, lateness_days=LATENESS_DAYS):
+    today = parse_date(today or datetime.date.today())
+    return (today - datetime.timedelta(days=lateness_days)).strftime(DATE_FORMAT)
+
+
+def update_from_events(events, lateness_days=LATENESS_DAYS, today=None, money_column='game_id'):
+    """用本地的原始事件更新汇总（事件中出现的分区整天替换），返回写入的行数"""
+    conn = get_connection(STORE_DB, 'write')
+    create_tables(conn)
+    daily = aggregate_events(events, money_column)
+    dates = sorted(daily['log_date'].unique())
+    return replace_partitions(conn, dates, daily, _cutoff(today, lateness_days))
+
+
+def refresh(start_date=START_DATE, end_date=None, lateness_days=LATENESS_DAYS, full=False, today=None,
+            slice_days=DEFAULT_SLICE_DAYS, max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    增量刷新到 end_date（默认今天）：拉取尚未完整物化的分区，返回写入的行数
+    full=True 时重新拉取区间内的所有分区；拉取失败的分区保持原样，下次刷新重试
+    """
+    end_date = end_date or datetime.date.today().strftime(DATE_FORMAT)
+    cutoff = _cutoff(today, lateness_days)
+    conn = get_connection(STORE_DB, 'write')
+    create_tables(conn)
+
+    done = set() if full else final_partitions(conn)
+    pending = [date for date in date_range(start_date, end_date) if date not in done]
+    if not pending:
+        print(f"{start_date}~{end_date} 的分区都已物化，无需刷新")
+        return 0
+    slices = [piece for start, end in contiguous_ranges(pending) for piece in date_slices(start, end, slice_days)]
+    print(f"刷新 {len(pending)} 个分区（{cutoff} 及之后的分区每次重新汇总），共 {len(slices)} 个分片")
+    ordered, failed = fetch_slices(get_sql(), slices, max_workers, retries)
+
+    written = 0
+    for piece, daily in ordered:
+        if not len(daily):
+            daily = pd.DataFrame(columns=['log_date', 'country', 'total_money', 'order_cnt'])
+        written += replace_partitions(conn, date_range(*piece), daily, cutoff)
+    if failed:
+        print(f"警告：{len(failed)} 个分片拉取失败，下次刷新重试: "
+              f"{', '.join(f'{start}~{end}' for (start, end), _ in failed)}")
+    print(f"写入 {written} 行")
+    return written
+
+
+def month_ends(start_date, end_date):
+    """区间内每个月的最后一天"""
+    start, end = parse_date(start_date), parse_date(end_date)
+    dates = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        if start <= last <= end:
+            dates.append(last.strftime(DATE_FORMAT))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return dates
+
+
+def week_ends(start_date, end_date, week_end_day=WEEK_END_DAY):
+    """区间内每周的最后一天（week_end_day：Monday=0 ... Sunday=6）"""
+    start, end = parse_date(start_date), parse_date(end_date)
+    day = start + datetime.timedelta(days=(week_end_day - start.weekday()) % 7)
+    dates = []
+    while day <= end:
+        dates.append(day.strftime(DATE_FORMAT))
+        day += datetime.timedelta(days=7)
+    return dates
+
+
+def revenue_on(dates, conn=None):
+    """指定日期（主键点查）的分国家订单总额：last_date, country, total_money"""
+    conn = conn or get_connection(STORE_DB, 'read')
+    if not dates:
+        return pd.DataFrame(columns=['last_date', 'country', 'total_money'])
+    placeholders = ', '.join('?' * len(dates))
+    return pd.read_sql_query(f'''
+        SELECT log_date AS last_date, country, total_money
+        FROM daily_country_revenue
+        WHERE log_date IN ({placeholders})
+        ORDER BY log_date, country
+        ''', conn, params=list(dates))
+
+
+def month_end_revenue(start_date, end_date, conn=None):
+    """每个月最后一天的分国家订单总额（month_lastdate.sql 的结果）"""
+    return revenue_on(month_ends(start_date, end_date), conn)
+
+
+def week_end_revenue(start_date, end_date, week_end_day=WEEK_END_DAY, conn=None):
+    """每周最后一天的分国家订单总额"""
+    return revenue_on(week_ends(start_date, end_date, week_end_day), conn)
+
+
+def period_start(as_of, period):
+    """as_of 所在月（month）或季度（quarter）的第一天"""
+    day = parse_date(as_of)
+    month = day.month if period == 'month' else (day.month - 1) // 3 * 3 + 1
+    return datetime.date(day.year, month, 1).strftime(DATE_FORMAT)
+
+
+def to_date_revenue(as_of, period='month', conn=None):
+    """MTD / QTD：期初到 as_of（含）的分国家订单总额（主键范围扫描）"""
+    conn = conn or get_connection(STORE_DB, 'read')
+    start = period_start(as_of, period)
+    end = parse_date(as_of).strftime(DATE_FORMAT)
+    table = pd.read_sql_query('''
+        SELECT country, SUM(total_money) AS total_money, SUM(order_cnt) AS order_cnt,
+               MIN(log_date) AS first_date, MAX(log_date) AS last_date
+        FROM daily_country_revenue
+        WHERE log_date BETWEEN ? AND ?
+        GROUP BY country
+        ORDER BY total_money DESC
+        ''', conn, params=(start, end))
+    table.insert(0, 'period_start', start)
+    return table
+
+
+def save_tsv(table, file_path):
+    """保存为与 result.tsv 相同格式的文件（制表符分隔，日期为 YYYY/MM/DD，整数金额不带小数）"""
+    table = table.copy()
+    if 'last_date' in table.columns:
+        table['last_date'] = pd.to_datetime(table['last_date']).dt.strftime(OUTPUT_DATE_FORMAT)
+    money = table['total_money']
+    if len(money) and (money == money.round()).all():
+        table['total_money'] = money.astype('int64')
+    table.to_csv(file_path, sep='\t', index=False)
+    print(f"已保存: {file_path}（{len(table)} 行）")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='每日分国家订单总额的物化汇总和日历查询')
+    subparsers = parser.add_subparsers(dest='command')
+
+    refresh_parser = subparsers.add_parser('refresh', help='从 TA 增量刷新汇总表')
+    refresh_parser.add_argument('--start', default=START_DATE, help=f'开始日期（默认 {START_DATE}）')
+    refresh_parser.add_argument('--end', help='结束日期（默认今天）')
+    refresh_parser.add_argument('--full', action='store_true', help='重新拉取区间内所有分区')
+    refresh_parser.add_argument('--lateness-days', type=int, default=LATENESS_DAYS,
+                                help=f'迟到窗口天数（默认 {LATENESS_DAYS}）')
+
+    for name, help_text in (('month-end', '每个月最后一天的分国家订单总额'), ('week-end', '每周最后一天的分国家订单总额')):
+        calendar_parser = subparsers.add_parser(name, help=help_text)
+        calendar_parser.add_argument('--start', default=START_DATE, help='开始日期')
+        calendar_parser.add_argument('--end', default=datetime.date.today().strftime(DATE_FORMAT), help='结束日期')
+        calendar_parser.add_argument('--out', help='保存为 TSV（格式同 result.tsv）')
+    for name, help_text in (('mtd', '月初至今的分国家订单总额'), ('qtd', '季初至今的分国家订单总额')):
+        period_parser = subparsers.add_parser(name, help=help_text)
+        period_parser.add_argument('--date', default=datetime.date.today().strftime(DATE_FORMAT), help='截止日期')
+        period_parser.add_argument('--out', help='保存为 TSV')
+    args = parser.parse_args(argv)
+
+    if args.command == 'refresh':
+        refresh(args.start, args.end, args.lateness_days, args.full)
+        return
+    if args.command in ('month-end', 'week-end'):
+        query = month_end_revenue if args.command == 'month-end' else week_end_revenue
+        table = query(args.start, args.end)
+    elif args.command in ('mtd', 'qtd'):
+        table = to_date_revenue(args.date, 'month' if args.command == 'mtd' else 'quarter')
+    else:
+        parser.print_help()
+        return
+    pd.set_option('display.unicode.ambiguous_as_wide', True)
+    pd.set_option('display.unicode.east_asian_width', True)
+    print(table.to_string(index=False))
+    if args.out:
+        save_tsv(table, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+子游戏首玩与留存引擎（本地版 subgame.sql）
+用 game_start 事件流按 (用户, 子游戏) 计算首玩日期和活跃位图，回答子游戏留存和子游戏之间的迁移
+
+说明：
+1. 口径与 subgame.sql 一致
+   本地时间：#zone_offset 在 [-30, 30] 内时为 #event_time + (8 - #zone_offset) 小时，否则为 #event_time
+   首玩日期（sub_game_reg_local_date）：该用户该子游戏第一条 game_start 的本地日期
+   day_diff = 本地日期 - 首玩日期 + 1；is_keepN：第 N 天玩过；lt：前 7 天玩过的天数
+2. 每个 (用户, 子游戏) 为 RetentionEngine 中的一行，位图相对首玩日期保存，
+   区间活跃、N 日留存、滚动留存等直接沿用 RetentionEngine 的位运算
+3. 构建：事件按 (用户, 子游戏, 本地时间) 排序一次，每组第一条即首玩，同组同一天的事件只置一次位
+4. 查询
+   retention：按 (子游戏, 首玩日期) 汇总留存率，可限定首玩日期区间和子游戏，未满 N 天为空
+   migration_matrix：行为区间内首次玩的子游戏，列为该用户之后首次玩的下一个子游戏
+   user_table：每个 (用户, 子游戏) 一行，对应 subgame.sql 中 df3 的留存列
+5. 增量：add_events 可按天追加；晚到的、早于已有首玩时间的事件会前移首玩日期并平移位图
+
+用法：
+    python subgame_engine.py --events game_start.csv --days 2 3 7
+    python subgame_engine.py --events game_start.csv --start 2025-12-29 --end 2026-01-10 --migration
+    game_start.csv: role_id, sub_game_name, event_time[, zone_offset]（也可以是 TA 列名 #account_id 等）
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from retention_engine import DEFAULT_DAYS, DEFAULT_WINDOW_DAYS, RetentionEngine
+
+# TA 导出的列名 -> 引擎使用的列名
+EVENT_COLUMNS = {'#account_id': 'role_id', '#event_time': 'event_time', '#zone_offset': 'zone_offset'}
+
+NO_MIGRATION = '无'
+
+# 子游戏编码在 (用户, 子游戏) 组合键中占用的位数
+_SUB_BITS = 16
+
+
+def to_local_time(event_time, zone_offset=None):
+    """换算成本地时间（与 subgame.sql 中的 IF(#zone_offset ...) 表达式相同）"""
+    times = pd.to_datetime(pd.Series(event_time)).reset_index(drop=True)
+    if zone_offset is None:
+        return times
+    offset = pd.to_numeric(pd.Series(zone_offset), errors='coerce').reset_index(drop=True)
+    hours = (8 - offset).where(offset.between(-30, 30), 0)
+    return times + pd.to_timedelta((hours * 3600).astype(np.int64), unit='s')
+
+
+def _to_day(value):
+    """日期字符串转成 datetime64[D]"""
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class SubGameEngine(RetentionEngine):
+    """按 (用户, 子游戏) 保存首玩日期和活跃位图的引擎"""
+
+    def __init__(self, window_days=DEFAULT_WINDOW_DAYS):
+        super().__init__(window_days)
+        self._role_ids = pd.Index([])
+        self._sub_games = pd.Index([])
+        # 每个 (用户, 子游戏) 的用户编码、子游戏编码和首玩本地时间；self._roles 为组合键
+        self._pair_role = np.zeros(0, dtype=np.int64)
+        self._pair_sub = np.zeros(0, dtype=np.int64)
+        self.first_times = np.array([], dtype='datetime64[ns]')
+
+    @classmethod
+    def from_events(cls, events, window_days=DEFAULT_WINDOW_DAYS):
+        """由 game_start 事件（role_id, sub_game_name, event_time[, zone_offset]）构建"""
+        engine = cls(window_days)
+        engine.add_events(events)
+        return engine
+
+    @staticmethod
+    def _codes(index, values):
+        """返回各值在 index 中的编码，新值追加；返回 (新 index, 编码)"""
+        new_values = pd.Index(pd.unique(values)).difference(index)
+        if len(new_values):
+            index = index.append(new_values)
+        return index, index.get_indexer(values)
+
+    def add_events(self, events):
+        """追加 game_start 事件，返回新增的 (用户, 子游戏) 数"""
+        events = events.rename(columns=EVENT_COLUMNS)
+        events = events.dropna(subset=['role_id', 'sub_game_name', 'event_time'])
+        local = to_local_time(events['event_time'], events['zone_offset'] if 'zone_offset' in events else None)
+        local_ns = local.to_numpy().astype('datetime64[ns]')
+        self._role_ids, role_codes = self._codes(self._role_ids, events['role_id'].to_numpy())
+        self._sub_games, sub_codes = self._codes(self._sub_games, events['sub_game_name'].astype(str).to_numpy())
+        if len(self._sub_games) > 1 << _SUB_BITS:
+            raise ValueError(f"子游戏数量超过 {1 << _SUB_BITS}")
+        keys = (role_codes.astype(np.int64) << _SUB_BITS) | sub_codes
+
+        # 一次排序：每组第一条为首玩，同组同一天只保留一条
+        order = np.lexsort((local_ns, keys))
+        keys, local_ns = keys[order], local_ns[order]
+        days = local_ns.astype('datetime64[D]')
+        group_start = np.ones(len(keys), dtype=bool)
+        group_start[1:] = keys[1:] != keys[:-1]
+        new_pairs = self._update_pairs(keys[group_start], local_ns[group_start])
+
+        first_day = np.ones(len(keys), dtype=bool)
+        first_day[1:] = group_start[1:] | (days[1:] != days[:-1])
+        keys, days = keys[first_day], days[first_day]
+        if len(days):
+            latest = days.max()
+            self.as_of = latest if self.as_of is None else max(self.as_of, latest)
+        pairs = self._roles.get_indexer(keys)
+        offset = (days - self.reg_dates[pairs]).astype(np.int64)
+        valid = offset < self.window_days
+        self._set_bits(pairs[valid], offset[valid])
+        return new_pairs
+
+    def _update_pairs(self, keys, first_times):
+        """登记新的 (用户, 子游戏)；已有的若出现更早的事件，前移首玩时间并平移位图"""
+        pairs = self._roles.get_indexer(keys)
+        new = pairs < 0
+        if new.any():
+            new_keys = keys[new]
+            self._roles = self._roles.append(pd.Index(new_keys))
+            self._pair_role = np.concatenate([self._pair_role, new_keys >> _SUB_BITS])
+            self._pair_sub = np.concatenate([self._pair_sub, new_keys & ((1 << _SUB_BITS) - 1)])
+            self.first_times = np.concatenate([self.first_times, first_times[new]])
+            self.reg_dates = np.concatenate([self.reg_dates, first_times[new].astype('datetime64[D]')])
+            self.bits = np.vstack([self.bits, np.zeros((int(new.sum()), self.words), dtype=np.uint64)])
+            self._cohort_cache = None
+
+        earlier = ~new
+        earlier[earlier] = first_times[earlier] < self.first_times[pairs[earlier]]
+        if earlier.any():
+            pairs, first_times = pairs[earlier], first_times[earlier]
+            shift = (self.reg_dates[pairs] - first_times.astype('datetime64[D]')).astype(np.int64)
+            self.first_times[pairs] = first_times
+            self.reg_dates[pairs] = first_times.astype('datetime64[D]')
+            self._shift_bits(pairs[shift > 0], shift[shift > 0])
+            self._cohort_cache = None
+        return int(new.sum())
+
+    def _shift_bits(self, pairs, shift):
+        """位图整体后移 shift 天（首玩日期前移后，原来的第 k 天变为第 k + shift 天）"""
+        for days in np.unique(shift):
+            rows = pairs[shift == days]
+            active = np.unpackbits(self.bits[rows].view(np.uint8), axis=1, bitorder='little')
+            moved = np.zeros_like(active)
+            moved[:, days:] = active[:, :self.window_days - days]
+            self.bits[rows] = np.packbits(moved, axis=1, bitorder='little').view(np.uint64)
+
+    def _select(self, start_date=None, end_date=None, sub_games=None):
+        """首玩日期在 [start_date, end_date] 内（且属于 sub_games）的 (用户, 子游戏) 下标"""
+        selected = np.ones(len(self.reg_dates), dtype=bool)
+        if start_date is not None:
+            selected &= self.reg_dates >= _to_day(start_date)
+        if end_date is not None:
+            selected &= self.reg_dates <= _to_day(end_date)
+        if sub_games is not None:
+            selected &= np.isin(self._pair_sub, self._sub_games.get_indexer(list(sub_games)))
+        return np.flatnonzero(selected)
+
+    def retention(self, start_date=None, end_date=None, days=DEFAULT_DAYS, rolling=False, sub_games=None):
+        """按 (子游戏, 首玩日期) 汇总：user_cnt 和各天的留存率（未满天数为空）"""
+        pairs = self._select(start_date, end_date, sub_games)
+        group_keys = (self._pair_sub[pairs] << 32) | self.reg_dates[pairs].astype(np.int64)
+        group_values, groups = np.unique(group_keys, return_inverse=True)
+        group_dates = (group_values & 0xFFFFFFFF).astype('datetime64[D]')
+        users = np.bincount(groups, minlength=len(group_values))
+        table = {
+            'sub_game_name': self._sub_games.to_numpy()[group_values >> 32],
+            'sub_game_reg_local_date': group_dates.astype(str),
+            'user_cnt': users,
+        }
+        prefix = 'rolling_keep' if rolling else 'keep'
+        for day in days:
+            kept = np.bincount(groups, weights=self.retained(day, rolling)[pairs], minlength=len(group_values))
+            rate = kept / np.maximum(users, 1)
+            rate[~self._mature(group_dates, day)] = np.nan
+            table[f"{prefix}_{day}d"] = rate
+        return pd.DataFrame(table).sort_values(['sub_game_name', 'sub_game_reg_local_date'], ignore_index=True)
+
+    def migration_matrix(self, start_date=None, end_date=None, share=False):
+        """
+        子游戏迁移矩阵：行为首玩日期在区间内的子游戏，列为该用户之后首次玩的下一个子游戏
+        下一个子游戏的首玩日期晚于 end_date 时视为没有迁移（列"无"）；share=True 时输出行占比
+        """
+        order = np.lexsort((self._pair_sub, self.first_times, self._pair_role))
+        next_sub = np.full(len(order), -1, dtype=np.int64)
+        same_role = self._pair_role[order[1:]] == self._pair_role[order[:-1]]
+        next_pair = np.full(len(order), -1, dtype=np.int64)
+        next_pair[order[:-1][same_role]] = order[1:][same_role]
+        has_next = next_pair >= 0
+        next_sub[has_next] = self._pair_sub[next_pair[has_next]]
+        if end_date is not None:
+            late = has_next.copy()
+            late[has_next] = self.reg_dates[next_pair[has_next]] > _to_day(end_date)
+            next_sub[late] = -1
+
+        pairs = self._select(start_date, end_date)
+        n_subs = len(self._sub_games)
+        counts = np.zeros((n_subs, n_subs + 1), dtype=np.int64)
+        np.add.at(counts, (self._pair_sub[pairs], next_sub[pairs] + 1), 1)
+        names = list(self._sub_games)
+        matrix = pd.DataFrame(counts, index=pd.Index(names, name='sub_game_name'), columns=[NO_MIGRATION] + names)
+        matrix = matrix.loc[matrix.sum(axis=1) > 0, [NO_MIGRATION] + sorted(names)].sort_index()
+        if share:
+            matrix = matrix.div(matrix.sum(axis=1), axis=0)
+        return matrix
+
+    def user_table(self, days=DEFAULT_DAYS, lt_days=7):
+        """每个 (用户, 子游戏) 的首玩时间、is_keepN 和 lt（与 subgame.sql 中的同名列一致）"""
+        table = {
+            'role_id': self._role_ids.to_numpy()[self._pair_role],
+            'sub_game_name': self._sub_games.to_numpy()[self._pair_sub],
+            'sub_game_reg_local_date': self.reg_dates.astype(str),
+            'sub_game_reg_local_time': self.first_times,
+        }
+        for day in days:
+            table[f"is_keep{day}"] = self.retained(day).astype(np.int8)
+        table['lt'] = self.active_days(1, lt_days)
+        return pd.DataFrame(table)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='按子游戏计算首玩留存和迁移')
+    parser.add_argument('--events', nargs='+', required=True, help='game_start 事件 CSV（可按天多个文件，依次追加）')
+    parser.add_argument('--start', help='首玩日期起（含）')
+    parser.add_argument('--end', help='首玩日期止（含）')
+    parser.add_argument('--days', type=int, nargs='*', default=list(DEFAULT_DAYS), help='留存天数')
+    parser.add_argument('--rolling', action='store_true', help='滚动留存（第 N 天及之后任一天玩过）')
+    parser.add_argument('--migration', action='store_true', help='同时输出子游戏迁移矩阵')
+    parser.add_argument('--out', help='把每个 (用户, 子游戏) 的留存明细保存为 CSV')
+    args = parser.parse_args(argv)
+
+    engine = SubGameEngine(window_days=max(DEFAULT_WINDOW_DAYS, max(args.days)))
+    for path in args.events:
+        added = engine.add_events(pd.read_csv(path))
+        print(f"{path}: 新增 {added} 个 (用户, 子游戏)，共 {len(engine.reg_dates)} 个")
+    pd.set_option('display.width', 260)
+    print(engine.retention(args.start, args.end, args.days, args.rolling).to_string(index=False))
+    if args.migration:
+        print(engine.migration_matrix(args.start, args.end).to_string())
+    if args.out:
+        engine.user_table(args.days).to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存: {args.out}")
+
+if __name__ == "__main__":
+    main()
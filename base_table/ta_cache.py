@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TA 查询结果的本地分区缓存
+同一个查询按 "$part_date" 分区缓存到本地，重复执行时只拉取缓存中没有的分区
+
+说明：
+1. 缓存键是规范化后的 SQL 模板（字符串外的空白压缩、去掉末尾分号）的哈希，
+   模板中用 {start_date} / {end_date} 表示分区范围
+2. 每个分区单独保存为一个 pickle 文件（保留列类型）：ta_cache/<键>/<日期>.pkl
+3. 早于 今天 - lateness_days 的分区视为不再变化，拉取一次后永久缓存；
+   迟到窗口内的分区（默认今天和昨天）每次都重新拉取，且不写入缓存
+4. 缺失的分区按 slice_days 切片后并发拉取（见 ta_client.fetch_slices），结果再按分区拆开保存；
+   失败分片的分区不写缓存，也不在返回结果中，下次执行时会再次拉取
+5. 传入 transform（如 ta_schema.apply_schema）时，拉到的分区先转换类型再写缓存，
+   缓存中保存的就是紧凑类型；合并时 category 列保持为 category
+
+用法：
+    from ta_cache import cached_query
+    df = cached_query(sql_template, '2025-12-29', '2026-01-14')
+"""
+
+import datetime
+import hashlib
+import os
+import re
+
+import pandas as pd
+
+from ta_schema import concat_frames
+from ta_client import (DATE_FORMAT, DEFAULT_FETCH_WORKERS, DEFAULT_RETRIES, DEFAULT_SLICE_DAYS,
+                       date_range, date_slices, fetch_slices, parse_date)
+
+# 默认缓存目录、分区列和迟到窗口（天）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ta_cache')
+PARTITION_COLUMN = '$part_date'
+LATENESS_DAYS = 1
+
+# 字符串原样保留，其余连续空白压缩成一个空格
+_NORMALIZE_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|\s+""")
+
+
+def normalize_sql(sql):
+    """规范化 SQL：字符串外的连续空白压缩成一个空格，去掉首尾空白和末尾分号"""
+    sql = _NORMALIZE_RE.sub(lambda m: ' ' if m.group().isspace() else m.group(), sql)
+    return sql.strip().rstrip(';').rstrip()
+
+
+def cache_key(sql_template):
+    """查询模板对应的缓存键"""
+    return hashlib.sha1(normalize_sql(sql_template).encode('utf-8')).hexdigest()[:16]
+
+
+def contiguous_ranges(dates):
+    """把有序日期列表合并成连续日期段 [(起, 止), ...]"""
+    ranges = []
+    for date in dates:
+        day = parse_date(date)
+        if ranges and (day - parse_date(ranges[-1][1])).days == 1:
+            ranges[-1][1] = date
+        else:
+            ranges.append([date, date])
+    return [tuple(r) for r in ranges]
+
+
+def split_partitions(df, dates, partition_column=PARTITION_COLUMN):
+    """按分区列把结果拆成 {日期: DataFrame}，没有数据的日期得到空表（保留列）"""
+    if partition_column not in df.columns:
+        return {date: df.iloc[0:0] for date in dates}
+    keys = df[partition_column].astype(str).str[:10]
+    parts = {date: part.reset_index(drop=True) for date, part in df.groupby(keys, sort=False)}
+    return {date: parts.get(date, df.iloc[0:0]) for date in dates}
+
+
+def fetch_ranges(sql_template, ranges, slice_days=DEFAULT_SLICE_DAYS,
+                 max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES):
+    """把各日期段切片后并发拉取，返回成功分片的 [(日期段, DataFrame), ...]"""
+    slices = [piece for start, end in ranges for piece in date_slices(start, end, slice_days)]
+    ordered, failed = fetch_slices(sql_template, slices, max_workers, retries)
+    return ordered
+
+
+def cached_query(sql_template, start_date, end_date, lateness_days=LATENESS_DAYS,
+                 cache_dir=CACHE_DIR, partition_column=PARTITION_COLUMN, refresh=False,
+                 today=None, transform=None, fetch=fetch_ranges, **fetch_kwargs):
+    """
+    带分区缓存地执行查询，返回按日期排序合并后的 DataFrame
+    refresh=True 时忽略已有缓存，全部重新拉取（拉到的不变分区会覆盖缓存）
+    transform 为分区 DataFrame 的转换函数，对拉取和读取的分区都会执行（应可重复执行）
+    fetch 为按日期段拉取数据的函数，签名同 fetch_ranges，fetch_kwargs 原样传给它
+    （如 slice_days、max_workers、retries）
+    """
+    dates = date_range(start_date, end_date)
+    today = parse_date(today or datetime.date.today())
+    cutoff = (today - datetime.timedelta(days=lateness_days)).strftime(DATE_FORMAT)
+
+    key_dir = os.path.join(cache_dir, cache_key(sql_template))
+    os.makedirs(key_dir, exist_ok=True)
+    query_file = os.path.join(key_dir, 'query.sql')
+    if not os.path.exists(query_file):
+        with open(query_file, 'w', encoding='utf-8') as f:
+            f.write(normalize_sql(sql_template) + '\n')
+
+    partitions, missing = {}, []
+    for date in dates:
+        path = os.path.join(key_dir, f"{date}.pkl")
+        if not refresh and date < cutoff and os.path.exists(path):
+            partitions[date] = pd.read_pickle(path)
+            if transform is not None:
+                partitions[date] = transform(partitions[date])
+        else:
+            missing.append(date)
+
+    cached = len(partitions)
+    for (start, end), df in fetch(sql_template, contiguous_ranges(missing), **fetch_kwargs):
+        range_dates = date_range(start, end)
+        for date, part in split_partitions(df, range_dates, partition_column).items():
+            if transform is not None:
+                part = transform(part)
+            partitions[date] = part
+            # 只有不再变化的分区才写入缓存
+            if date < cutoff:
+                tmp_path = os.path.join(key_dir, f"{date}.pkl.tmp")
+                part.to_pickle(tmp_path)
+                os.replace(tmp_path, os.path.join(key_dir, f"{date}.pkl"))
+
+    print(f"分区缓存: 共 {len(dates)} 个分区，命中 {cached} 个，拉取 {len(dates) - cached} 个"
+          f"（{cutoff} 及之后的分区每次重新拉取）")
+    failed = [date for date in dates if date not in partitions]
+    if failed:
+        print(f"警告：{len(failed)} 个分区拉取失败，结果中不含这些日期: {', '.join(failed)}")
+    frames = [partitions[date] for date in dates if date in partitions and len(partitions[date])]
+    return concat_frames(frames)
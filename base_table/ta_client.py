@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TA querySql 接口客户端
+流式读取查询结果：边下载边解析，不再把整个响应读进内存、写入 sql.txt 再重新读取
+
+说明：
+1. 以 stream=True 发送请求，响应体按块读取
+2. 服务端返回 gzip 时自动解压（Content-Encoding 或响应体本身是 gzip 都支持）
+3. iter_query_chunks 按块产出 DataFrame，内存占用只和块大小有关
+4. query_to_csv 把结果原样写入本地文件；query_to_sqlite 分块写入本地 SQLite
+5. pandas 只在需要解析成 DataFrame 时才导入，只做原样落盘（query_to_csv）时不加载
+6. query_sliced 把 "$part_date" 范围切成按天（或每 N 天）的小查询，用有界线程池并发执行，
+   每片单独重试，结果按日期顺序合并；个别分片失败不影响其他分片，总耗时约等于最慢的一片
+
+用法：
+    from ta_client import iter_query_chunks
+    for chunk in iter_query_chunks(sql, chunk_rows=100000):
+        ...
+"""
+
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import connect
+
+# 接口配置
+# DMG:5cv2wnXJ4bWrfhRsUMYyGcbaQETZBNqv0mVGpbIKYXAf01IsLDKbUj0MXZ5Y0pIu
+# OG:8z54SmsXpem11675yprE1HV7V7QAZckUSSPDTzN0m9uIJAibb4FX0SZ130cB1NTK
+# url = rf'''http://121.43.174.24:8992/querySql?token={token}'''
+TA_HOST = os.environ.get('TA_HOST', 'https://ta-openapi.difeh.com:8992')
+TA_TOKEN = os.environ.get('TA_TOKEN', '8z54SmsXpem11675yprE1HV7V7QAZckUSSPDTzN0m9uIJAibb4FX0SZ130cB1NTK')
+QUERY_FORMAT = 'csv_header'
+TIMEOUT_SECONDS = 30000      # 服务端查询超时
+CONNECT_TIMEOUT = 10         # 建立连接超时
+
+# 每块 DataFrame 的行数，以及读取响应体的缓冲区大小
+DEFAULT_CHUNK_ROWS = 100000
+READ_BUFFER_SIZE = 1 << 20
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# 分片并发拉取：每片天数、并发数、每片重试次数，以及单片的服务端超时
+DEFAULT_SLICE_DAYS = 1
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_RETRIES = 3
+SLICE_TIMEOUT_SECONDS = 1800
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class TAQueryError(Exception):
+    """TA 查询返回错误信息"""
+
+
+def _check_error(stream):
+    """响应体是 JSON 时说明查询出错（正常结果是 CSV），读出错误信息并抛出"""
+    head = stream.peek(1)[:1]
+    if head != b'{':
+        return
+    body = stream.read().decode('utf-8', errors='replace')
+    try:
+        message = json.loads(body)
+    except ValueError:
+        raise TAQueryError(body[:500])
+    raise TAQueryError(message.get('return_message') or message.get('message') or body[:500])
+
+
+def open_query_stream(sql, token=TA_TOKEN, timeout_seconds=TIMEOUT_SECONDS, session=None):
+    """
+    发送查询请求，返回 (response, 已解压的二进制流)
+    调用方负责关闭 response（可用 with response:）
+    """
+    url = f"{TA_HOST}/querySql?token={token}"
+    data = {"sql": sql,
+            "format": QUERY_FORMAT,
+            "timeoutSecond": timeout_seconds
+            }
+    response = (session or requests).post(url, data=data, stream=True,
+                                          headers={'Accept-Encoding': 'gzip'},
+                                          timeout=(CONNECT_TIMEOUT, timeout_seconds))
+    try:
+        response.raise_for_status()
+        # Content-Encoding: gzip 由 urllib3 解压
+        response.raw.decode_content = True
+        # 读到末尾时不自动关闭，交给 BufferedReader / pandas 正常收尾
+        response.raw.auto_close = False
+        stream = io.BufferedReader(response.raw, READ_BUFFER_SIZE)
+        # 响应体本身是 gzip 文件时再包一层
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            stream = io.BufferedReader(gzip.GzipFile(fileobj=stream), READ_BUFFER_SIZE)
+        _check_error(stream)
+    except Exception:
+        response.close()
+        raise
+    return response, stream
+
+
+def iter_query_chunks(sql, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None,
+                      timeout_seconds=TIMEOUT_SECONDS, **read_csv_kwargs):
+    """流式执行查询，按 chunk_rows 行一块产出 DataFrame"""
+    import pandas as pd
+    response, stream = open_query_stream(sql, timeout_seconds=timeout_seconds)
+    with response:
+        with pd.read_csv(stream, sep=',', encoding='utf-8', chunksize=chunk_rows,
+                         dtype=dtype, **read_csv_kwargs) as reader:
+            for chunk in reader:
+                yield chunk
+
+
+def query_dataframe(sql, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None,
+                    timeout_seconds=TIMEOUT_SECONDS, **read_csv_kwargs):
+    """执行查询并合并成一个 DataFrame（逐块解析，不保留原始响应）"""
+    import pandas as pd
+    chunks = list(iter_query_chunks(sql, chunk_rows=chunk_rows, dtype=dtype,
+                                    timeout_seconds=timeout_seconds, **read_csv_kwargs))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+def query_to_csv(sql, file_path):
+    """把查询结果原样（已解压的 CSV）流式写入本地文件，返回写入的字节数"""
+    response, stream = open_query_stream(sql)
+    with response, open(file_path, 'wb') as f:
+        shutil.copyfileobj(stream, f, READ_BUFFER_SIZE)
+        return f.tell()
+
+
+def query_to_sqlite(sql, table, db='ta_store', chunk_rows=DEFAULT_CHUNK_ROWS, if_exists='replace'):
+    """把查询结果分块写入本地 SQLite 表，返回写入的行数"""
+    conn = connect(db, 'write')
+    total = 0
+    try:
+        for i, chunk in enumerate(iter_query_chunks(sql, chunk_rows=chunk_rows)):
+            chunk.to_sql(table, conn, if_exists=if_exists if i == 0 else 'append', index=False)
+            total += len(chunk)
+        conn.commit()
+    finally:
+        conn.close()
+    return total
+
+
+def parse_date(value):
+    """把 'YYYY-MM-DD'（或更长的时间字符串）/ date 转成 date"""
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(str(value)[:10], DATE_FORMAT).date()
+
+
+def date_range(start_date, end_date):
+    """闭区间内的所有日期字符串"""
+    start, end = parse_date(start_date), parse_date(end_date)
+    return [(start + datetime.timedelta(days=i)).strftime(DATE_FORMAT)
+            for i in range((end - start).days + 1)]
+
+
+def date_slices(start_date, end_date, slice_days=DEFAULT_SLICE_DAYS):
+    """把闭区间日期范围切成每 slice_days 天一片，返回 [(起, 止), ...]"""
+    dates = date_range(start_date, end_date)
+    return [(dates[i], dates[min(i + slice_days, len(dates)) - 1])
+            for i in range(0, len(dates), slice_days)]
+
+
+def fetch_slice(sql_template, start_date, end_date, retries=DEFAULT_RETRIES,
+                timeout_seconds=SLICE_TIMEOUT_SECONDS):
+    """拉取一个日期分片，失败时按指数退避重试，重试用尽后抛出最后一次的异常"""
+    sql = sql_template.format(start_date=start_date, end_date=end_date)
+    for attempt in range(retries):
+        try:
+            return query_dataframe(sql, timeout_seconds=timeout_seconds)
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"分片 {start_date}~{end_date} 第 {attempt + 1} 次拉取失败: {e}，稍后重试")
+            time.sleep(2 ** attempt)
+
+
+def fetch_slices(sql_template, slices, max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES,
+                 timeout_seconds=SLICE_TIMEOUT_SECONDS):
+    """
+    并发拉取多个日期分片
+    返回 (成功的 [((起, 止), DataFrame), ...]（按 slices 顺序）, 失败的 [((起, 止), 异常), ...])
+    """
+    results, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_slice, sql_template, start, end, retries, timeout_seconds): (start, end)
+                   for start, end in slices}
+        for future in as_completed(futures):
+            piece = futures[future]
+            try:
+                results[piece] = future.result()
+            except Exception as e:
+                print(f"分片 {piece[0]}~{piece[1]} 拉取失败（已重试 {retries} 次）: {e}")
+                failed.append((piece, e))
+    ordered = [(piece, results[piece]) for piece in slices if piece in results]
+    failed.sort(key=lambda item: slices.index(item[0]))
+    return ordered, failed
+
+
+def query_sliced(sql_template, start_date, end_date, slice_days=DEFAULT_SLICE_DAYS,
+                 max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    按日期分片并发执行查询模板（含 {start_date}/{end_date} 占位符），结果按日期顺序合并
+    返回 (DataFrame, 失败分片列表)；失败分片的数据不在结果中，可单独重跑
+    """
+    import pandas as pd
+    slices = date_slices(start_date, end_date, slice_days)
+    ordered, failed = fetch_slices(sql_template, slices, max_workers, retries)
+    frames = [df for _, df in ordered if len(df)]
+    data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return data, failed
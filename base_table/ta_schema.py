@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TA 查询结果的列类型声明
+按声明把 read_csv 的默认类型（float64 / object）转换成紧凑类型，并输出转换前后的内存对比
+
+说明：
+1. 列类型分为以下几类
+   category  低基数字符串（国家、包名、子游戏名等）-> category
+   flag      0/1 标记（is_keep2..7、day1_is_sign 等）-> int8，空值记为 0
+   count     计数 -> 可空整数 Int32，空值保留为 <NA>
+   duration  时长 -> float32
+   datetime  时间 -> datetime64，无法解析的记为 NaT
+   id        高基数标识（user_id、device_id 等）保持原样
+2. 多个数据块合并时用 concat_frames，统一各块的 category 取值，合并后仍是 category
+3. 未在声明中的列保持原样
+
+用法：
+    python ta_schema.py 导出结果.csv          # 输出按 OG_GAME_EVENT_SCHEMA 转换前后的内存对比
+"""
+
+import argparse
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# og_gbt3_game_event 提取（OG_base.get_sql）的列类型
+OG_GAME_EVENT_SCHEMA = {
+    '#user_id': 'id',
+    '#account_id': 'id',
+    '#distinct_id': 'id',
+    '$part_event': 'category',
+    '#event_time': 'datetime',
+    '$part_date': 'category',
+    '#data_source': 'category',
+    'day1_last_sub_game_name': 'category',
+    'day1_sub_game_reason_cnt': 'count',
+    'day1_sub_game_reason_win_cnt': 'count',
+    'day1_sub_game_uptime': 'duration',
+    'is_keep7': 'flag',
+    'is_keep6': 'flag',
+    'is_keep5': 'flag',
+    'ad_game_name': 'category',
+    'is_keep4': 'flag',
+    'is_keep3': 'flag',
+    'is_keep2': 'flag',
+    'day1_is_sign': 'flag',
+    'day1_is_ad_rewarded': 'flag',
+    'day1_sub_game_name': 'category',
+    'role_id': 'id',
+    'reg_time': 'datetime',
+    'reg_app_version': 'category',
+    'day1_sub_game_reason_fail_cnt': 'count',
+    'install_local_time': 'datetime',
+    'install_time': 'datetime',
+    'day1_unblock_gamenum': 'count',
+    'day1_sub_game_win_uptime': 'duration',
+    'day1_total_fail_reason_cnt': 'count',
+    'device_id': 'id',
+    'lt_cnt': 'count',
+    'reg_pack': 'category',
+    'day1_total_game_uptime': 'duration',
+    'day1_sub_game_cnt': 'count',
+    'reg_country': 'category',
+    'ad_game_sub_name': 'category',
+    'reg_local_time': 'datetime',
+    'day1_total_win_reason_cnt': 'count',
+    'reg_date': 'category',
+    'ad_id': 'category',
+    'day1_sub_game_fail_uptime': 'duration',
+    'reg_local_date': 'category',
+    'day1_game_reason_cnt': 'count',
+    'test_label': 'category',
+}
+
+
+def _convert_column(series, kind):
+    """按列类型转换一列"""
+    if kind == 'category':
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        # 先统一成字符串，避免同一取值因解析成数字/字符串而分成两个类别；
+        # 含空值的整数列会被 read_csv 读成 float（123.0），先还原成整数
+        if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+            series = series.astype('Int64')
+        return series.astype('string').astype('category')
+    if kind == 'flag':
+        return pd.to_numeric(series, errors='coerce').fillna(0).astype('int8')
+    if kind == 'count':
+        return pd.to_numeric(series, errors='coerce').round().astype('Int32')
+    if kind == 'duration':
+        return pd.to_numeric(series, errors='coerce').astype('float32')
+    if kind == 'datetime':
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        return pd.to_datetime(series, errors='coerce')
+    return series
+
+
+def apply_schema(df, schema=OG_GAME_EVENT_SCHEMA):
+    """按声明转换列类型，返回新的 DataFrame；已是目标类型的列不会重复转换"""
+    df = df.copy()
+    for column, kind in schema.items():
+        if column in df.columns:
+            df[column] = _convert_column(df[column], kind)
+    return df
+
+
+def concat_frames(frames):
+    """合并多个 DataFrame，各块的 category 列先统一取值，合并后仍是 category"""
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    frames = [frame.copy() for frame in frames]
+    for column in frames[0].columns:
+        if not all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)
+                   for frame in frames):
+            continue
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_usage(df):
+    """DataFrame 的内存占用（字节，含字符串实际大小）"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def memory_report(before, after, top=10):
+    """输出转换前后的内存对比：总量、压缩比，以及节省最多的几列"""
+    total_before, total_after = memory_usage(before), memory_usage(after)
+    ratio = total_before / total_after if total_after else float('inf')
+    print(f"内存占用: {_format_size(total_before)} -> {_format_size(total_after)}（{ratio:.1f} 倍）")
+    column_before = before.memory_usage(index=False, deep=True)
+    column_after = after.memory_usage(index=False, deep=True)
+    saved = (column_before - column_after.reindex(column_before.index, fill_value=0)).sort_values(ascending=False)
+    for column in saved.index[:top]:
+        print(f"  {column}: {before[column].dtype} {_format_size(column_before[column])}"
+              f" -> {after[column].dtype} {_format_size(column_after[column])}")
+    return total_before, total_after
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='对比 TA 导出结果转换为声明类型前后的内存占用')
+    parser.add_argument('csv_file', help='TA 导出的 CSV 文件（如 ta_client.query_to_csv 的结果）')
+    args = parser.parse_args(argv)
+
+    # 转换前：与原来的 get_data 一致，默认类型读入后 fillna(0)
+    before = pd.read_csv(args.csv_file, sep=',', encoding='utf-8')
+    after = apply_schema(before)
+    memory_report(before.fillna(0), after)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TA 事件增量同步
+按事件记录水位（最后同步到的 "$part_date" 和 "#event_time"），每次只拉取水位之后的数据，
+追加到本地按分区存放的数据目录
+
+说明：
+1. 水位保存在 ta_store 数据库（见 db_config.json）的 sync_watermarks 表
+2. 本地数据按分区保存：ta_store/<事件名>/<日期>.pkl，已按 ta_schema 转换列类型
+3. 每次从水位所在分区开始拉取（该分区可能只同步了一部分），水位分区整体重新拉取后覆盖本地文件，
+   不按 "#event_time" 过滤：迟到的行、与水位时间相同的行、时间为空的行都不会丢失
+4. 分片并发拉取（ta_client.fetch_slices）；某个分片失败时，只写入它之前的连续分区，
+   水位停在失败分区之前，下次同步从那里继续
+5. 首次同步从事件配置的起始日期开始；已同步分区的迟到数据不会被补拉，需要时用 full=True 重建
+
+用法：
+    python OG_base.py sync                  # 同步到今天
+    from ta_sync import load_store; df = load_store('og_gbt3_game_event')
+"""
+
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+from ta_client import (DATE_FORMAT, DEFAULT_FETCH_WORKERS, DEFAULT_RETRIES, DEFAULT_SLICE_DAYS,
+                       date_range, date_slices, fetch_slices)
+from ta_schema import OG_GAME_EVENT_SCHEMA, apply_schema, concat_frames
+
+# 添加项目根目录到Python路径，使用共享的数据库连接模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_connection import get_connection
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ta_store')
+STORE_DB = 'ta_store'
+PARTITION_COLUMN = '$part_date'
+EVENT_TIME_COLUMN = '#event_time'
+
+
+def _og_game_event_sql(start_date, end_date):
+    from OG_base import get_sql
+    return get_sql(start_date, end_date)
+
+
+# 可同步的事件：查询（接收起止日期）、列类型、首次同步的起始日期
+SYNC_EVENTS = {
+    'og_gbt3_game_event': {
+        'sql': _og_game_event_sql,
+        'schema': OG_GAME_EVENT_SCHEMA,
+        'start_date': '2025-12-29',
+    },
+}
+
+
+def create_watermark_table(conn):
+    """创建水位表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_watermarks (
+        event TEXT PRIMARY KEY,
+        last_part_date TEXT NOT NULL,
+        last_event_time TEXT,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+def get_watermark(conn, event):
+    """读取事件水位，返回 (last_part_date, last_event_time, row_count)，没有水位时返回 None"""
+    row = conn.execute(
+        "SELECT last_part_date, last_event_time, row_count FROM sync_watermarks WHERE event = ?",
+        (event,)).fetchone()
+    return tuple(row) if row else None
+
+
+def set_watermark(conn, event, last_part_date, last_event_time, row_count):
+    """更新事件水位"""
+    conn.execute('''
+    INSERT INTO sync_watermarks (event, last_part_date, last_event_time, row_count, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(event) DO UPDATE SET
+        last_part_date = excluded.last_part_date,
+        last_event_time = excluded.last_event_time,
+        row_count = excluded.row_count,
+        updated_at = CURRENT_TIMESTAMP
+    ''', (event, last_part_date, last_event_time, row_count))
+    conn.commit()
+
+
+def partition_path(event, date, store_dir=STORE_DIR):
+    return os.path.join(store_dir, event, f"{date}.pkl")
+
+
+def write_partition(event, date, data, append=False, store_dir=STORE_DIR):
+    """写入一个分区（先写临时文件再替换）；append=True 时追加到已有数据之后"""
+    path = partition_path(event, date, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if append and os.path.exists(path):
+        data = concat_frames([pd.read_pickle(path), data])
+    tmp_path = path + '.tmp'
+    data.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def load_store(event, start_date=None, end_date=None, store_dir=STORE_DIR):
+    """读取本地已同步的数据，可按分区日期过滤"""
+    event_dir = os.path.join(store_dir, event)
+    if not os.path.isdir(event_dir):
+        return pd.DataFrame()
+    dates = sorted(name[:-4] for name in os.listdir(event_dir) if name.endswith('.pkl'))
+    frames = [pd.read_pickle(partition_path(event, date, store_dir)) for date in dates
+              if (start_date is None or date >= start_date) and (end_date is None or date <= end_date)]
+    return concat_frames([frame for frame in frames if len(frame)])
+
+
+def partition_rows(event, date, store_dir=STORE_DIR):
+    """本地分区的行数，分区不存在时为 0"""
+    path = partition_path(event, date, store_dir)
+    return len(pd.read_pickle(path)) if os.path.exists(path) else 0
+
+
+def _event_time_max(data):
+    if EVENT_TIME_COLUMN not in data.columns or not len(data):
+        return None
+    value = pd.to_datetime(data[EVENT_TIME_COLUMN], errors='coerce').max()
+    return None if pd.isna(value) else value.isoformat(sep=' ')
+
+
+def sync_event(event, end_date=None, full=False, slice_days=DEFAULT_SLICE_DAYS,
+               max_workers=DEFAULT_FETCH_WORKERS, retries=DEFAULT_RETRIES, store_dir=STORE_DIR):
+    """
+    把事件同步到 end_date（默认今天），返回本次追加的行数
+    full=True 时忽略水位，从起始日期重新同步并覆盖本地分区
+    """
+    config = SYNC_EVENTS[event]
+    end_date = end_date or datetime.date.today().strftime(DATE_FORMAT)
+    conn = get_connection(STORE_DB, 'write')
+    create_watermark_table(conn)
+
+    watermark = None if full else get_watermark(conn, event)
+    if watermark:
+        start_date, last_event_time, row_count = watermark
+    else:
+        start_date, last_event_time, row_count = config['start_date'], None, 0
+    if start_date > end_date:
+        print(f"{event}: 水位 {start_date} 已在 {end_date} 之后，无需同步")
+        return 0
+
+    template = config['sql']('{start_date}', '{end_date}')
+    slices = date_slices(start_date, end_date, slice_days)
+    print(f"{event}: 从 {start_date}（水位时间 {last_event_time or '无'}）同步到 {end_date}，共 {len(slices)} 个分片")
+    ordered, failed = fetch_slices(template, slices, max_workers, retries)
+    results = dict(ordered)
+
+    appended = 0
+    new_date, new_time = start_date, last_event_time
+    for piece in slices:
+        # 遇到失败的分片就停下，保证水位之前的分区都是完整同步过的
+        if piece not in results:
+            print(f"{event}: 分片 {piece[0]}~{piece[1]} 拉取失败，水位停在 {new_date}")
+            break
+        data = apply_schema(results[piece], config['schema'])
+        keys = data[PARTITION_COLUMN].astype(str).str[:10] if PARTITION_COLUMN in data.columns else None
+        for date in date_range(*piece):
+            part = data[keys == date] if keys is not None else data.iloc[0:0]
+            part = part.reset_index(drop=True)
+            resume = watermark is not None and date == start_date
+            if resume:
+                # 水位分区重新拉取的是整个分区：覆盖本地文件，追加行数按覆盖前后的差值计算；
+                # 拉到空结果时保留本地数据
+                if len(part):
+                    appended += len(part) - partition_rows(event, date, store_dir)
+                    write_partition(event, date, part, store_dir=store_dir)
+            else:
+                write_partition(event, date, part, store_dir=store_dir)
+                appended += len(part)
+            new_date = date
+            new_time = _event_time_max(part) or (new_time if resume else None)
+
+    if full:
+        row_count = 0
+    set_watermark(conn, event, new_date, new_time, row_count + appended)
+    print(f"{event}: 追加 {appended} 行，新水位 {new_date} {new_time or ''}".rstrip())
+    return appended
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 连接管理模块
+所有脚本统一通过这里打开 SQLite 数据库
+
+功能：
+1. 从配置文件（db_config.json，可用环境变量 DATA_SQL_DB_CONFIG 指定其他文件）解析数据库路径
+2. 按线程复用连接（线程内连接池），避免每次查询都重新建连
+3. 按用途应用 PRAGMA 配置：read（读多）、write（写多）、bulk（批量导入期间临时使用）
+4. 取连接时做一次廉价的健康检查（SELECT 1），连接失效时自动重连
+
+用法：
+    from db_connection import get_connection
+    conn = get_connection('game_competitor', 'read')
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger('DBConnection')
+
+# 项目根目录和默认配置文件
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(ROOT_DIR, 'db_config.json')
+CONFIG_ENV = 'DATA_SQL_DB_CONFIG'
+
+# PRAGMA 配置
+PRAGMA_PROFILES = {
+    # 读多写少：加大缓存，启用内存映射，临时表放内存
+    'read': {
+        'cache_size': -65536,     # 负数表示 KB，约 64MB
+        'mmap_size': 268435456,   # 256MB
+        'temp_store': 'MEMORY',
+    },
+    # 写多：WAL 日志，synchronous=NORMAL（WAL 下仍然安全，只是少了每次提交的 fsync）
+    'write': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # 批量导入：只在导入期间使用，结束后应恢复原值（见 apply_pragmas 的返回值）
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -262144,    # 约 256MB
+        'temp_store': 'MEMORY',
+    },
+}
+
+_config = None
+_config_lock = threading.Lock()
+_local = threading.local()
+# 所有线程的池化连接，进程退出时统一关闭
+_all_connections = []
+_all_connections_lock = threading.Lock()
+
+
+def load_config(config_file=None):
+    """读取数据库配置，结果会被缓存；配置文件不存在时返回空配置"""
+    global _config
+    with _config_lock:
+        if _config is not None and config_file is None:
+            return _config
+        path = config_file or os.environ.get(CONFIG_ENV) or CONFIG_FILE
+        config = {'databases': {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                config.update(json.load(f))
+        config['base_dir'] = os.path.dirname(os.path.abspath(path))
+        if config_file is None:
+            _config = config
+        return config
+
+
+def resolve_db_path(name):
+    """
+    解析数据库路径
+    name 是配置中的数据库名时返回配置的路径（相对路径以配置文件所在目录为准），
+    否则把 name 当作文件路径原样返回
+    """
+    config = load_config()
+    path = config['databases'].get(name)
+    if path is None:
+        return name
+    if path == ':memory:' or os.path.isabs(path):
+        return path
+    return os.path.join(config['base_dir'], path)
+
+
+def apply_pragmas(conn, pragmas):
+    """设置 PRAGMA，返回修改前的值，便于之后恢复"""
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        conn.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+
+def connect(name, profile='write', **kwargs):
+    """打开一个新的（不入池的）连接并应用 PRAGMA 配置，kwargs 透传给 sqlite3.connect"""
+    conn = sqlite3.connect(resolve_db_path(name), **kwargs)
+    if profile:
+        apply_pragmas(conn, PRAGMA_PROFILES[profile])
+    return conn
+
+
+def check_connection(conn):
+    """健康检查：连接可用返回 True"""
+    try:
+        conn.execute("SELECT 1").fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def get_connection(name, profile='read'):
+    """
+    获取当前线程的池化连接：同一线程内相同数据库和配置只建一次连接
+    调用方不需要关闭，进程退出时统一关闭；需要提前释放时调用 close_connection
+    """
+    pool = getattr(_local, 'connections', None)
+    if pool is None:
+        pool = _local.connections = {}
+    key = (os.path.abspath(resolve_db_path(name)), profile)
+    conn = pool.get(key)
+    if conn is not None and check_connection(conn):
+        return conn
+    if conn is not None:
+        logger.warning(f"数据库连接已失效，重新连接: {key[0]}")
+    conn = connect(name, profile)
+    pool[key] = conn
+    with _all_connections_lock:
+        _all_connections.append(conn)
+    return conn
+
+
+def close_connection(name, profile='read'):
+    """关闭并移出当前线程的池化连接"""
+    pool = getattr(_local, 'connections', {})
+    conn = pool.pop((os.path.abspath(resolve_db_path(name)), profile), None)
+    if conn is not None:
+        conn.close()
+        with _all_connections_lock:
+            if conn in _all_connections:
+                _all_connections.remove(conn)
+
+
+@atexit.register
+def close_all():
+    """关闭所有线程的池化连接"""
+    with _all_connections_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.__dict__.clear()
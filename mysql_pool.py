@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MySQL 连接池模块
+复用到远程 MySQL（如腾讯云 CDB）的连接，避免每次查询都重新做 TCP 握手和认证
+
+功能：
+1. 连接池：最多 max_size 个连接，用完归还，下一次查询直接复用
+2. 借出时检查（ping-on-borrow）：空闲超过 ping_after 秒的连接先 ping，失效则丢弃重连
+3. 保活：开启 TCP keepalive，并由后台线程定期 ping 空闲连接，防止被服务端 wait_timeout 或 NAT 断开；
+   保活期间被拿出来 ping 的连接占用连接数，池中连接总数不会超过 max_size
+4. 归还时先 rollback 结束事务：pymysql 默认不自动提交，不结束事务的话复用的连接会一直停留在
+   REPEATABLE READ 的旧快照上，长期存在的连接池会一直读到旧数据
+5. 每次查询记录耗时和行数，pool.report() 输出汇总
+6. 大结果集用 iter_chunks / to_csv 流式读取：服务端游标（SSCursor）逐块取行，
+   客户端内存只和块大小有关，第一块数据到达后即可处理
+
+用法：
+    from mysql_pool import MySQLPool
+    pool = MySQLPool(db_config)
+    df = pool.read_sql("select * from HK_IOS_RANK limit 10")
+    pool.report()
+"""
+
+import collections
+import csv
+import logging
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+import pymysql.cursors
+
+logger = logging.getLogger('MySQLPool')
+
+# 每条查询记录保留的 SQL 长度和最多保留的记录数
+SQL_PREVIEW_LENGTH = 80
+HISTORY_SIZE = 1000
+
+# 流式读取时每块的行数
+DEFAULT_CHUNK_ROWS = 50000
+
+QueryRecord = collections.namedtuple('QueryRecord', ['sql', 'seconds', 'rows', 'ok'])
+
+
+class MySQLPool:
+    """线程安全的 MySQL 连接池"""
+
+    def __init__(self, config, max_size=4, ping_after=5, max_idle=600, keepalive_interval=60):
+        """
+        config: 传给 pymysql.connect 的参数
+        max_size: 最大连接数
+        ping_after: 空闲超过该秒数的连接在借出前先 ping
+        max_idle: 空闲超过该秒数的连接直接关闭重建
+        keepalive_interval: 后台保活 ping 的间隔秒数，0 表示不启动保活线程
+        """
+        self.config = dict(config)
+        self.max_size = max_size
+        self.ping_after = ping_after
+        self.max_idle = max_idle
+        self.keepalive_interval = keepalive_interval
+
+        # 后进先出：优先复用最近用过的连接，多余的连接自然空闲到过期
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._keepalive_thread = None
+
+        self.stats = {'connections_created': 0, 'connections_dropped': 0, 'borrows': 0,
+                      'pings': 0, 'queries': 0, 'errors': 0, 'rows': 0, 'seconds': 0.0}
+        self.history = collections.deque(maxlen=HISTORY_SIZE)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _connect(self):
+        """新建连接并开启 TCP keepalive"""
+        conn = pymysql.connect(**self.config)
+        sock = getattr(conn, '_sock', None)
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._count('connections_created')
+        logger.info(f"新建 MySQL 连接: {self.config.get('host')}:{self.config.get('port')}")
+        self._start_keepalive()
+        return conn
+
+    def _discard(self, conn):
+        self._count('connections_dropped')
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _ping(self, conn):
+        """ping 连接，失效返回 False"""
+        self._count('pings')
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"MySQL 连接已失效: {e}")
+            return False
+
+    def acquire(self, timeout=None):
+        """借出一个可用连接；连接数已满时等待归还"""
+        if self._closed:
+            raise RuntimeError('连接池已关闭')
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError('等待 MySQL 连接超时')
+        try:
+            self._count('borrows')
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                idle = time.monotonic() - last_used
+                if idle > self.max_idle:
+                    self._discard(conn)
+                    continue
+                if idle > self.ping_after and not self._ping(conn):
+                    self._discard(conn)
+                    continue
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """归还连接（先 rollback 结束事务，下次借出时读到最新数据）；broken=True 时关闭而不放回池中"""
+        try:
+            if not broken and not self._closed:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning(f"归还连接时 rollback 失败，丢弃连接: {e}")
+                    broken = True
+            if broken or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ...；出错时连接不放回池中"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def _record(self, sql, seconds, rows, ok):
+        with self._lock:
+            self.stats['queries'] += 1
+            self.stats['seconds'] += seconds
+            self.stats['rows'] += rows
+            if not ok:
+                self.stats['errors'] += 1
+        self.history.append(QueryRecord(' '.join(sql.split())[:SQL_PREVIEW_LENGTH], seconds, rows, ok))
+
+    def query(self, sql, args=None):
+        """执行查询，返回 (列名列表, 行元组列表)，并记录耗时和行数"""
+        started = time.perf_counter()
+        rows, ok = [], False
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, args)
+                    rows = cursor.fetchall()
+                    columns = [column[0] for column in cursor.description or []]
+            ok = True
+            return columns, list(rows)
+        finally:
+            self._record(sql, time.perf_counter() - started, len(rows), ok)
+
+    def read_sql(self, sql, params=None):
+        """执行查询并返回 DataFrame（DECIMAL 转为 float，与 pd.read_sql 一致）"""
+        import pandas as pd
+        columns, rows = self.query(sql, params)
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+    def iter_rows(self, sql, args=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        用服务端游标流式执行查询，按块产出 (列名列表, 行元组列表)
+        读取期间连接被占用；中途停止迭代时该连接直接关闭（不读完剩余结果），不放回池中
+        """
+        started = time.perf_counter()
+        total, finished = 0, False
+        conn = self.acquire()
+        try:
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+            cursor.execute(sql, args)
+            columns = [column[0] for column in cursor.description or []]
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                total += len(rows)
+                yield columns, list(rows)
+            cursor.close()
+            finished = True
+        finally:
+            self.release(conn, broken=not finished)
+            self._record(sql, time.perf_counter() - started, total, finished)
+
+    def iter_chunks(self, sql, args=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """流式执行查询，按块产出 DataFrame"""
+        import pandas as pd
+        for columns, rows in self.iter_rows(sql, args, chunk_rows):
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+    def to_csv(self, sql, file_path, args=None, chunk_rows=DEFAULT_CHUNK_ROWS, encoding='utf-8-sig'):
+        """把查询结果流式写入 CSV 文件，返回写入的行数"""
+        total = 0
+        with open(file_path, 'w', encoding=encoding, newline='') as f:
+            writer = csv.writer(f)
+            for columns, rows in self.iter_rows(sql, args, chunk_rows):
+                if total == 0:
+                    writer.writerow(columns)
+                writer.writerows(rows)
+                total += len(rows)
+        return total
+
+    def keepalive(self):
+        """
+        ping 空闲连接，失效的关闭；返回保留下来的连接数
+        每拿出一个空闲连接先占一个连接数，ping 期间借用方不会因为池里暂时没有空闲连接而多建连接
+        """
+        held = []
+        while self._slots.acquire(blocking=False):
+            try:
+                held.append(self._idle.get_nowait())
+            except queue.Empty:
+                self._slots.release()
+                break
+        alive = []
+        try:
+            for conn, last_used in held:
+                if time.monotonic() - last_used > self.max_idle or not self._ping(conn):
+                    self._discard(conn)
+                else:
+                    alive.append((conn, time.monotonic()))
+        finally:
+            # 按原顺序放回，最近使用的在栈顶
+            for item in reversed(alive):
+                self._idle.put(item)
+            for _ in held:
+                self._slots.release()
+        return len(alive)
+
+    def _start_keepalive(self):
+        if not self.keepalive_interval or self._keepalive_thread is not None:
+            return
+        with self._lock:
+            if self._keepalive_thread is not None:
+                return
+
+            def run():
+                while not self._closed:
+                    time.sleep(self.keepalive_interval)
+                    if not self._closed:
+                        self.keepalive()
+
+            self._keepalive_thread = threading.Thread(target=run, name='MySQLPoolKeepalive', daemon=True)
+            self._keepalive_thread.start()
+
+    def report(self, slowest=5):
+        """输出查询统计：连接复用情况、总耗时、最慢的几条查询"""
+        stats = dict(self.stats)
+        average = stats['seconds'] / stats['queries'] * 1000 if stats['queries'] else 0
+        print(f"查询 {stats['queries']} 次（失败 {stats['errors']}），共 {stats['rows']} 行，"
+              f"总耗时 {stats['seconds']:.2f}s，平均 {average:.0f}ms")
+        print(f"借出连接 {stats['borrows']} 次，新建 {stats['connections_created']} 个，"
+              f"丢弃 {stats['connections_dropped']} 个，ping {stats['pings']} 次")
+        for record in sorted(self.history, key=lambda r: r.seconds, reverse=True)[:slowest]:
+            print(f"  {record.seconds * 1000:.0f}ms {record.rows} 行 {record.sql}")
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接，之后不能再借出"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
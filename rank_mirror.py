@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+榜单数据本地镜像
+把远程 MySQL 中的榜单表（HK_IOS_RANK 等，show tables 中名称含 RANK 的表）增量复制到本地 SQLite，
+榜单趋势类查询在本地完成，不再远程全表扫描
+
+说明：
+1. 水位：每张表记录已同步到的最大 date，保存在 mirror_watermarks 表
+2. 每次从水位当天开始拉取（当天可能只同步了一部分）：先删除本地该日数据，再写入拉到的数据，
+   日常刷新只传输新的一天
+3. 远程数据用服务端游标流式读取（MySQLPool.iter_rows），分批写入，内存占用与表大小无关
+4. 本地表按远程表结构创建，并建立 (date, rank) 和 (app, date) 索引
+5. 本地数据库为 db_config.json 中的 rank_mirror
+
+用法：
+    python rank_mirror.py                       # 同步所有榜单表
+    python rank_mirror.py --tables HK_IOS_RANK  # 只同步指定表
+    python rank_mirror.py --full                # 忽略水位，全量重建
+"""
+
+import argparse
+import datetime
+import decimal
+import re
+import time
+
+from db_connection import get_connection
+
+MIRROR_DB = 'rank_mirror'
+
+# 榜单表名规则和列名
+RANK_TABLE_RE = re.compile(r'rank', re.IGNORECASE)
+DATE_COLUMN = 'date'
+RANK_COLUMN = 'rank'
+# 应用列在不同表中的可能名称，取第一个存在的
+APP_COLUMN_CANDIDATES = ['app', 'app_id', 'app_name', 'name']
+
+CHUNK_ROWS = 50000
+
+
+def _sqlite_type(mysql_type):
+    """MySQL 列类型对应的 SQLite 类型"""
+    mysql_type = mysql_type.lower()
+    if 'int' in mysql_type:
+        return 'INTEGER'
+    if any(name in mysql_type for name in ('float', 'double', 'decimal', 'numeric', 'real')):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _convert_value(value):
+    """转换成 SQLite 可存储的值：日期转 ISO 字符串，DECIMAL 转 float"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def list_rank_tables(pool):
+    """远程库中的榜单表"""
+    _, rows = pool.query("show tables")
+    return [row[0] for row in rows if RANK_TABLE_RE.search(row[0])]
+
+
+def remote_columns(pool, table):
+    """远程表的 [(列名, MySQL 类型), ...]"""
+    _, rows = pool.query(f"SHOW COLUMNS FROM `{table}`")
+    return [(row[0], row[1]) for row in rows]
+
+
+def create_watermark_table(conn):
+    """创建水位表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS mirror_watermarks (
+        table_name TEXT PRIMARY KEY,
+        last_date TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+def get_watermark(conn, table):
+    """读取表的水位（最后同步到的 date），没有时返回 None"""
+    row = conn.execute("SELECT last_date FROM mirror_watermarks WHERE table_name = ?", (table,)).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(conn, table, last_date):
+    """更新水位，同时记录本地行数"""
+    row_count = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    conn.execute('''
+    INSERT INTO mirror_watermarks (table_name, last_date, row_count, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(table_name) DO UPDATE SET
+        last_date = excluded.last_date,
+        row_count = excluded.row_count,
+        updated_at = CURRENT_TIMESTAMP
+    ''', (table, last_date, row_count))
+    conn.commit()
+    return row_count
+
+
+def create_mirror_table(conn, table, columns, rebuild=False):
+    """按远程表结构创建本地表和索引"""
+    if rebuild:
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+    definition = ', '.join(f'"{name}" {_sqlite_type(column_type)}' for name, column_type in columns)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({definition})')
+
+    names = [name for name, _ in columns]
+    app_column = next((name for name in APP_COLUMN_CANDIDATES if name in names), None)
+    if DATE_COLUMN in names and RANK_COLUMN in names:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_date_rank" '
+                     f'ON "{table}" ("{DATE_COLUMN}", "{RANK_COLUMN}")')
+    if app_column and DATE_COLUMN in names:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_{app_column}_date" '
+                     f'ON "{table}" ("{app_column}", "{DATE_COLUMN}")')
+    conn.commit()
+
+
+def mirror_table(pool, conn, table, full=False, chunk_rows=CHUNK_ROWS):
+    """同步一张表，返回本次写入的行数"""
+    started = time.perf_counter()
+    columns = remote_columns(pool, table)
+    names = [name for name, _ in columns]
+    if DATE_COLUMN not in names:
+        print(f"跳过 {table}：没有 {DATE_COLUMN} 列")
+        return 0
+
+    create_mirror_table(conn, table, columns, rebuild=full)
+    last_date = None if full else get_watermark(conn, table)
+
+    select_columns = ', '.join(f'`{name}`' for name in names)
+    sql = f"SELECT {select_columns} FROM `{table}`"
+    args = None
+    if last_date:
+        sql += f" WHERE `{DATE_COLUMN}` >= %s"
+        args = (last_date,)
+
+    insert_sql = (f'INSERT INTO "{table}" ({", ".join(chr(34) + name + chr(34) for name in names)}) '
+                  f'VALUES ({", ".join("?" * len(names))})')
+    date_index = names.index(DATE_COLUMN)
+    written, max_date = 0, last_date
+    try:
+        conn.execute("BEGIN")
+        if last_date:
+            # 水位当天的数据可能不完整，整天替换
+            conn.execute(f'DELETE FROM "{table}" WHERE "{DATE_COLUMN}" >= ?', (last_date,))
+        for _, rows in pool.iter_rows(sql, args, chunk_rows):
+            rows = [tuple(_convert_value(value) for value in row) for row in rows]
+            conn.executemany(insert_sql, rows)
+            written += len(rows)
+            chunk_max = max((row[date_index] for row in rows if row[date_index] is not None), default=None)
+            if chunk_max is not None and (max_date is None or chunk_max > max_date):
+                max_date = chunk_max
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    if max_date is not None:
+        row_count = set_watermark(conn, table, str(max_date)[:10])
+    else:
+        row_count = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    print(f"{table}: 从 {last_date or '最早'} 开始写入 {written} 行，本地共 {row_count} 行，"
+          f"水位 {max_date}，耗时 {time.perf_counter() - started:.1f}s")
+    return written
+
+
+def mirror_tables(pool, tables=None, full=False, chunk_rows=CHUNK_ROWS):
+    """同步多张表（默认所有榜单表），返回 {表名: 写入行数}"""
+    conn = get_connection(MIRROR_DB, 'write')
+    create_watermark_table(conn)
+    tables = tables or list_rank_tables(pool)
+    results = {}
+    for table in tables:
+        try:
+            results[table] = mirror_table(pool, conn, table, full, chunk_rows)
+        except Exception as e:
+            print(f"{table} 同步失败: {e}")
+    return results
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='把远程榜单表增量同步到本地 SQLite')
+    parser.add_argument('--tables', nargs='*', help='要同步的表，默认所有名称含 RANK 的表')
+    parser.add_argument('--full', action='store_true', help='忽略水位，重建本地表后全量同步')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help=f'每批读取行数（默认 {CHUNK_ROWS}）')
+    args = parser.parse_args(argv)
+
+    from 榜单数据 import pool
+    mirror_tables(pool, args.tables, args.full, args.chunk_rows)
+    pool.report()
+
+if __name__ == "__main__":
+    main()
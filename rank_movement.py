@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+榜单排名变动分析
+对排序后的榜单历史做一次向量化计算，得到每个应用每天的排名变化、新上榜、掉榜、连续在榜天数和历史最佳排名
+
+说明：
+1. "前一天"指同一地区的上一个榜单日期（缺失的日期不算断档）
+2. delta = 前一天排名 - 当天排名，正数表示上升；前一天不在榜时为空
+3. new_entry：前一天不在榜（含首次上榜和重新上榜）
+4. streak：截至当天连续在榜的榜单日期数
+5. best_rank：截至当天的历史最佳（最小）排名
+6. 掉榜：前一天在榜、当天不在榜，单独返回一张表（日期为掉榜当天，last_rank 为掉榜前的排名）
+7. 同一应用同一天出现多次时只保留最好的排名
+
+用法：
+    python rank_movement.py                                # 所有镜像榜单表，最新一天
+    python rank_movement.py --tables HK_IOS_RANK --date 2026-01-14 --top 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from db_connection import get_connection
+from rank_mirror import APP_COLUMN_CANDIDATES, DATE_COLUMN, MIRROR_DB, RANK_COLUMN
+
+REGION_COLUMN = 'region'
+
+
+def compute_movement(history, app=None, date=DATE_COLUMN, rank=RANK_COLUMN, region=REGION_COLUMN):
+    """
+    计算排名变动
+    history: 至少包含应用、日期、排名列的 DataFrame；region 列不存在时视为同一地区
+    返回 (movement, dropouts)：
+      movement 每行一个 (region, app, date)，含 rank、prev_rank、delta、new_entry、streak、best_rank
+      dropouts 每行一次掉榜，含 region、app、date、last_rank
+    """
+    if app is None:
+        app = next(name for name in APP_COLUMN_CANDIDATES if name in history.columns)
+    regions = history[region].to_numpy() if region in history.columns else np.zeros(len(history), dtype=np.int8)
+    data = pd.DataFrame({
+        REGION_COLUMN: regions,
+        'app': history[app].to_numpy(),
+        'date': history[date].astype(str).to_numpy(),
+        'rank': pd.to_numeric(history[rank], errors='coerce').to_numpy(dtype=np.float64),
+    }).dropna(subset=['rank'])
+
+    # 编码：地区、应用，以及地区内的榜单日期序号
+    region_codes, region_values = pd.factorize(data[REGION_COLUMN], sort=True)
+    app_codes, app_values = pd.factorize(data['app'], sort=True)
+    region_dates = data[[REGION_COLUMN, 'date']].drop_duplicates().sort_values([REGION_COLUMN, 'date'])
+    region_dates['day'] = region_dates.groupby(REGION_COLUMN, sort=False).cumcount()
+    day = (data[[REGION_COLUMN, 'date']].merge(region_dates, on=[REGION_COLUMN, 'date'], how='left')['day']
+           .to_numpy(dtype=np.int64))
+
+    # 按 (地区, 应用, 日期, 排名) 排序，同一天重复的只保留第一条（最好的排名）
+    rank_values = data['rank'].to_numpy()
+    order = np.lexsort((rank_values, day, app_codes, region_codes))
+    region_codes, app_codes, day, rank_values = (region_codes[order], app_codes[order],
+                                                 day[order], rank_values[order])
+    n = len(order)
+    same_group = np.zeros(n, dtype=bool)
+    same_group[1:] = (region_codes[1:] == region_codes[:-1]) & (app_codes[1:] == app_codes[:-1])
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = ~(same_group[1:] & (day[1:] == day[:-1]))
+    region_codes, app_codes, day, rank_values = (region_codes[keep], app_codes[keep],
+                                                 day[keep], rank_values[keep])
+    n = len(day)
+
+    # 与前一行是同一 (地区, 应用) 且榜单日期相邻，即前一天在榜
+    same_group = np.zeros(n, dtype=bool)
+    same_group[1:] = (region_codes[1:] == region_codes[:-1]) & (app_codes[1:] == app_codes[:-1])
+    consecutive = np.zeros(n, dtype=bool)
+    consecutive[1:] = same_group[1:] & (day[1:] - day[:-1] == 1)
+
+    prev_rank = np.full(n, np.nan)
+    prev_rank[1:] = rank_values[:-1]
+    prev_rank[~consecutive] = np.nan
+    delta = prev_rank - rank_values
+
+    # 连续在榜天数：每段连续的起点处重新计数
+    positions = np.arange(n)
+    run_start = np.maximum.accumulate(np.where(consecutive, 0, positions))
+    streak = positions - run_start + 1
+
+    # 历史最佳排名：组号放在高位，一次 maximum.accumulate 完成分组累计最小值
+    group_id = np.cumsum(~same_group)
+    scale = np.nanmax(rank_values) + 1 if n else 1
+    encoded = group_id * scale + (scale - rank_values)
+    best_rank = scale - (np.maximum.accumulate(encoded) - group_id * scale)
+
+    date_lookup = region_dates.set_index([REGION_COLUMN, 'day'])['date']
+    region_labels = region_values[region_codes]
+    dates = date_lookup.reindex(pd.MultiIndex.from_arrays([region_labels, day])).to_numpy()
+
+    movement = pd.DataFrame({
+        REGION_COLUMN: region_labels,
+        'app': app_values[app_codes],
+        'date': dates,
+        'rank': rank_values,
+        'prev_rank': prev_rank,
+        'delta': delta,
+        'new_entry': ~consecutive,
+        'streak': streak,
+        'best_rank': best_rank,
+    })
+
+    # 掉榜：本行之后同组没有紧接着的下一天，而该地区还有下一天的榜单
+    next_consecutive = np.zeros(n, dtype=bool)
+    next_consecutive[:-1] = consecutive[1:]
+    last_day = region_dates.groupby(REGION_COLUMN)['day'].max()
+    region_last_day = last_day.reindex(region_labels).to_numpy()
+    dropped = ~next_consecutive & (day < region_last_day)
+    dropouts = pd.DataFrame({
+        REGION_COLUMN: region_labels[dropped],
+        'app': app_values[app_codes[dropped]],
+        'date': date_lookup.reindex(pd.MultiIndex.from_arrays([region_labels[dropped], day[dropped] + 1])).to_numpy(),
+        'last_rank': rank_values[dropped],
+    })
+    return movement, dropouts
+
+
+def load_history(tables=None):
+    """从本地镜像（见 rank_mirror.py）读取榜单历史，region 列为表名"""
+    conn = get_connection(MIRROR_DB, 'read')
+    if not tables:
+        tables = [row[0] for row in conn.execute(
+            "SELECT table_name FROM mirror_watermarks ORDER BY table_name").fetchall()]
+    frames = []
+    for table in tables:
+        frame = pd.read_sql_query(f'SELECT * FROM "{table}"', conn)
+        frame[REGION_COLUMN] = table
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def print_day(movement, dropouts, date=None, top=10):
+    """输出某一天（默认最新一天）的上升、下降、新上榜和掉榜"""
+    date = date or movement['date'].max()
+    day = movement[movement['date'] == date]
+    print(f"=== {date} ===")
+    for region, rows in day.groupby(REGION_COLUMN, sort=True):
+        print(f"[{region}] 在榜 {len(rows)} 个，新上榜 {int(rows['new_entry'].sum())} 个")
+        print("  上升最多：")
+        for row in rows.nlargest(top, 'delta').itertuples():
+            print(f"    {row.app}: {row.prev_rank:.0f} -> {row.rank:.0f}（+{row.delta:.0f}），"
+                  f"连续 {row.streak} 天，最佳 {row.best_rank:.0f}")
+        print("  下降最多：")
+        for row in rows.nsmallest(top, 'delta').itertuples():
+            print(f"    {row.app}: {row.prev_rank:.0f} -> {row.rank:.0f}（{row.delta:.0f}）")
+        print("  新上榜：")
+        for row in rows[rows['new_entry']].nsmallest(top, 'rank').itertuples():
+            print(f"    {row.app}: {row.rank:.0f}，历史最佳 {row.best_rank:.0f}")
+        dropped = dropouts[(dropouts[REGION_COLUMN] == region) & (dropouts['date'] == date)]
+        print(f"  掉榜 {len(dropped)} 个：")
+        for row in dropped.nsmallest(top, 'last_rank').itertuples():
+            print(f"    {row.app}: 掉榜前排名 {row.last_rank:.0f}")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='计算榜单排名变动（基于本地镜像）')
+    parser.add_argument('--tables', nargs='*', help='榜单表，默认所有已镜像的表')
+    parser.add_argument('--date', help='输出的日期，默认最新一天')
+    parser.add_argument('--top', type=int, default=10, help='每类输出的条数')
+    parser.add_argument('--out', help='把完整的变动结果保存为 CSV')
+    args = parser.parse_args(argv)
+
+    history = load_history(args.tables)
+    if history.empty:
+        print("本地没有榜单数据，请先运行 rank_mirror.py")
+        return
+    started = time.perf_counter()
+    movement, dropouts = compute_movement(history)
+    print(f"共 {len(movement)} 条在榜记录、{len(dropouts)} 次掉榜，计算耗时 {time.perf_counter() - started:.2f}s")
+    print_day(movement, dropouts, args.date, args.top)
+    if args.out:
+        movement.to_csv(args.out, index=False, encoding='utf-8-sig')
+        print(f"已保存: {args.out}")
+
+if __name__ == "__main__":
+    main()
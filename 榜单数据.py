@@ -1,17 +1,11 @@
-import requests
-import pandas as pd
-from datetime import date, timedelta
-import os
-# import schedule
 import time
-import dataframe_image as dfi
-import base64
-import json
-# from requests_toolbelt import MultipartEncoder
-pd.options.display.float_format = '{:.0f}'.format
-import pymysql
-# from sqlalchemy import create_engine
 import warnings
+
+import pandas as pd
+
+from mysql_pool import MySQLPool
+
+pd.options.display.float_format = '{:.0f}'.format
 warnings.filterwarnings('ignore')
 db_config = {
     'host': 'gz-cdb-d488s76r.sql.tencentcdb.com',  # 外网地址
@@ -22,27 +16,45 @@ db_config = {
     'charset': 'utf8mb4',
     'connect_timeout': 10
 }
+# 连接池：多次查询复用连接，创建时不会连接数据库，第一次查询时才建立连接
+pool = MySQLPool(db_config)
 def get_sqldata(sql):
     """
     执行SQL查询并返回DataFrame
     :param sql: SQL查询语句
     :return: pandas DataFrame
     """
-    conn = None
     try:
-        # 创建连接
-        conn = pymysql.connect(**db_config)
-        # 使用pandas直接读取SQL查询结果
-        df = pd.read_sql(sql, conn)
-        print(f"成功查询到 {len(df)} 条数据")
+        # 从连接池借用连接执行查询，用完自动归还
+        started = time.perf_counter()
+        df = pool.read_sql(sql)
+        print(f"成功查询到 {len(df)} 条数据，耗时 {(time.perf_counter() - started) * 1000:.0f}ms")
         return df
     except Exception as e:
         # 这里处理报错，打印错误信息
         print(f"查询出错: {e}")
         return None
-    finally:
-        # 无论成功还是失败，最后都要关闭数据库连接，防止连接泄露
-        if conn:
-            conn.close()
-get_sqldata("""show tables""")
-get_sqldata("""select * from HK_IOS_RANK order by date desc""")
\ No newline at end of file
+def iter_sqldata(sql, chunk_rows=50000):
+    """
+    流式执行SQL查询，按块返回DataFrame（服务端游标，客户端内存只和块大小有关）
+    :param sql: SQL查询语句
+    :param chunk_rows: 每块行数
+    :return: DataFrame 迭代器
+    """
+    return pool.iter_chunks(sql, chunk_rows=chunk_rows)
+def save_sqldata(sql, file_path, chunk_rows=50000):
+    """
+    流式执行SQL查询并直接写入CSV文件
+    :param sql: SQL查询语句
+    :param file_path: 输出文件路径
+    :return: 写入的行数
+    """
+    started = time.perf_counter()
+    total = pool.to_csv(sql, file_path, chunk_rows=chunk_rows)
+    print(f"已写入 {total} 条数据到 {file_path}，耗时 {time.perf_counter() - started:.1f}s")
+    return total
+if __name__ == "__main__":
+    get_sqldata("""show tables""")
+    # 全量榜单历史较大，流式写入本地文件，不在内存中整体缓存
+    save_sqldata("""select * from HK_IOS_RANK order by date desc""", 'HK_IOS_RANK.csv')
+    pool.report()